@@ -5,9 +5,11 @@ from .models import Skill, Concept
 class ConceptInline(admin.TabularInline):
     model = Concept
     extra = 1
+    prepopulated_fields = {'slug': ('name',)}
 
 class SkillAdmin(MPTTModelAdmin):
     list_display = ('name', 'parent')
+    prepopulated_fields = {'slug': ('name',)}
     inlines = [ConceptInline]
 
 admin.site.register(Skill, SkillAdmin)
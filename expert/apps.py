@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ExpertConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'expert'
+
+    def ready(self):
+        # On importe les signaux ici pour les connecter.
+        import expert.signals
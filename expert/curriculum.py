@@ -0,0 +1,215 @@
+import threading
+import time
+from array import array
+
+from django.core.cache import cache
+
+CURRICULUM_VERSION_KEY = 'expert:curriculum_version'
+
+def get_curriculum_version():
+    """
+    Numéro de version du programme (arbre des Skill et Concepts).
+    Tout ce qui est dérivé du programme et mis en cache doit être indexé par ce numéro.
+    """
+    version = cache.get(CURRICULUM_VERSION_KEY)
+    if version is None:
+        # Valeur initiale jamais réutilisée : si la clé est évincée du cache, les
+        # données indexées par une ancienne version restent invalides
+        cache.add(CURRICULUM_VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(CURRICULUM_VERSION_KEY)
+    return version
+
+def bump_curriculum_version():
+    """
+    Invalide d'un coup toutes les données dérivées du programme.
+    """
+    try:
+        return cache.incr(CURRICULUM_VERSION_KEY)
+    except ValueError:
+        # Clé absente (cache vidé ou jamais initialisé)
+        return get_curriculum_version()
+
+
+class CurriculumSnapshot:
+    """
+    Copie immuable, en mémoire, de l'arbre des compétences et de ses concepts.
+
+    Les Skill sont rangés en ordre préfixe (celui de MPTT : tree_id puis lft) et
+    les concepts dans l'ordre d'enseignement. Tout est stocké dans des tableaux
+    compacts indexés par position : le sous-arbre d'un Skill occupe une plage
+    contiguë de positions, et ses concepts aussi. On parcourt donc l'arbre,
+    trouve les frères d'un nœud ou calcule la complétion d'un sous-arbre sans
+    aucune requête SQL.
+
+    Le programme n'a pas de prérequis explicites : l'ordre de l'arbre en tient
+    lieu, le prérequis d'un concept est celui qui le précède dans son arbre.
+    """
+    def __init__(self, version, skill_rows, concept_rows):
+        """
+        skill_rows : (id, parent_id, name) en ordre préfixe ;
+        concept_rows : (id, skill_id, name) dans l'ordre d'enseignement.
+        """
+        self.version = version
+        self.skill_ids = array('q', (row[0] for row in skill_rows))
+        self.skill_names = tuple(row[2] for row in skill_rows)
+        self._skill_index = {skill_id: index for index, skill_id in enumerate(self.skill_ids)}
+        self.skill_parent = array('q', (
+            self._skill_index[row[1]] if row[1] is not None else -1 for row in skill_rows
+        ))
+
+        # Fin (exclue) du sous-arbre de chaque Skill, calculée en un passage
+        count = len(skill_rows)
+        self.skill_subtree_end = array('q', [count] * count)
+        stack = []
+        for index in range(count):
+            while stack and stack[-1] != self.skill_parent[index]:
+                self.skill_subtree_end[stack.pop()] = index
+            stack.append(index)
+
+        self.concept_ids = array('q', (row[0] for row in concept_rows))
+        self.concept_names = tuple(row[2] for row in concept_rows)
+        self._concept_index = {concept_id: index for index, concept_id in enumerate(self.concept_ids)}
+        self.concept_skill = array('q', (self._skill_index[row[1]] for row in concept_rows))
+
+        # Premier concept de chaque Skill (un élément de plus pour la fin)
+        self.skill_concept_start = array('q', [0] * (count + 1))
+        position = 0
+        for index in range(count + 1):
+            while position < len(self.concept_skill) and self.concept_skill[position] < index:
+                position += 1
+            self.skill_concept_start[index] = position
+
+        # Prérequis : concept précédent dans le même arbre racine (-1 si aucun)
+        self.concept_prerequisite = array('q', (
+            index - 1 if index > 0 and self._root(self.concept_skill[index - 1]) == self._root(skill)
+            else -1
+            for index, skill in enumerate(self.concept_skill)
+        ))
+
+    def _root(self, skill_index):
+        while self.skill_parent[skill_index] != -1:
+            skill_index = self.skill_parent[skill_index]
+        return skill_index
+
+    def __len__(self):
+        return len(self.concept_ids)
+
+    # --- Compétences ---
+
+    def parent(self, skill_id):
+        parent_index = self.skill_parent[self._skill_index[skill_id]]
+        return self.skill_ids[parent_index] if parent_index != -1 else None
+
+    def ancestors(self, skill_id):
+        """
+        Ancêtres du Skill, du parent jusqu'à la racine.
+        """
+        result = []
+        index = self.skill_parent[self._skill_index[skill_id]]
+        while index != -1:
+            result.append(self.skill_ids[index])
+            index = self.skill_parent[index]
+        return result
+
+    def children(self, skill_id):
+        index = self._skill_index[skill_id]
+        child, end = index + 1, self.skill_subtree_end[index]
+        result = []
+        while child < end:
+            result.append(self.skill_ids[child])
+            child = self.skill_subtree_end[child]
+        return result
+
+    def siblings(self, skill_id):
+        """
+        Autres Skill ayant le même parent (les autres racines pour une racine).
+        """
+        parent_id = self.parent(skill_id)
+        if parent_id is None:
+            candidates = [self.skill_ids[index] for index, parent in enumerate(self.skill_parent) if parent == -1]
+        else:
+            candidates = self.children(parent_id)
+        return [candidate for candidate in candidates if candidate != skill_id]
+
+    def subtree_skill_ids(self, skill_id):
+        index = self._skill_index[skill_id]
+        return list(self.skill_ids[index:self.skill_subtree_end[index]])
+
+    # --- Concepts ---
+
+    def skill_of(self, concept_id):
+        return self.skill_ids[self.concept_skill[self._concept_index[concept_id]]]
+
+    def concept_position(self, concept_id):
+        """
+        Rang du concept dans l'ordre d'enseignement, ou None s'il n'existe pas.
+        """
+        return self._concept_index.get(concept_id)
+
+    def prerequisite(self, concept_id):
+        index = self.concept_prerequisite[self._concept_index[concept_id]]
+        return self.concept_ids[index] if index != -1 else None
+
+    def next_concept_id(self, concept_id):
+        index = self._concept_index[concept_id] + 1
+        return self.concept_ids[index] if index < len(self.concept_ids) else None
+
+    def first_unseen_concept_id(self, seen_concept_ids):
+        """
+        Premier concept, dans l'ordre de l'arbre, absent de `seen_concept_ids`.
+        """
+        for concept_id in self.concept_ids:
+            if concept_id not in seen_concept_ids:
+                return concept_id
+        return None
+
+    def subtree_concept_ids(self, skill_id):
+        index = self._skill_index[skill_id]
+        start = self.skill_concept_start[index]
+        end = self.skill_concept_start[self.skill_subtree_end[index]]
+        return self.concept_ids[start:end]
+
+    def subtree_completion(self, skill_id, mastered_concept_ids):
+        """
+        Part (0.0 à 1.0) des concepts du sous-arbre présents dans `mastered_concept_ids`.
+        """
+        concept_ids = self.subtree_concept_ids(skill_id)
+        if not concept_ids:
+            return 1.0
+        mastered = sum(1 for concept_id in concept_ids if concept_id in mastered_concept_ids)
+        return mastered / len(concept_ids)
+
+    @classmethod
+    def build(cls):
+        from .models import Concept, Skill
+
+        # Version lue avant les données : une modification concurrente
+        # provoquera une reconstruction au prochain accès.
+        version = get_curriculum_version()
+        skill_rows = list(Skill.objects.order_by('tree_id', 'lft').values_list('id', 'parent_id', 'name'))
+        concept_rows = list(
+            Concept.objects.order_by('skill__tree_id', 'skill__lft', 'id').values_list('id', 'skill_id', 'name')
+        )
+        return cls(version, skill_rows, concept_rows)
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+def get_curriculum_snapshot():
+    """
+    Retourne l'instantané du programme, construit à la première utilisation puis
+    reconstruit dès que la version du programme change.
+    """
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != get_curriculum_version():
+        with _snapshot_lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot.version != get_curriculum_version():
+                snapshot = _snapshot = CurriculumSnapshot.build()
+    return snapshot
+
+def invalidate_curriculum_snapshot():
+    global _snapshot
+    _snapshot = None
@@ -0,0 +1,236 @@
+"""
+Import / export du programme au format JSON Lines (ou YAML, si PyYAML est installé).
+
+Chaque enregistrement décrit un Skill ou un Concept, identifié par un slug stable :
+
+    {"type": "skill", "slug": "python-bases", "name": "Python - Les Bases", "description": "...", "parent": null}
+    {"type": "concept", "slug": "assignation", "skill": "python-bases", "name": "...", "explanation": "..."}
+
+L'import lit le fichier en flux, calcule tout l'arbre MPTT (lft, rght, level, tree_id)
+en mémoire en un passage et écrit avec bulk_create / bulk_update : MPTT ne
+rééquilibre plus l'arbre à chaque insertion. Les slugs déjà en base sont mis à jour.
+
+Le fichier est validé avant toute écriture (champs obligatoires, noms de Skill
+uniques) : une erreur lève CurriculumFormatError et rien n'est importé.
+"""
+import json
+
+from django.db import transaction
+
+from .curriculum import bump_curriculum_version
+
+BATCH_SIZE = 1000
+
+SKILL_TREE_FIELDS = ('tree_id', 'lft', 'rght', 'level')
+
+
+class CurriculumFormatError(ValueError):
+    pass
+
+
+def compute_tree_fields(skills):
+    """
+    Calcule les champs MPTT de tout un arbre en un parcours en profondeur.
+
+    `skills` : {clé: (clé du parent ou None, nom)}. Les frères sont triés par nom,
+    comme le fait `order_insertion_by = ['name']` ; les racines aussi.
+    Retourne {clé: (tree_id, lft, rght, level)}.
+    """
+    children = {}
+    for key, (parent_key, name) in skills.items():
+        if parent_key is not None and parent_key not in skills:
+            raise CurriculumFormatError(f"Unknown parent skill {parent_key!r} for {key!r}")
+        children.setdefault(parent_key, []).append((name, key))
+    for siblings in children.values():
+        siblings.sort()
+
+    fields = {}
+    for tree_id, (_, root_key) in enumerate(children.get(None, []), start=1):
+        counter = 1
+        # Pile itérative : (clé, niveau, enfants déjà visités ?)
+        stack = [(root_key, 0, False)]
+        lft = {}
+        while stack:
+            key, level, visited = stack.pop()
+            if visited:
+                fields[key] = (tree_id, lft[key], counter, level)
+                counter += 1
+                continue
+            lft[key] = counter
+            counter += 1
+            stack.append((key, level, True))
+            for _, child_key in reversed(children.get(key, [])):
+                stack.append((child_key, level + 1, False))
+
+    if len(fields) != len(skills):
+        raise CurriculumFormatError("The skill tree contains a cycle.")
+    return fields
+
+
+def iter_records(stream, format='jsonl'):
+    """
+    Lit les enregistrements un par un, sans charger tout le fichier.
+    """
+    if format == 'yaml':
+        try:
+            import yaml
+        except ImportError:
+            raise CurriculumFormatError("PyYAML is required for the YAML format (pip install pyyaml).")
+        for record in yaml.safe_load_all(stream):
+            if record is not None:
+                yield record
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise CurriculumFormatError(f"Line {line_number}: invalid JSON ({e})")
+
+
+def write_record(stream, record, format='jsonl'):
+    if format == 'yaml':
+        import yaml
+        # Une seule écriture par enregistrement (les OutputWrapper de Django ajoutent
+        # un retour à la ligne à chaque appel)
+        stream.write("---\n" + yaml.safe_dump(record, allow_unicode=True, sort_keys=False))
+    else:
+        stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def import_curriculum(records, batch_size=BATCH_SIZE):
+    """
+    Insère ou met à jour (par slug) les Skill et Concepts décrits par `records`.
+    Retourne le nombre de lignes créées et mises à jour.
+    """
+    from .models import Concept, Skill
+
+    skill_records, concept_records = {}, {}
+    for record in records:
+        kind = record.get('type')
+        if kind not in ('skill', 'concept') or not record.get('slug'):
+            raise CurriculumFormatError(f"Invalid record: {record!r}")
+        (skill_records if kind == 'skill' else concept_records)[record['slug']] = record
+
+    # 1. Fusion avec l'arbre existant (tous les Skill, pour recalculer leurs bornes)
+    existing_skills = {skill.slug: skill for skill in Skill.objects.all()}
+    slug_by_id = {skill.id: slug for slug, skill in existing_skills.items()}
+    tree = {
+        slug: (slug_by_id.get(skill.parent_id), skill.name)
+        for slug, skill in existing_skills.items()
+    }
+    for slug, record in skill_records.items():
+        current_parent, current_name = tree.get(slug, (None, None))
+        if slug not in existing_skills and not record.get('name'):
+            raise CurriculumFormatError(f"New skill {slug!r} has no name")
+        tree[slug] = (record.get('parent', current_parent), record.get('name', current_name))
+    slugs_by_name = {}
+    for slug, (_parent, name) in tree.items():
+        if not name:
+            raise CurriculumFormatError(f"Skill {slug!r} has an empty name")
+        slugs_by_name.setdefault(name, []).append(slug)
+    for name, slugs in slugs_by_name.items():
+        if len(slugs) > 1:
+            raise CurriculumFormatError(f"Skill name {name!r} is used by several skills: {sorted(slugs)}")
+    tree_fields = compute_tree_fields(tree)
+
+    stats = {'skills_created': 0, 'skills_updated': 0, 'concepts_created': 0, 'concepts_updated': 0}
+    with transaction.atomic(), Skill.objects.disable_mptt_updates():
+        # 2. Skill : création niveau par niveau, pour connaître l'id des parents
+        new_slugs = sorted(
+            (slug for slug in skill_records if slug not in existing_skills),
+            key=lambda slug: tree_fields[slug][3]
+        )
+        skills = dict(existing_skills)
+        for level in sorted({tree_fields[slug][3] for slug in new_slugs}):
+            level_slugs = [slug for slug in new_slugs if tree_fields[slug][3] == level]
+            Skill.objects.bulk_create([
+                Skill(
+                    slug=slug,
+                    name=skill_records[slug]['name'],
+                    description=skill_records[slug].get('description', ''),
+                    parent=skills[tree[slug][0]] if tree[slug][0] else None,
+                    **dict(zip(SKILL_TREE_FIELDS, tree_fields[slug])),
+                )
+                for slug in level_slugs
+            ], batch_size=batch_size)
+            # bulk_create ne renvoie pas les id sous MySQL : on les relit
+            for skill in Skill.objects.filter(slug__in=level_slugs):
+                skills[skill.slug] = skill
+            stats['skills_created'] += len(level_slugs)
+
+        # 3. Skill existants : contenu éventuel et nouvelles bornes de l'arbre
+        for slug, skill in existing_skills.items():
+            record = skill_records.get(slug)
+            if record:
+                skill.name = record.get('name', skill.name)
+                skill.description = record.get('description', skill.description)
+                parent_slug = tree[slug][0]
+                skill.parent = skills[parent_slug] if parent_slug else None
+                stats['skills_updated'] += 1
+            for field, value in zip(SKILL_TREE_FIELDS, tree_fields[slug]):
+                setattr(skill, field, value)
+        Skill.objects.bulk_update(
+            existing_skills.values(), ['name', 'description', 'parent', *SKILL_TREE_FIELDS],
+            batch_size=batch_size
+        )
+
+        # 4. Concepts
+        existing_concepts = {
+            concept.slug: concept
+            for concept in Concept.objects.filter(slug__in=concept_records.keys())
+        }
+        to_create, to_update = [], []
+        for slug, record in concept_records.items():
+            skill = skills.get(record.get('skill'))
+            if skill is None:
+                raise CurriculumFormatError(f"Unknown skill {record.get('skill')!r} for concept {slug!r}")
+            concept = existing_concepts.get(slug) or Concept(slug=slug)
+            concept.skill = skill
+            concept.name = record.get('name', concept.name)
+            concept.explanation = record.get('explanation', concept.explanation)
+            for field in ('name', 'explanation'):
+                if not getattr(concept, field):
+                    raise CurriculumFormatError(f"Concept {slug!r} has no {field}")
+            (to_update if concept.pk else to_create).append(concept)
+        Concept.objects.bulk_create(to_create, batch_size=batch_size)
+        Concept.objects.bulk_update(to_update, ['skill', 'name', 'explanation'], batch_size=batch_size)
+        stats['concepts_created'] = len(to_create)
+        stats['concepts_updated'] = len(to_update)
+
+    # Les opérations groupées n'envoient pas de signaux
+    bump_curriculum_version()
+    return stats
+
+
+def export_curriculum(stream, format='jsonl', batch_size=BATCH_SIZE):
+    """
+    Écrit tout le programme en flux : les Skill en ordre préfixe (chaque parent
+    avant ses enfants), puis les concepts dans l'ordre d'enseignement.
+    """
+    from .models import Concept, Skill
+
+    slug_by_id = {}
+    count = 0
+    skills = Skill.objects.order_by('tree_id', 'lft').values_list('id', 'parent_id', 'slug', 'name', 'description')
+    for skill_id, parent_id, slug, name, description in skills.iterator(chunk_size=batch_size):
+        slug_by_id[skill_id] = slug
+        write_record(stream, {
+            "type": "skill", "slug": slug, "name": name,
+            "description": description, "parent": slug_by_id.get(parent_id),
+        }, format)
+        count += 1
+
+    concepts = Concept.objects.order_by('skill__tree_id', 'skill__lft', 'id').values_list(
+        'skill_id', 'slug', 'name', 'explanation'
+    )
+    for skill_id, slug, name, explanation in concepts.iterator(chunk_size=batch_size):
+        write_record(stream, {
+            "type": "concept", "slug": slug, "skill": slug_by_id[skill_id],
+            "name": name, "explanation": explanation,
+        }, format)
+        count += 1
+    return count
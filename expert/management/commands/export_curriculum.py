@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from expert.curriculum_io import BATCH_SIZE, export_curriculum
+
+
+class Command(BaseCommand):
+    help = "Exporte tout le programme (Skill et Concepts) au format JSON Lines ou YAML."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Fichier de sortie ('-' pour la sortie standard).")
+        parser.add_argument('--format', choices=['jsonl', 'yaml'], default='jsonl')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            export_curriculum(self.stdout, options['format'], options['batch_size'])
+            return
+        try:
+            with open(options['path'], 'w', encoding='utf-8') as stream:
+                count = export_curriculum(stream, options['format'], options['batch_size'])
+        except OSError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"{count} enregistrements exportés vers {options['path']}."))
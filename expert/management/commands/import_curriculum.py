@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from expert.curriculum_io import BATCH_SIZE, CurriculumFormatError, import_curriculum, iter_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe un programme (Skill et Concepts) depuis un fichier JSON Lines ou YAML. "
+        "Les enregistrements dont le slug existe déjà sont mis à jour."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fichier à importer ('-' pour l'entrée standard).")
+        parser.add_argument('--format', choices=['jsonl', 'yaml'], default='jsonl')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            if options['path'] == '-':
+                stats = import_curriculum(iter_records(sys.stdin, options['format']), options['batch_size'])
+            else:
+                with open(options['path'], encoding='utf-8') as stream:
+                    stats = import_curriculum(iter_records(stream, options['format']), options['batch_size'])
+        except (OSError, CurriculumFormatError) as e:
+            raise CommandError(str(e))
+        except IntegrityError as e:
+            # Conflit avec la base (contrainte d'unicité...) : l'import a été annulé
+            raise CommandError(f"Import rejected by the database, nothing was imported: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Skills : {stats['skills_created']} créés, {stats['skills_updated']} mis à jour. "
+            f"Concepts : {stats['concepts_created']} créés, {stats['concepts_updated']} mis à jour."
+        ))
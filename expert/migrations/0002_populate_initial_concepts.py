@@ -4,30 +4,36 @@ def populate_skills_and_concepts(apps, schema_editor):
     """
     Crée l'arborescence initiale des compétences et les concepts associés.
     
-    NOTE : Nous importons les modèles directement au lieu d'utiliser apps.get_model()
-    car nous avons besoin du TreeManager de MPTT pour calculer correctement les champs
-    de l'arbre (lft, rght, etc.) lors de la création des objets Skill.
+    NOTE : On utilise les modèles historiques (apps.get_model) : les modèles réels
+    peuvent avoir des champs qui n'existent pas encore à ce stade des migrations.
+    Les champs de l'arbre MPTT (lft, rght, etc.) sont donc calculés par
+    `compute_tree_fields` au lieu du TreeManager.
     """
-    from expert.models import Skill, Concept # <-- CHANGEMENT CRUCIAL ICI
+    from expert.curriculum_io import compute_tree_fields
 
-    # Le reste du code est identique, mais il fonctionnera maintenant car nous utilisons
-    # le vrai gestionnaire de modèles qui comprend MPTT.
+    Skill = apps.get_model('expert', 'Skill')
+    Concept = apps.get_model('expert', 'Concept')
 
-    # --- NIVEAU 1 : Compétence Racine ---
-    python_basics = Skill.objects.create(name='Python - Les Bases', description='Concepts fondamentaux du langage Python.')
+    skills = {
+        # --- NIVEAU 1 : Compétence Racine ---
+        'Python - Les Bases': (None, 'Concepts fondamentaux du langage Python.'),
+        # --- NIVEAU 2 : Compétences Enfants ---
+        'Variables et Types de Données': ('Python - Les Bases', 'Apprendre à stocker et manipuler des informations.'),
+        'Opérateurs': ('Python - Les Bases', 'Effectuer des calculs et des comparaisons.'),
+    }
+    tree_fields = compute_tree_fields({name: (parent, name) for name, (parent, _) in skills.items()})
 
-    # --- NIVEAU 2 : Compétences Enfants ---
-    variables_skill = Skill.objects.create(
-        name='Variables et Types de Données',
-        parent=python_basics,
-        description='Apprendre à stocker et manipuler des informations.'
-    )
-    
-    operators_skill = Skill.objects.create(
-        name='Opérateurs',
-        parent=python_basics,
-        description='Effectuer des calculs et des comparaisons.'
-    )
+    created = {}
+    for name in sorted(skills, key=lambda name: tree_fields[name][3]): # parents d'abord
+        parent, description = skills[name]
+        tree_id, lft, rght, level = tree_fields[name]
+        created[name] = Skill.objects.create(
+            name=name, description=description, parent=created.get(parent),
+            tree_id=tree_id, lft=lft, rght=rght, level=level,
+        )
+    python_basics = created['Python - Les Bases']
+    variables_skill = created['Variables et Types de Données']
+    operators_skill = created['Opérateurs']
 
     # --- PEUPLEMENT DES CONCEPTS ---
     Concept.objects.create(
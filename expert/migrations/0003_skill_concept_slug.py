@@ -0,0 +1,53 @@
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def populate_slugs(apps, schema_editor):
+    """
+    Donne un slug unique, dérivé du nom, à chaque Skill et Concept existant.
+    """
+    for model_name in ('Skill', 'Concept'):
+        model = apps.get_model('expert', model_name)
+        max_length = model._meta.get_field('slug').max_length
+        taken = set()
+        rows = list(model.objects.order_by('id'))
+        for row in rows:
+            base = slugify(row.name)[:max_length - 4] or model_name.lower()
+            slug, suffix = base, 2
+            while slug in taken:
+                slug = f"{base}-{suffix}"
+                suffix += 1
+            taken.add(slug)
+            row.slug = slug
+        model.objects.bulk_update(rows, ['slug'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expert', '0002_populate_initial_concepts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='skill',
+            name='slug',
+            field=models.SlugField(max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='concept',
+            name='slug',
+            field=models.SlugField(max_length=255, null=True),
+        ),
+        migrations.RunPython(populate_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='skill',
+            name='slug',
+            field=models.SlugField(blank=True, help_text="Identifiant stable, utilisé pour l'import/export du programme.", max_length=200, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='concept',
+            name='slug',
+            field=models.SlugField(blank=True, help_text="Identifiant stable, utilisé pour l'import/export du programme.", max_length=255, unique=True),
+        ),
+    ]
@@ -1,18 +1,37 @@
 from django.db import models
+from django.utils.text import slugify
 from mptt.models import MPTTModel, TreeForeignKey
 
+def unique_slug(model, name):
+    """
+    Slug dérivé du nom, suffixé (-2, -3...) s'il est déjà pris.
+    """
+    max_length = model._meta.get_field('slug').max_length
+    base = slugify(name)[:max_length - 4] or model._meta.model_name
+    slug, suffix = base, 2
+    while model.objects.filter(slug=slug).exists():
+        slug = f"{base}-{suffix}"
+        suffix += 1
+    return slug
+
 class Skill(MPTTModel):
     """
     Représente une compétence dans un arbre d'apprentissage.
     Ex: "Python Basics" -> "Variables" -> "Data Types"
     """
     name = models.CharField(max_length=200, unique=True)
+    slug = models.SlugField(max_length=200, unique=True, blank=True, help_text="Identifiant stable, utilisé pour l'import/export du programme.")
     description = models.TextField(blank=True, help_text="Description de ce que couvre la compétence.")
     parent = TreeForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
 
     class MPTTMeta:
         order_insertion_by = ['name']
 
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = unique_slug(Skill, self.name)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -23,7 +42,13 @@ class Concept(models.Model):
     """
     skill = models.ForeignKey(Skill, on_delete=models.CASCADE, related_name='concepts')
     name = models.CharField(max_length=255)
+    slug = models.SlugField(max_length=255, unique=True, blank=True, help_text="Identifiant stable, utilisé pour l'import/export du programme.")
     explanation = models.TextField(help_text="L'explication fondamentale du concept qui sera utilisée par le LLM.")
 
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = unique_slug(Concept, self.name)
+        super().save(*args, **kwargs)
+
     def __str__(self):
-        return f"{self.name} (in {self.skill.name})"
\ No newline at end of file
+        return f"{self.name} (in {self.skill.name})"
@@ -0,0 +1,184 @@
+"""
+Représentations du programme servies par l'API (voir expert/views.py).
+
+Le JSON de l'arbre et de chaque concept est produit une fois par version du
+programme, puis servi tel quel, sans requête SQL ni sérialiseur.
+Les corps sont aussi stockés compressés (gzip, et brotli si le module est
+installé), et chaque réponse porte un ETag et un Last-Modified tirés de la
+version : un client qui a déjà la bonne version reçoit un 304 sans corps.
+
+Toute modification d'un Skill ou d'un Concept change la version du programme
+(voir expert/signals.py). Au prochain accès, chaque processus relit alors le
+programme (deux requêtes) ; chaque représentation n'est encodée et compressée
+qu'à sa première demande, et non toutes d'un coup.
+"""
+import gzip
+import json
+import threading
+import time
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from .curriculum import get_curriculum_version
+
+try:
+    import brotli
+except ImportError: # dépendance facultative
+    brotli = None
+
+# En dessous, la compression ne fait rien gagner
+MIN_COMPRESS_SIZE = 1024
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, *params = item.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class Representation:
+    """
+    Corps JSON figé, avec ses variantes compressées.
+    """
+    def __init__(self, data):
+        self.body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.encoded = {}
+        if len(self.body) >= MIN_COMPRESS_SIZE:
+            if brotli is not None:
+                self.encoded['br'] = brotli.compress(self.body)
+            self.encoded['gzip'] = gzip.compress(self.body, mtime=0)
+
+    def content_for(self, request):
+        """
+        Retourne (corps, Content-Encoding) selon ce que le client accepte.
+        """
+        accepted = _accepted_encodings(request)
+        for coding, body in self.encoded.items(): # brotli d'abord
+            if coding in accepted:
+                return body, coding
+        return self.body, None
+
+
+class LazyRepresentations:
+    """
+    Représentations construites à la première demande, puis gardées.
+    Deux premières demandes simultanées peuvent construire la même deux fois ;
+    la seconde est simplement jetée.
+    """
+    def __init__(self, data_by_key):
+        self._data = data_by_key
+        self._built = {}
+
+    def get(self, key):
+        representation = self._built.get(key)
+        if representation is None:
+            data = self._data.get(key)
+            if data is None:
+                return None
+            representation = self._built.setdefault(key, Representation(data))
+        return representation
+
+
+class CurriculumDocument:
+    def __init__(self, version, skill_rows, concept_rows):
+        self.version = version
+        self.etag = f'W/"curriculum-{version}"'
+        # Date de la première construction de cette version, partagée par les processus
+        modified_key = f"expert:curriculum_modified:{version}"
+        cache.add(modified_key, int(time.time()), timeout=None)
+        self.last_modified = cache.get(modified_key) or int(time.time())
+
+        slug_by_id = {}
+        skills = []
+        skills_by_id = {}
+        for skill_id, parent_id, slug, name, description, level in skill_rows:
+            slug_by_id[skill_id] = slug
+            skills_by_id[skill_id] = {
+                "id": skill_id, "slug": slug, "name": name, "description": description,
+                "parent": slug_by_id.get(parent_id), "level": level, "concepts": [],
+            }
+            skills.append(skills_by_id[skill_id])
+
+        concepts = {}
+        for concept_id, skill_id, slug, name, explanation in concept_rows:
+            skills_by_id[skill_id]["concepts"].append({"id": concept_id, "slug": slug, "name": name})
+            concepts[slug] = {
+                "id": concept_id, "slug": slug, "name": name,
+                "skill": slug_by_id[skill_id], "explanation": explanation,
+            }
+        # Encodées et compressées à la demande : la reconstruction reste rapide
+        self.concepts = LazyRepresentations(concepts)
+        self._tree = LazyRepresentations({"tree": {"version": version, "skills": skills}})
+
+    @property
+    def tree(self):
+        return self._tree.get("tree")
+
+    @classmethod
+    def build(cls):
+        from .models import Concept, Skill
+
+        # Version lue avant les données (voir CurriculumSnapshot.build)
+        version = get_curriculum_version()
+        skill_rows = list(
+            Skill.objects.order_by('tree_id', 'lft')
+            .values_list('id', 'parent_id', 'slug', 'name', 'description', 'level')
+        )
+        concept_rows = list(
+            Concept.objects.order_by('skill__tree_id', 'skill__lft', 'id')
+            .values_list('id', 'skill_id', 'slug', 'name', 'explanation')
+        )
+        return cls(version, skill_rows, concept_rows)
+
+    def respond(self, request, representation):
+        """
+        Réponse HTTP pour `representation` : 304 si le client a déjà cette version.
+        """
+        response = get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+        if response is None:
+            body, coding = representation.content_for(request)
+            response = HttpResponse(body, content_type='application/json')
+            if coding:
+                response['Content-Encoding'] = coding
+        response['ETag'] = self.etag
+        response['Last-Modified'] = http_date(self.last_modified)
+        # Données propres aux utilisateurs authentifiés : pas de cache partagé,
+        # mais le navigateur peut revalider
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ('Accept-Encoding', 'Authorization'))
+        return response
+
+
+_document = None
+_document_lock = threading.Lock()
+
+def get_curriculum_document():
+    """
+    Retourne les représentations du programme, reconstruites quand sa version change.
+    """
+    global _document
+    document = _document
+    if document is None or document.version != get_curriculum_version():
+        with _document_lock:
+            document = _document
+            if document is None or document.version != get_curriculum_version():
+                document = _document = CurriculumDocument.build()
+    return document
+
+def invalidate_curriculum_document():
+    global _document
+    _document = None
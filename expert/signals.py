@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from mptt.signals import node_moved
+from .curriculum import bump_curriculum_version, invalidate_curriculum_snapshot
+from .models import Concept, Skill
+from .published import invalidate_curriculum_document
+
+@receiver(post_save, sender=Skill)
+@receiver(post_delete, sender=Skill)
+@receiver(node_moved, sender=Skill)
+@receiver(post_save, sender=Concept)
+@receiver(post_delete, sender=Concept)
+def invalidate_curriculum(sender, **kwargs):
+    """
+    Toute modification du programme (admin, migrations, shell...) change sa version.
+    Les autres processus reconstruisent leur instantané en voyant la nouvelle version.
+    """
+    bump_curriculum_version()
+    invalidate_curriculum_snapshot()
+    invalidate_curriculum_document()
+    # Un instantané reconstruit avant la fin de la transaction ne doit pas survivre à celle-ci
+    transaction.on_commit(bump_curriculum_version)
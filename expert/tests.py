@@ -1,3 +1,183 @@
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError
 from django.test import TestCase
+from rest_framework.authtoken.models import Token
+
+from .curriculum import bump_curriculum_version, get_curriculum_snapshot
+from .curriculum_io import CurriculumFormatError, import_curriculum
+from .models import Concept, Skill
+from .published import CurriculumDocument
+
+
+class CurriculumSnapshotTests(TestCase):
+    """
+    S'appuie sur le programme initial créé par la migration 0002.
+    """
+    def setUp(self):
+        # Les tests précédents ont pu modifier le programme puis annuler leur transaction
+        bump_curriculum_version()
+        self.root = Skill.objects.get(name='Python - Les Bases')
+        self.variables = Skill.objects.get(name='Variables et Types de Données')
+        self.operators = Skill.objects.get(name='Opérateurs')
+
+    def test_traversal_needs_no_query(self):
+        snapshot = get_curriculum_snapshot()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(snapshot.children(self.root.id), [self.operators.id, self.variables.id])
+            self.assertEqual(snapshot.siblings(self.operators.id), [self.variables.id])
+            self.assertEqual(snapshot.ancestors(self.variables.id), [self.root.id])
+            self.assertEqual(len(snapshot.subtree_concept_ids(self.root.id)), 5)
+
+    def test_concepts_follow_tree_order(self):
+        snapshot = get_curriculum_snapshot()
+        expected = list(
+            Concept.objects.order_by('skill__tree_id', 'skill__lft', 'id').values_list('id', flat=True)
+        )
+
+        self.assertEqual(list(snapshot.concept_ids), expected)
+        self.assertIsNone(snapshot.prerequisite(expected[0]))
+        self.assertEqual(snapshot.prerequisite(expected[1]), expected[0])
+        self.assertEqual(snapshot.first_unseen_concept_id(set(expected[:2])), expected[2])
+
+    def test_subtree_completion(self):
+        snapshot = get_curriculum_snapshot()
+        operator_concepts = list(snapshot.subtree_concept_ids(self.operators.id))
+
+        self.assertEqual(snapshot.subtree_completion(self.operators.id, {operator_concepts[0]}), 0.5)
+        self.assertEqual(snapshot.subtree_completion(self.root.id, set(operator_concepts)), 0.4)
+
+    def test_snapshot_is_rebuilt_when_curriculum_changes(self):
+        before = get_curriculum_snapshot()
+        concept = Concept.objects.create(skill=self.operators, name='Multiplication (*)', explanation="...")
+
+        after = get_curriculum_snapshot()
+        self.assertIsNot(before, after)
+        self.assertIn(concept.id, after.subtree_concept_ids(self.operators.id))
+
+
+class CurriculumImportExportTests(TestCase):
+    def export(self):
+        out = io.StringIO()
+        call_command('export_curriculum', stdout=out)
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_import_builds_a_valid_tree(self):
+        records = [
+            {"type": "skill", "slug": "boucles", "name": "Boucles", "parent": "python-les-bases"},
+            {"type": "skill", "slug": "for", "name": "La boucle for", "parent": "boucles"},
+            {"type": "skill", "slug": "while", "name": "La boucle while", "parent": "boucles"},
+            {"type": "concept", "slug": "range", "skill": "for", "name": "range()", "explanation": "..."},
+        ]
+
+        stats = import_curriculum(records, batch_size=2)
+
+        self.assertEqual(stats['skills_created'], 3)
+        self.assertEqual(stats['concepts_created'], 1)
+        loops = Skill.objects.get(slug='boucles')
+        self.assertEqual(loops.parent.slug, 'python-les-bases')
+        self.assertEqual(
+            [skill.slug for skill in loops.get_children()], ['for', 'while']
+        )
+        # Les bornes calculées en mémoire sont celles que MPTT aurait obtenues
+        before = list(Skill.objects.order_by('id').values_list('tree_id', 'lft', 'rght', 'level'))
+        Skill.objects.rebuild()
+        after = list(Skill.objects.order_by('id').values_list('tree_id', 'lft', 'rght', 'level'))
+        self.assertEqual(before, after)
+
+    def test_export_then_import_is_an_upsert(self):
+        records = self.export()
+        self.assertEqual(records[0]["slug"], "python-les-bases")
+        concept = next(record for record in records if record["type"] == "concept")
+        concept["explanation"] = "Nouvelle explication."
+
+        stats = import_curriculum(records)
+
+        self.assertEqual(stats['skills_created'] + stats['concepts_created'], 0)
+        self.assertEqual(stats['concepts_updated'], Concept.objects.count())
+        self.assertEqual(Concept.objects.get(slug=concept["slug"]).explanation, "Nouvelle explication.")
+        self.assertEqual(len(self.export()), len(records))
+
+    def test_unknown_parent_is_rejected(self):
+        with self.assertRaises(CurriculumFormatError):
+            import_curriculum([{"type": "skill", "slug": "orphan", "name": "Orphan", "parent": "missing"}])
+        self.assertFalse(Skill.objects.filter(slug='orphan').exists())
+
+
+    def test_duplicate_skill_name_is_rejected(self):
+        with self.assertRaises(CurriculumFormatError):
+            import_curriculum([{"type": "skill", "slug": "bases-bis", "name": "Python - Les Bases"}])
+        self.assertFalse(Skill.objects.filter(slug='bases-bis').exists())
+
+    def test_new_concept_needs_name_and_explanation(self):
+        with self.assertRaises(CurriculumFormatError):
+            import_curriculum([{"type": "concept", "slug": "vide", "skill": "python-les-bases", "name": "Vide"}])
+        self.assertFalse(Concept.objects.filter(slug='vide').exists())
+
+    def test_command_reports_database_conflicts(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as stream:
+            stream.write(json.dumps({"type": "skill", "slug": "boucles", "name": "Boucles"}) + "\n")
+        self.addCleanup(os.remove, stream.name)
+
+        with mock.patch.object(Skill.objects, "bulk_create", side_effect=IntegrityError("UNIQUE")):
+            with self.assertRaises(CommandError):
+                call_command('import_curriculum', stream.name)
+
+class CurriculumAPITests(TestCase):
+    def setUp(self):
+        bump_curriculum_version()
+        token = Token.objects.create(user=User.objects.create_user("alice"))
+        self.auth = {"HTTP_AUTHORIZATION": f"Token {token.key}"}
+
+    def test_tree_is_served_then_revalidated(self):
+        response = self.client.get("/api/expert/curriculum/", **self.auth)
+        self.assertEqual(response.status_code, 200)
+        skills = json.loads(response.content)["skills"]
+        self.assertEqual([skill["slug"] for skill in skills][0], "python-les-bases")
+        self.assertEqual(sum(len(skill["concepts"]) for skill in skills), Concept.objects.count())
+
+        # Même version : 304, sans corps ni requête SQL
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                "/api/expert/curriculum/", HTTP_IF_NONE_MATCH=response["ETag"], **self.auth
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_saving_a_concept_changes_the_etag(self):
+        etag = self.client.get("/api/expert/curriculum/", **self.auth)["ETag"]
+        concept = Concept.objects.first()
+        concept.name += " (révisé)"
+        concept.save()
+
+        response = self.client.get("/api/expert/curriculum/", HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_concept_detail_is_gzipped_when_accepted(self):
+        concept = Concept.objects.first()
+        concept.explanation = "Une longue explication. " * 100
+        concept.save()
+
+        response = self.client.get(
+            f"/api/expert/concepts/{concept.slug}/", HTTP_ACCEPT_ENCODING="gzip, br;q=0", **self.auth
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.content))["explanation"], concept.explanation)
+        self.assertEqual(self.client.get("/api/expert/concepts/inconnu/", **self.auth).status_code, 404)
+
+    def test_representations_are_encoded_on_first_request(self):
+        document = CurriculumDocument.build()
+        self.assertEqual(document.concepts._built, {})
 
-# Create your tests here.
+        slug = Concept.objects.first().slug
+        self.assertIs(document.concepts.get(slug), document.concepts.get(slug))
+        self.assertEqual(list(document.concepts._built), [slug])
@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import ConceptDetailView, CurriculumView
+
+urlpatterns = [
+    path('curriculum/', CurriculumView.as_view(), name='curriculum'),
+    path('concepts/<slug:slug>/', ConceptDetailView.as_view(), name='concept-detail'),
+]
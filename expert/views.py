@@ -1,3 +1,31 @@
-from django.shortcuts import render
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
 
-# Create your views here.
+from .published import get_curriculum_document
+
+
+class CurriculumView(APIView):
+    """
+    Arbre des compétences (ordre préfixe, chaque parent avant ses enfants) et
+    la liste de leurs concepts. Servi depuis une représentation précalculée.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        document = get_curriculum_document()
+        return document.respond(request, document.tree)
+
+
+class ConceptDetailView(APIView):
+    """
+    Un concept et son explication, par slug.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, slug, *args, **kwargs):
+        document = get_curriculum_document()
+        representation = document.concepts.get(slug)
+        if representation is None:
+            raise NotFound()
+        return document.respond(request, representation)
@@ -0,0 +1,278 @@
+"""
+Archivage des anciens échanges (InteractionLog), pour garder la table chaude petite.
+
+Le tuteur ne relit que les derniers échanges d'un concept (et leur résumé, voir
+tutor/summaries.py). Selon les règles de TUTOR_RETENTION, les échanges devenus
+inutiles sont déplacés vers des fichiers JSON Lines compressés :
+
+- MASTERED_AFTER_DAYS : toute la conversation d'un concept maîtrisé, quand
+  l'apprenant n'y est pas revenu depuis ce nombre de jours ;
+- MAX_AGE_DAYS : tout échange plus ancien, maîtrisé ou non (None = jamais),
+  sauf les HISTORY_WINDOW derniers de chaque conversation (ceux que le tuteur
+  relit) et, si les résumés sont actifs, ceux pas encore intégrés au résumé.
+  Un apprenant qui revient après longtemps retrouve ainsi sa conversation.
+
+Les fichiers sont rangés par jour de l'échange :
+
+    ARCHIVE_DIR/date=2026-10-18/interactions-<exécution>-<n°>.jsonl.gz
+
+Les échanges sont lus par lots de CHUNK_SIZE, dans l'ordre des id. Chaque lot
+est écrit dans des fichiers complets (fichier temporaire, fsync, puis
+renommage) avant d'être supprimé de la base : un arrêt en cours de route ne
+perd rien (au pire, un lot est à la fois archivé et encore en base).
+
+Compression : gzip, ou zstd (COMPRESSION = 'zstd') si le paquet `zstandard` est installé.
+`restore_interactions` réinsère des échanges archivés.
+"""
+import gzip
+import io
+import json
+import os
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from expert.models import Concept
+from .models import InteractionLog, LearnerProfile, LearnerProgress
+
+try:
+    import zstandard
+except ImportError: # dépendance facultative
+    zstandard = None
+
+DEFAULT_SETTINGS = {
+    'ARCHIVE_DIR': Path(settings.BASE_DIR) / 'var' / 'archive',
+    'MASTERED_AFTER_DAYS': 30,
+    'MAX_AGE_DAYS': 365,
+    'COMPRESSION': 'gzip',
+    'CHUNK_SIZE': 5000,
+}
+
+EXTENSIONS = {'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst'}
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def get_retention_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TUTOR_RETENTION', {})}
+
+
+def _check_compression(compression):
+    if compression not in EXTENSIONS:
+        raise ArchiveError(f"Unknown compression {compression!r} (gzip or zstd).")
+    if compression == 'zstd' and zstandard is None:
+        raise ArchiveError("The zstandard package is required for zstd archives (pip install zstandard).")
+
+
+def _compress(data, compression):
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data, mtime=0)
+
+
+def open_archive(path):
+    """
+    Ouvre un fichier d'archive en lecture (texte), selon son extension.
+    """
+    path = Path(path)
+    if path.name.endswith(EXTENSIONS['zstd']):
+        if zstandard is None:
+            raise ArchiveError("The zstandard package is required to read zstd archives.")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')), encoding='utf-8')
+    if path.name.endswith(EXTENSIONS['gzip']):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    raise ArchiveError(f"Not an interaction archive: {path}")
+
+
+def archive_files(paths):
+    """
+    Fichiers d'archive désignés par `paths` (fichiers ou dossiers, parcourus récursivement), triés.
+    """
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(
+                child for child in path.rglob('interactions-*')
+                if any(child.name.endswith(extension) for extension in EXTENSIONS.values())
+            )
+        elif path.exists():
+            files.append(path)
+        else:
+            raise ArchiveError(f"No such archive file or directory: {path}")
+    return sorted(files)
+
+
+def archivable_logs(now=None, options=None):
+    """
+    Échanges à archiver selon les règles de rétention, dans l'ordre des id.
+    """
+    options = options or get_retention_settings()
+    # Imports locaux : tutor dépend de cette app
+    from tutor.services import HISTORY_WINDOW, MASTERY_THRESHOLD
+    from tutor.summaries import summaries_enabled
+
+    now = now or timezone.now()
+    condition = Q(pk__in=[])
+    if options['MASTERED_AFTER_DAYS'] is not None:
+        condition |= Q(Exists(LearnerProgress.objects.filter(
+            learner_id=OuterRef('learner_id'),
+            concept_id=OuterRef('concept_id'),
+            mastery_score__gte=MASTERY_THRESHOLD,
+            last_interaction_at__lt=now - timedelta(days=options['MASTERED_AFTER_DAYS']),
+        )))
+    if options['MAX_AGE_DAYS'] is not None:
+        # Date du plus ancien des HISTORY_WINDOW derniers échanges de la conversation
+        # (NULL s'il y en a moins : rien n'est alors archivé par âge)
+        window_start = InteractionLog.objects.filter(
+            learner_id=OuterRef('learner_id'), concept_id=OuterRef('concept_id'),
+        ).order_by('-created_at', '-id').values('created_at')[HISTORY_WINDOW - 1:HISTORY_WINDOW]
+        too_old = Q(created_at__lt=now - timedelta(days=options['MAX_AGE_DAYS'])) & Q(
+            created_at__lt=Subquery(window_start)
+        )
+        if summaries_enabled():
+            too_old &= Q(Exists(LearnerProgress.objects.filter(
+                learner_id=OuterRef('learner_id'),
+                concept_id=OuterRef('concept_id'),
+                summarized_log_id__gte=OuterRef('id'),
+            )))
+        condition |= too_old
+    return InteractionLog.objects.filter(condition).order_by('id')
+
+
+def _record(log):
+    return {
+        "id": log.id,
+        "learner": log.learner.user.username,
+        "concept": log.concept.slug,
+        "user_message": log.user_message,
+        "tutor_response": log.tutor_response,
+        "score": log.score,
+        "created_at": log.created_at.isoformat(),
+        "uid": str(log.uid) if log.uid else None,
+    }
+
+
+def _write_partition(directory, name, records, compression):
+    """
+    Écrit un fichier complet : contenu compressé dans un fichier temporaire,
+    synchronisé sur disque, puis renommé.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode('utf-8')
+    path = directory / name
+    temporary = directory / f".{name}.tmp"
+    with open(temporary, 'wb') as stream:
+        stream.write(_compress(data, compression))
+        stream.flush()
+        os.fsync(stream.fileno())
+    os.replace(temporary, path)
+    return path
+
+
+def archive_interactions(options=None, now=None, dry_run=False):
+    """
+    Déplace les échanges à archiver vers des fichiers, lot par lot.
+    Retourne (nombre d'échanges archivés, fichiers écrits).
+    """
+    options = options or get_retention_settings()
+    compression = options['COMPRESSION']
+    _check_compression(compression)
+    logs = archivable_logs(now, options)
+    if dry_run:
+        return logs.count(), []
+
+    archive_dir = Path(options['ARCHIVE_DIR'])
+    run = f"{timezone.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    archived, files = 0, []
+    last_id = 0
+    sequence = 0
+    while True:
+        # Pagination par id : les lignes déjà archivées ont été supprimées
+        chunk = list(
+            logs.filter(id__gt=last_id)
+            .select_related('learner__user', 'concept')
+            .only(
+                'id', 'uid', 'user_message', 'tutor_response', 'score', 'created_at',
+                'learner__user__username', 'concept__slug',
+            )[:options['CHUNK_SIZE']]
+        )
+        if not chunk:
+            break
+        partitions = {}
+        for log in chunk:
+            partitions.setdefault(log.created_at.date(), []).append(_record(log))
+        for day, records in sorted(partitions.items()):
+            sequence += 1
+            files.append(_write_partition(
+                archive_dir / f"date={day.isoformat()}",
+                f"interactions-{run}-{sequence:05d}{EXTENSIONS[compression]}",
+                records, compression,
+            ))
+        ids = [log.id for log in chunk]
+        with transaction.atomic():
+            InteractionLog.objects.filter(id__in=ids).delete()
+        archived += len(ids)
+        last_id = ids[-1]
+    return archived, files
+
+
+def restore_interactions(paths, batch_size=DEFAULT_SETTINGS['CHUNK_SIZE'], since=None, until=None):
+    """
+    Réinsère les échanges des fichiers d'archive (avec leur id d'origine ; un
+    échange déjà en base est ignoré). Les apprenants et concepts sont retrouvés
+    par nom d'utilisateur et slug ; les échanges dont l'un a disparu sont ignorés.
+    `since` / `until` (dates) limitent la restauration aux partitions de ces jours.
+    Retourne (échanges réinsérés ou déjà présents, échanges ignorés).
+    """
+    restored = skipped = 0
+    batch = []
+
+    def flush():
+        nonlocal restored, skipped
+        learners = dict(
+            LearnerProfile.objects.filter(user__username__in={record['learner'] for record in batch})
+            .values_list('user__username', 'id')
+        )
+        concepts = dict(
+            Concept.objects.filter(slug__in={record['concept'] for record in batch}).values_list('slug', 'id')
+        )
+        logs = [
+            InteractionLog(
+                id=record['id'],
+                learner_id=learners[record['learner']],
+                concept_id=concepts[record['concept']],
+                user_message=record['user_message'],
+                tutor_response=record['tutor_response'],
+                score=record.get('score'),
+                created_at=parse_datetime(record['created_at']),
+                uid=record.get('uid'),
+            )
+            for record in batch
+            if record['learner'] in learners and record['concept'] in concepts
+        ]
+        InteractionLog.objects.bulk_create(logs, ignore_conflicts=True)
+        restored += len(logs)
+        skipped += len(batch) - len(logs)
+        batch.clear()
+
+    for path in archive_files(paths):
+        day = path.parent.name.removeprefix('date=')
+        if (since and day < since.isoformat()) or (until and day > until.isoformat()):
+            continue
+        with open_archive(path) as stream:
+            for line in stream:
+                if line.strip():
+                    batch.append(json.loads(line))
+                    if len(batch) >= batch_size:
+                        flush()
+    if batch:
+        flush()
+    return restored, skipped
@@ -0,0 +1,126 @@
+"""
+Authentification par token avec cache.
+
+`TokenAuthentication` relit le token et l'utilisateur en base à chaque requête,
+puis la vue relit le profil de l'apprenant. Ici, token → utilisateur → profil
+sont gardés ensemble en mémoire (LRU borné, avec expiration) : une requête
+authentifiée ne fait plus aucune lecture pour identifier l'apprenant.
+
+Le cache est vidé explicitement (voir learner/signals.py) quand un token est
+supprimé ou régénéré, et quand un utilisateur ou un profil est modifié ou
+supprimé. Il est propre à chaque processus : dans les autres, une modification
+est prise en compte au plus tard après TTL secondes.
+"""
+import copy
+import uuid
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from tutor.response_cache import LocMemBackend
+from .models import LearnerProfile
+
+DEFAULT_SETTINGS = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 300, # secondes
+}
+
+
+def get_auth_cache_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'LEARNER_AUTH_CACHE', {})}
+
+
+class TokenCache:
+    """
+    Entrées (token, utilisateur, profil) par clé de token. Chaque entrée porte
+    la version de son utilisateur, elle-même gardée dans le cache : invalider
+    un utilisateur retire sa version, ce qui périme toutes ses entrées. Rien
+    n'est conservé hors du cache, donc rien ne survit à l'éviction LRU (une
+    version évincée périme aussi les entrées, au prix d'une relecture).
+    """
+    def __init__(self, options):
+        self.ttl = options['TTL']
+        self._entries = LocMemBackend(options)
+
+    @staticmethod
+    def _version_key(user_id):
+        return f"user:{user_id}"
+
+    def get(self, key):
+        cached = self._entries.get(key)
+        if cached is None:
+            return None
+        version, entry = cached
+        if self._entries.get(self._version_key(entry[1].id)) != version:
+            return None
+        return entry
+
+    def set(self, key, entry):
+        token, user, profile = entry
+        version_key = self._version_key(user.id)
+        version = self._entries.get(version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            self._entries.set(version_key, version, self.ttl)
+        self._entries.set(key, (version, entry), self.ttl)
+
+    def invalidate_token(self, key):
+        self._entries.delete(key)
+
+    def invalidate_user(self, user_id):
+        self._entries.delete(self._version_key(user_id))
+
+    def clear(self):
+        self._entries.clear()
+
+
+token_cache = TokenCache(get_auth_cache_settings())
+
+
+def _load_credentials(key):
+    """
+    Lit le token, l'utilisateur et son profil en une requête (le profil est créé s'il manque).
+    """
+    try:
+        token = Token.objects.select_related('user__learnerprofile').get(key=key)
+    except Token.DoesNotExist:
+        raise AuthenticationFailed(_('Invalid token.'))
+    user = token.user
+    try:
+        profile = user.learnerprofile
+    except LearnerProfile.DoesNotExist:
+        profile, _created = LearnerProfile.objects.get_or_create(user=user)
+    return token, user, profile
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is None:
+            entry = _load_credentials(key)
+            if not entry[1].is_active:
+                raise AuthenticationFailed(_('User inactive or deleted.'))
+            token_cache.set(key, entry)
+
+        # Copies : une requête ne doit pas modifier les objets partagés du cache
+        token, user, profile = (copy.copy(obj) for obj in entry)
+        token.user = user
+        user.learnerprofile = profile # renseigne aussi profile.user
+        return user, token
+
+
+def get_learner_profile(user):
+    """
+    Profil de l'apprenant connecté. Déjà chargé par CachedTokenAuthentication ;
+    sinon lu (ou créé) avec son utilisateur, pour que `profile.user` ne coûte
+    pas de requête de plus.
+    """
+    try:
+        return user.learnerprofile
+    except LearnerProfile.DoesNotExist:
+        profile, _created = LearnerProfile.objects.get_or_create(user=user)
+        profile.user = user
+        return profile
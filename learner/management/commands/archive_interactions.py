@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from learner.archive import ArchiveError, archive_interactions, get_retention_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Déplace les anciens échanges vers des fichiers JSON Lines compressés, rangés par jour "
+        "(voir learner/archive.py). Règles par défaut : TUTOR_RETENTION. À lancer régulièrement (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Compte les échanges à archiver, sans rien écrire.")
+        parser.add_argument('--mastered-after', type=int, help="Jours sans échange après lesquels un concept maîtrisé est archivé.")
+        parser.add_argument('--max-age', type=int, help="Âge (en jours) au-delà duquel un échange est archivé (sauf les derniers de sa conversation).")
+        parser.add_argument('--compression', choices=['gzip', 'zstd'])
+        parser.add_argument('--dir', help="Dossier des archives (par défaut TUTOR_RETENTION['ARCHIVE_DIR']).")
+        parser.add_argument('--chunk-size', type=int)
+
+    def handle(self, *args, **options):
+        settings = get_retention_settings()
+        for option, key in (
+            ('mastered_after', 'MASTERED_AFTER_DAYS'), ('max_age', 'MAX_AGE_DAYS'),
+            ('compression', 'COMPRESSION'), ('dir', 'ARCHIVE_DIR'), ('chunk_size', 'CHUNK_SIZE'),
+        ):
+            if options[option] is not None:
+                settings[key] = options[option]
+
+        try:
+            archived, files = archive_interactions(settings, dry_run=options['dry_run'])
+        except (ArchiveError, OSError) as e:
+            raise CommandError(str(e))
+
+        if options['dry_run']:
+            self.stdout.write(f"{archived} échanges à archiver.")
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"{archived} échanges archivés dans {len(files)} fichiers ({settings['ARCHIVE_DIR']})."
+            ))
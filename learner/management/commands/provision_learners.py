@@ -0,0 +1,57 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from learner.provisioning import BATCH_SIZE, create_missing_profiles, provision_learners
+
+
+class Command(BaseCommand):
+    help = (
+        "Crée en masse des apprenants (utilisateur, profil et token) à partir d'un CSV "
+        "avec une colonne `username` (et en option `email`, `first_name`, `last_name`). "
+        "Les noms d'utilisateur déjà pris sont ignorés."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help="Fichier CSV ('-' pour l'entrée standard).")
+        parser.add_argument('--password', help="Mot de passe commun (par défaut : aucun, connexion par token).")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--tokens-out', help="Écrit les tokens créés dans ce CSV (username,token).")
+        parser.add_argument(
+            '--missing-profiles', action='store_true',
+            help="Crée seulement les profils manquants des utilisateurs existants."
+        )
+
+    def handle(self, *args, **options):
+        if options['missing_profiles']:
+            count = create_missing_profiles(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"{count} profils créés."))
+            return
+        if not options['path']:
+            raise CommandError("A CSV path (or '-') is required.")
+
+        try:
+            if options['path'] == '-':
+                records = list(csv.DictReader(sys.stdin))
+            else:
+                with open(options['path'], newline='', encoding='utf-8') as stream:
+                    records = list(csv.DictReader(stream))
+        except OSError as e:
+            raise CommandError(str(e))
+        if records and 'username' not in records[0]:
+            raise CommandError("The CSV file must have a 'username' column.")
+
+        tokens = provision_learners(
+            [record for record in records if record.get('username')],
+            password=options['password'], batch_size=options['batch_size'],
+        )
+
+        if options['tokens_out']:
+            with open(options['tokens_out'], 'w', newline='', encoding='utf-8') as stream:
+                writer = csv.writer(stream)
+                writer.writerow(['username', 'token'])
+                writer.writerows(tokens.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(tokens)} apprenants créés, {len(records) - len(tokens)} ignorés (déjà existants ou vides)."
+        ))
@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from learner.archive import ArchiveError, restore_interactions
+
+
+class Command(BaseCommand):
+    help = (
+        "Réinsère des échanges archivés par `archive_interactions` (fichiers ou dossiers d'archive). "
+        "Les échanges déjà en base sont ignorés."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="Fichiers .jsonl.gz / .jsonl.zst, ou dossiers qui les contiennent.")
+        parser.add_argument('--since', type=date.fromisoformat, help="Premier jour à restaurer (AAAA-MM-JJ).")
+        parser.add_argument('--until', type=date.fromisoformat, help="Dernier jour à restaurer (AAAA-MM-JJ).")
+
+    def handle(self, *args, **options):
+        try:
+            restored, skipped = restore_interactions(options['paths'], since=options['since'], until=options['until'])
+        except (ArchiveError, OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"{restored} échanges restaurés."))
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f"{skipped} échanges ignorés (apprenant ou concept introuvable)."
+            ))
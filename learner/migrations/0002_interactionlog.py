@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expert', '0002_populate_initial_concepts'),
+        ('learner', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InteractionLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_message', models.TextField()),
+                ('tutor_response', models.TextField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('concept', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='interaction_logs', to='expert.concept')),
+                ('learner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='interaction_logs', to='learner.learnerprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['learner', 'concept', 'created_at'], name='interaction_log_recent_idx')],
+            },
+        ),
+    ]
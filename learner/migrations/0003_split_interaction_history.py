@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+def split_interaction_history(apps, schema_editor):
+    """
+    Recopie chaque tour de `LearnerProgress.interaction_history` dans `InteractionLog`.
+
+    Les anciens tours n'ont pas d'horodatage : on part de `last_interaction_at` et on
+    ajoute une microseconde par tour pour conserver l'ordre de la conversation.
+    """
+    LearnerProgress = apps.get_model('learner', 'LearnerProgress')
+    InteractionLog = apps.get_model('learner', 'InteractionLog')
+
+    logs = []
+    progress_rows = LearnerProgress.objects.only(
+        'learner_id', 'concept_id', 'last_interaction_at', 'interaction_history'
+    )
+    for progress in progress_rows.iterator(chunk_size=BATCH_SIZE):
+        for position, turn in enumerate(progress.interaction_history or []):
+            logs.append(InteractionLog(
+                learner_id=progress.learner_id,
+                concept_id=progress.concept_id,
+                user_message=turn.get('user', ''),
+                tutor_response=turn.get('tutor', ''),
+                created_at=progress.last_interaction_at + timedelta(microseconds=position),
+            ))
+        if len(logs) >= BATCH_SIZE:
+            InteractionLog.objects.bulk_create(logs, batch_size=BATCH_SIZE)
+            logs = []
+    InteractionLog.objects.bulk_create(logs, batch_size=BATCH_SIZE)
+
+
+def merge_interaction_history(apps, schema_editor):
+    """
+    Fonction inverse : reconstruit les blobs JSON à partir du journal.
+    """
+    LearnerProgress = apps.get_model('learner', 'LearnerProgress')
+    InteractionLog = apps.get_model('learner', 'InteractionLog')
+
+    histories = {}
+    logs = InteractionLog.objects.order_by('learner_id', 'concept_id', 'created_at', 'id')
+    for log in logs.iterator(chunk_size=BATCH_SIZE):
+        histories.setdefault((log.learner_id, log.concept_id), []).append({
+            "user": log.user_message,
+            "tutor": log.tutor_response,
+        })
+
+    for progress in LearnerProgress.objects.iterator(chunk_size=BATCH_SIZE):
+        history = histories.get((progress.learner_id, progress.concept_id))
+        if history:
+            progress.interaction_history = history
+            progress.save(update_fields=['interaction_history'])
+    InteractionLog.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learner', '0002_interactionlog'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_interaction_history, merge_interaction_history),
+    ]
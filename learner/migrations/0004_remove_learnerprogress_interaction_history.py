@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learner', '0003_split_interaction_history'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='learnerprogress',
+            name='interaction_history',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learner', '0004_remove_learnerprogress_interaction_history'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='learnerprogress',
+            index=models.Index(fields=['learner', 'last_interaction_at', 'mastery_score'], name='progress_next_concept_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learner', '0005_learnerprogress_next_concept_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='interactionlog',
+            name='score',
+            field=models.FloatField(blank=True, help_text='Note de la réponse (0.0 à 1.0) donnée par le LLM, si la notation est active.', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='interactionlog',
+            index=models.Index(fields=['concept', 'score'], name='interaction_log_grading_idx'),
+        ),
+    ]
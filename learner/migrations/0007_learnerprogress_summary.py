@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learner', '0006_interactionlog_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='learnerprogress',
+            name='summarized_log_id',
+            field=models.PositiveBigIntegerField(default=0, help_text='Dernier échange (InteractionLog.id) intégré au résumé.'),
+        ),
+        migrations.AddField(
+            model_name='learnerprogress',
+            name='summary',
+            field=models.TextField(blank=True, default='', help_text='Résumé des échanges anciens, repris dans le prompt (voir tutor/summaries.py).'),
+        ),
+    ]
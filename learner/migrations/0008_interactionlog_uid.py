@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:02
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learner', '0007_learnerprogress_summary'),
+    ]
+
+    operations = [
+        # Ajouté sans valeur par défaut : les échanges existants gardent un uid
+        # vide (un défaut appelable donnerait le même uid à toutes les lignes)
+        migrations.AddField(
+            model_name='interactionlog',
+            name='uid',
+            field=models.UUIDField(editable=False, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='interactionlog',
+            name='uid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, null=True, unique=True),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -16,15 +18,57 @@ class LearnerProfile(models.Model):
 class LearnerProgress(models.Model):
     """
     Table pivot qui suit la maîtrise d'un apprenant pour un concept donné.
+    L'historique des échanges est stocké à part, dans `InteractionLog`.
     """
     learner = models.ForeignKey(LearnerProfile, on_delete=models.CASCADE)
     concept = models.ForeignKey(Concept, on_delete=models.CASCADE)
     mastery_score = models.FloatField(default=0.0, help_text="Score de 0.0 (non vu) à 1.0 (maîtrisé).")
     last_interaction_at = models.DateTimeField(default=timezone.now)
-    interaction_history = models.JSONField(default=list, help_text="Liste des interactions (questions/réponses).")
+    summary = models.TextField(blank=True, default='', help_text="Résumé des échanges anciens, repris dans le prompt (voir tutor/summaries.py).")
+    summarized_log_id = models.PositiveBigIntegerField(default=0, help_text="Dernier échange (InteractionLog.id) intégré au résumé.")
 
     class Meta:
         unique_together = ('learner', 'concept') # Un seul enregistrement par apprenant et par concept
+        indexes = [
+            # Concept en cours le plus ancien d'un apprenant (voir TutorService) :
+            # l'index est lu dans l'ordre de last_interaction_at, sans tri, et le
+            # filtre sur le score est évalué dans l'index, sans lire la table
+            models.Index(fields=['learner', 'last_interaction_at', 'mastery_score'], name='progress_next_concept_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.learner.user.username}'s progress on {self.concept.name}"
+
+class InteractionLog(models.Model):
+    """
+    Journal en ajout seul des échanges apprenant/tuteur.
+    Chaque tour de conversation est une ligne : l'écriture reste un simple INSERT,
+    quelle que soit la longueur de l'historique.
+    """
+    learner = models.ForeignKey(LearnerProfile, on_delete=models.CASCADE, related_name='interaction_logs')
+    concept = models.ForeignKey(Concept, on_delete=models.CASCADE, related_name='interaction_logs')
+    user_message = models.TextField()
+    tutor_response = models.TextField()
+    score = models.FloatField(null=True, blank=True, help_text="Note de la réponse (0.0 à 1.0) donnée par le LLM, si la notation est active.")
+    created_at = models.DateTimeField(default=timezone.now)
+    # Identifiant attribué à la création de l'échange, avant son écriture par la
+    # file de tâches : une écriture rejouée ne crée pas de doublon (vide pour les
+    # échanges plus anciens que ce champ)
+    uid = models.UUIDField(default=uuid.uuid4, null=True, unique=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Sert à relire les N derniers échanges d'un apprenant sur un concept
+            models.Index(fields=['learner', 'concept', 'created_at'], name='interaction_log_recent_idx'),
+            # Sert à retrouver les réponses d'un concept pas encore notées
+            models.Index(fields=['concept', 'score'], name='interaction_log_grading_idx'),
+        ]
+
+    def as_turn(self):
+        """
+        Représentation d'un tour, au format historique {"user": ..., "tutor": ...}.
+        """
+        return {"user": self.user_message, "tutor": self.tutor_response}
 
     def __str__(self):
-        return f"{self.learner.user.username}'s progress on {self.concept.name}"
\ No newline at end of file
+        return f"{self.learner} on {self.concept.name} at {self.created_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,82 @@
+"""
+Création d'apprenants en masse (rentrée, import d'une classe entière).
+
+`User.objects.create_user` coûte, par apprenant, un hachage de mot de passe
+(volontairement lent), un INSERT, le signal qui crée le profil et un INSERT de
+token. Ici, chaque lot d'apprenants est créé en trois INSERT groupés (utilisateurs,
+profils, tokens) dans une transaction, et le mot de passe commun éventuel n'est
+haché qu'une fois.
+"""
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from .models import LearnerProfile
+
+BATCH_SIZE = 1000
+
+USER_FIELDS = ('email', 'first_name', 'last_name')
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def provision_learners(records, password=None, batch_size=BATCH_SIZE):
+    """
+    Crée les utilisateurs décrits par `records` ({"username": ..., et en option
+    "email", "first_name", "last_name"}), avec leur profil et leur token.
+
+    Sans `password`, les comptes n'ont pas de mot de passe utilisable : les
+    apprenants s'authentifient par token. Les noms d'utilisateur déjà pris sont ignorés.
+    Retourne {username: clé du token} pour les comptes créés.
+    """
+    # Le même hachage pour tous : calculé une fois au lieu d'une fois par compte
+    password_hash = make_password(password) # None donne un mot de passe inutilisable
+
+    records = list({record['username']: record for record in records}.values())
+    tokens = {}
+    for batch in _chunks(records, batch_size):
+        usernames = [record['username'] for record in batch]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        new_records = [record for record in batch if record['username'] not in existing]
+        if not new_records:
+            continue
+
+        with transaction.atomic():
+            User.objects.bulk_create([
+                User(
+                    username=record['username'],
+                    password=password_hash,
+                    **{field: record.get(field) or '' for field in USER_FIELDS},
+                )
+                for record in new_records
+            ])
+            # bulk_create ne renvoie pas les id sous MySQL : on les relit
+            user_ids = dict(
+                User.objects.filter(username__in=[record['username'] for record in new_records])
+                .values_list('username', 'id')
+            )
+            LearnerProfile.objects.bulk_create([
+                LearnerProfile(user_id=user_id) for user_id in user_ids.values()
+            ])
+            batch_tokens = {username: Token.generate_key() for username in user_ids}
+            Token.objects.bulk_create([
+                Token(key=key, user_id=user_ids[username]) for username, key in batch_tokens.items()
+            ])
+        tokens.update(batch_tokens)
+    return tokens
+
+
+def create_missing_profiles(batch_size=BATCH_SIZE):
+    """
+    Crée les profils des utilisateurs qui n'en ont pas (comptes créés en masse
+    sans passer par `provision_learners`). Retourne le nombre de profils créés.
+    """
+    user_ids = list(User.objects.filter(learnerprofile__isnull=True).values_list('id', flat=True))
+    LearnerProfile.objects.bulk_create(
+        [LearnerProfile(user_id=user_id) for user_id in user_ids], batch_size=batch_size
+    )
+    return len(user_ids)
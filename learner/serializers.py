@@ -14,4 +14,59 @@ class InteractionOutputSerializer(serializers.Serializer):
     """
     tutor_response = serializers.CharField()
     current_concept_name = serializers.CharField()
-    mastery_score = serializers.FloatField()
\ No newline at end of file
+    mastery_score = serializers.FloatField()
+
+class BatchInteractionItemSerializer(serializers.Serializer):
+    """
+    Un message d'un lot. `learner` (nom d'utilisateur) permet à un enseignant
+    d'envoyer les messages de ses apprenants ; par défaut, l'utilisateur connecté.
+    """
+    message = serializers.CharField(max_length=1000)
+    learner = serializers.CharField(max_length=150, required=False)
+
+class BatchInteractionInputSerializer(serializers.Serializer):
+    """
+    Valide un lot de messages (synchronisation hors ligne, classe entière...).
+    """
+    interactions = serializers.ListField(
+        child=BatchInteractionItemSerializer(), min_length=1, max_length=100
+    )
+
+class BatchInteractionResultSerializer(InteractionOutputSerializer):
+    """
+    Résultat d'un message du lot ; `error` est renseigné si le tuteur n'a pas pu répondre.
+    """
+    learner = serializers.CharField()
+    tutor_response = serializers.CharField(required=False)
+    current_concept_name = serializers.CharField(required=False)
+    mastery_score = serializers.FloatField(required=False)
+    error = serializers.CharField(required=False)
+
+
+class ProgressSerializer(serializers.Serializer):
+    """
+    Une ligne de progression, pour les tableaux de bord.
+    Les noms viennent des jointures de la requête : aucune lecture par ligne.
+    """
+    id = serializers.IntegerField()
+    learner = serializers.CharField(source='learner.user.username')
+    concept = serializers.CharField(source='concept.slug')
+    concept_name = serializers.CharField(source='concept.name')
+    skill = serializers.CharField(source='concept.skill.slug')
+    skill_name = serializers.CharField(source='concept.skill.name')
+    mastery_score = serializers.FloatField()
+    last_interaction_at = serializers.DateTimeField()
+
+class SkillMasterySerializer(serializers.Serializer):
+    """
+    Maîtrise agrégée sur tout le sous-arbre d'un Skill (lui et ses descendants).
+    `mastery` est la moyenne sur tous les (apprenant, concept) du sous-arbre, les
+    concepts jamais vus comptant pour 0.
+    """
+    slug = serializers.CharField()
+    name = serializers.CharField()
+    parent = serializers.CharField(allow_null=True)
+    level = serializers.IntegerField()
+    concepts = serializers.IntegerField()
+    mastery = serializers.FloatField()
+    mastered = serializers.IntegerField()
@@ -1,19 +1,42 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .authentication import token_cache
 from .models import LearnerProfile
 
+# Note : les créations en masse (bulk_create) n'envoient pas de signaux ; elles
+# passent par learner.provisioning, qui crée aussi les profils.
+
 @receiver(post_save, sender=User)
 def create_learner_profile(sender, instance, created, **kwargs):
     """
     Crée automatiquement un LearnerProfile chaque fois qu'un nouvel User est créé.
+    (Le profil n'a aucun champ qui dépende de l'utilisateur : rien à faire aux
+    sauvegardes suivantes.)
     """
     if created:
         LearnerProfile.objects.create(user=instance)
 
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    """
+    Un token supprimé ou régénéré ne doit plus authentifier personne.
+    """
+    token_cache.invalidate_token(instance.key)
+    token_cache.invalidate_user(instance.user_id)
+
 @receiver(post_save, sender=User)
-def save_learner_profile(sender, instance, **kwargs):
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, update_fields=None, **kwargs):
     """
-    Sauvegarde le profil associé à l'utilisateur.
+    Utilisateur désactivé, renommé ou supprimé : son entrée en cache est périmée.
     """
-    instance.learnerprofile.save()
\ No newline at end of file
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return # simple connexion : rien de ce qui est en cache n'a changé
+    token_cache.invalidate_user(instance.id)
+
+@receiver(post_delete, sender=LearnerProfile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.user_id)
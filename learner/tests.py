@@ -1,3 +1,456 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from expert.models import Concept, Skill
+from tutor.inflight import learner_guard
+from tutor.llm_client import LLMRateLimited
+from tutor.response_cache import get_response_cache
+from tutor.services import TutorService
+from tutor.testing import FakeLLMClient, use_fake_llm_client
+
+from .archive import (
+    ArchiveError, archivable_logs, archive_interactions, get_retention_settings, open_archive, restore_interactions,
+)
+from .authentication import CachedTokenAuthentication, TokenCache, get_learner_profile, token_cache
+from .models import InteractionLog, LearnerProfile, LearnerProgress
+from .provisioning import provision_learners
+
+
+@use_fake_llm_client()
+class TutorInteractionStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        self.user = User.objects.create_user("alice", password="password123")
+        self.token = Token.objects.create(user=self.user)
+
+    async def test_stream_sends_tokens_then_persists_progress(self):
+        response = await self.async_client.post(
+            "/api/learner/interact/stream/",
+            {"message": "Bonjour"},
+            content_type="application/json",
+            headers={"Authorization": f"Token {self.token.key}"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+
+        self.assertIn("event: token", body)
+        self.assertTrue(body.rstrip().split("\n\n")[-1].startswith("event: done"))
+        progress = await LearnerProgress.objects.aget(learner__user=self.user)
+        self.assertAlmostEqual(progress.mastery_score, 0.1)
+        self.assertEqual(await InteractionLog.objects.filter(learner__user=self.user).acount(), 1)
+
+    async def test_guard_is_released_when_stream_is_never_read(self):
+        def post():
+            return self.async_client.post(
+                "/api/learner/interact/stream/",
+                {"message": "Bonjour"},
+                content_type="application/json",
+                headers={"Authorization": f"Token {self.token.key}"},
+            )
+
+        abandoned = await post()
+        self.assertEqual((await post()).status_code, 409)
+
+        # Le client est parti avant le premier morceau : le serveur ferme la réponse
+        await sync_to_async(abandoned.close)()
+        self.assertEqual((await post()).status_code, 200)
+
+    async def test_stream_requires_token(self):
+        response = await self.async_client.post(
+            "/api/learner/interact/stream/",
+            {"message": "Bonjour"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class SplitInteractionHistoryMigrationTests(TransactionTestCase):
+    """
+    Vérifie que la migration 0003 recopie les anciens blobs JSON dans InteractionLog.
+    """
+    migrate_from = [('expert', '0002_populate_initial_concepts'), ('learner', '0002_interactionlog')]
+    migrate_to = [('learner', '0004_remove_learnerprogress_interaction_history')]
+
+    def tearDown(self):
+        # Revenir au schéma courant pour les autres tests
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_history_blob_is_split_into_rows(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        old_apps = executor.loader.project_state(self.migrate_from).apps
+        OldUser = old_apps.get_model('auth', 'User')
+        OldProfile = old_apps.get_model('learner', 'LearnerProfile')
+        OldProgress = old_apps.get_model('learner', 'LearnerProgress')
+        OldSkill = old_apps.get_model('expert', 'Skill')
+        OldConcept = old_apps.get_model('expert', 'Concept')
+
+        # Modèles historiques : les champs MPTT ne sont pas calculés, on les renseigne
+        skill = OldSkill.objects.create(name="Migration", tree_id=1000, lft=1, rght=2, level=0)
+        concept = OldConcept.objects.create(skill=skill, name="Historique", explanation="...")
+        profile = OldProfile.objects.create(user=OldUser.objects.create(username="bob"))
+        OldProgress.objects.create(
+            learner=profile,
+            concept=concept,
+            interaction_history=[
+                {"user": "premier", "tutor": "réponse 1"},
+                {"user": "second", "tutor": "réponse 2"},
+            ],
+        )
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.migrate_to)
+        new_apps = executor.loader.project_state(self.migrate_to).apps
+        NewLog = new_apps.get_model('learner', 'InteractionLog')
+
+        messages = list(NewLog.objects.order_by('created_at', 'id').values_list('user_message', flat=True))
+        self.assertEqual(messages, ["premier", "second"])
+
+
+@use_fake_llm_client()
+class BatchInteractionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        self.teacher = User.objects.create_user("prof", is_staff=True)
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+
+    def post_batch(self, user, interactions):
+        token = Token.objects.get_or_create(user=user)[0]
+        return self.client.post(
+            "/api/learner/interact/batch/", {"interactions": interactions},
+            content_type="application/json", HTTP_AUTHORIZATION=f"Token {token.key}",
+        )
+
+    def test_teacher_syncs_several_learners_in_order(self):
+        response = self.post_batch(self.teacher, [
+            {"learner": "alice", "message": "Bonjour"},
+            {"learner": "bob", "message": "Salut"},
+            {"learner": "alice", "message": "x vaut 5"},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([result["learner"] for result in results], ["alice", "bob", "alice"])
+        self.assertAlmostEqual(results[2]["mastery_score"], 0.2)
+        alice_messages = InteractionLog.objects.filter(learner__user=self.alice).order_by('id')
+        self.assertEqual([log.user_message for log in alice_messages], ["Bonjour", "x vaut 5"])
+
+    def test_learner_cannot_send_for_someone_else(self):
+        response = self.post_batch(self.alice, [{"learner": "bob", "message": "Bonjour"}])
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(InteractionLog.objects.exists())
+
+
+@use_fake_llm_client()
+class ConcurrentInteractionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        self.user = User.objects.create_user("alice")
+        self.token = Token.objects.create(user=self.user)
+        self.profile = LearnerProfile.objects.get(user=self.user)
+
+    def post(self, path="/api/learner/interact/"):
+        return self.client.post(
+            path, {"message": "Bonjour"}, content_type="application/json",
+            HTTP_AUTHORIZATION=f"Token {self.token.key}",
+        )
+
+    def test_second_message_in_flight_is_rejected(self):
+        with learner_guard(self.profile.id):
+            self.assertEqual(self.post().status_code, 409)
+            self.assertEqual(self.post("/api/learner/interact/stream/").status_code, 409)
+        self.assertFalse(InteractionLog.objects.exists())
+
+        # La garde est levée une fois le premier message traité
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(self.post().status_code, 200)
+
+    def test_parallel_updates_are_not_lost(self):
+        first, second = TutorService(self.profile), TutorService(self.profile)
+        concept, progress_a, _, _ = first._prepare_interaction("Bonjour")
+        progress_b = second._get_or_create_progress(concept)
+
+        # Les deux ont lu le même score ; chacun enregistre son échange
+        first._update_progress(progress_a, "un", "réponse")
+        second._update_progress(progress_b, "deux", "réponse")
+
+        progress_a.refresh_from_db()
+        self.assertAlmostEqual(progress_a.mastery_score, 0.2)
+        self.assertEqual(InteractionLog.objects.filter(learner=self.profile).count(), 2)
+
+    def test_llm_quota_is_reported_with_retry_after(self):
+        class RateLimitedClient(FakeLLMClient):
+            def generate_response(self, prompt):
+                raise LLMRateLimited("quota", retry_after=7)
+
+        with mock.patch("tutor.services.get_llm_client", RateLimitedClient):
+            response = self.post()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "7")
+        self.assertFalse(InteractionLog.objects.exists())
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user("alice")
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def test_warm_cache_resolves_learner_without_query(self):
+        with self.assertNumQueries(1):
+            self.auth.authenticate_credentials(self.token.key)
+
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+            profile = get_learner_profile(user)
+            self.assertEqual(profile.user.username, "alice")
+
+    def test_rotated_token_is_rejected(self):
+        self.auth.authenticate_credentials(self.token.key)
+        self.token.delete()
+        Token.objects.create(user=self.user)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_deactivated_user_is_rejected(self):
+        self.auth.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_evicted_entries_leave_nothing_behind(self):
+        cache = TokenCache({'MAX_ENTRIES': 4, 'TTL': 300})
+        for i in range(20):
+            user = User.objects.create_user(f"learner{i}")
+            cache.set(f"key{i}", (None, user, None))
+        self.assertEqual(len(cache._entries._entries), 4)
+
+        # Invalider un utilisateur dont l'entrée a été évincée reste sans effet
+        cache.invalidate_user(User.objects.get(username="learner0").id)
+        self.assertIsNotNone(cache.get("key19"))
+        cache.invalidate_user(User.objects.get(username="learner19").id)
+        self.assertIsNone(cache.get("key19"))
+
+
+class ProvisioningTests(TestCase):
+    def test_learners_are_created_in_bulk(self):
+        User.objects.create_user("existing")
+        records = [{"username": f"student{i}", "email": f"s{i}@example.com"} for i in range(50)]
+
+        # Par lot : noms déjà pris, 3 INSERT groupés, relecture des id (+ point de sauvegarde)
+        with self.assertNumQueries(2 * 7):
+            tokens = provision_learners(records + [{"username": "existing"}], batch_size=30)
+
+        self.assertEqual(len(tokens), 50)
+        self.assertEqual(LearnerProfile.objects.filter(user__username__startswith="student").count(), 50)
+        self.assertEqual(Token.objects.get(key=tokens["student7"]).user.email, "s7@example.com")
+        self.assertFalse(User.objects.get(username="student7").has_usable_password())
+
+    def test_user_save_does_not_touch_profile(self):
+        user = User.objects.create_user("alice")
+        user.first_name = "Alice"
+        with self.assertNumQueries(1):
+            user.save()
+
+
+class ProgressDashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user("prof", is_staff=True)
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.algebra = Skill.objects.create(name="Algèbre")
+        self.equations = Skill.objects.create(name="Équations", parent=self.algebra)
+        self.variables = Concept.objects.create(skill=self.algebra, name="Variable", explanation="...")
+        self.linear = Concept.objects.create(skill=self.equations, name="Équation linéaire", explanation="...")
+        for user, concept, score in [
+            (self.alice, self.variables, 1.0), (self.alice, self.linear, 0.5), (self.bob, self.linear, 0.9),
+        ]:
+            LearnerProgress.objects.create(learner=user.learnerprofile, concept=concept, mastery_score=score)
+        self.tokens = {user: Token.objects.create(user=user).key for user in (self.teacher, self.alice, self.bob)}
+
+    def get(self, user, url, **params):
+        return self.client.get(url, params, HTTP_AUTHORIZATION=f"Token {self.tokens[user]}")
+
+    def test_learner_sees_own_progress(self):
+        response = self.get(self.alice, "/api/learner/progress/")
+        self.assertEqual(response.status_code, 200)
+        rows = response.json()["results"]
+        self.assertEqual([row["concept"] for row in rows], [self.variables.slug, self.linear.slug])
+        self.assertEqual({row["learner"] for row in rows}, {"alice"})
+
+    def test_only_teachers_see_other_learners(self):
+        self.assertEqual(self.get(self.alice, "/api/learner/progress/", learner="bob").status_code, 403)
+        response = self.get(self.teacher, "/api/learner/progress/", learner=["alice", "bob"], skill=self.equations.slug)
+        self.assertEqual(
+            [(row["learner"], row["concept"]) for row in response.json()["results"]],
+            [("alice", self.linear.slug), ("bob", self.linear.slug)],
+        )
+
+    def test_pages_follow_cursor(self):
+        response = self.get(self.teacher, "/api/learner/progress/", learner=["alice", "bob"], page_size=2)
+        page = response.json()
+        self.assertEqual(len(page["results"]), 2)
+        with self.assertNumQueries(2): # profils puis la page, rien par ligne (token en cache)
+            next_page = self.client.get(page["next"], HTTP_AUTHORIZATION=response.request["HTTP_AUTHORIZATION"]).json()
+        self.assertEqual([row["learner"] for row in next_page["results"]], ["bob"])
+        self.assertIsNone(next_page["next"])
+
+    def test_skill_mastery_aggregates_subtrees(self):
+        self.get(self.teacher, "/api/learner/progress/skills/") # met le token en cache
+        with self.assertNumQueries(2): # profils, puis une seule requête pour tous les agrégats
+            response = self.get(self.teacher, "/api/learner/progress/skills/", learner=["alice", "bob"])
+        skills = {skill["slug"]: skill for skill in response.json()["skills"] if skill["slug"] in ("algebre", "equations")}
+
+        # Algèbre couvre ses concepts et ceux d'Équations : (1.0 + 0.5 + 0.9) / (2 concepts x 2 apprenants)
+        self.assertEqual(skills["algebre"]["concepts"], 2)
+        self.assertAlmostEqual(skills["algebre"]["mastery"], 0.6)
+        self.assertEqual(skills["algebre"]["mastered"], 2)
+        self.assertAlmostEqual(skills["equations"]["mastery"], 0.7)
+        self.assertEqual(skills["equations"]["parent"], "algebre")
+
+
+class LearnerProgressQueryPlanTests(TestCase):
+    """
+    Vérifie que les requêtes de TutorService passent par les bons index.
+    """
+    def setUp(self):
+        if connection.vendor not in ("sqlite", "mysql"):
+            self.skipTest("Plans vérifiés pour SQLite et MySQL/MariaDB uniquement.")
+        self.profile = LearnerProfile.objects.get(user=User.objects.create_user("alice"))
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        # Ni tri en mémoire (SQLite) ni filesort (MySQL)
+        self.assertNotIn("TEMP B-TREE", plan)
+        self.assertNotIn("filesort", plan)
+
+    def test_next_concept_lookup_avoids_sorting(self):
+        queryset = LearnerProgress.objects.filter(
+            learner=self.profile, mastery_score__lt=0.9
+        ).order_by('last_interaction_at')[:1]
+        self.assertUsesIndex(queryset, "progress_next_concept_idx")
+
+    def test_recent_history_uses_log_index(self):
+        queryset = InteractionLog.objects.filter(
+            learner=self.profile, concept_id=1
+        ).order_by('-created_at', '-id')[:3]
+        self.assertUsesIndex(queryset, "interaction_log_recent_idx")
+
+    @use_fake_llm_client()
+    def test_interaction_updates_last_interaction_at(self):
+        cache.clear()
+        get_response_cache().clear()
+        TutorService(self.profile).handle_interaction("Bonjour")
+        progress = LearnerProgress.objects.get(learner=self.profile)
+        first_seen = progress.last_interaction_at
+
+        TutorService(self.profile).handle_interaction("Encore")
+        progress.refresh_from_db()
+        self.assertGreater(progress.last_interaction_at, first_seen)
+
+
+class InteractionArchiveTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.alice = User.objects.create_user("alice").learnerprofile
+        skill = Skill.objects.create(name="Algèbre")
+        self.mastered = Concept.objects.create(skill=skill, name="Variable", explanation="...")
+        self.current = Concept.objects.create(skill=skill, name="Équation", explanation="...")
+        LearnerProgress.objects.create(
+            learner=self.alice, concept=self.mastered, mastery_score=0.95,
+            last_interaction_at=self.now - timedelta(days=40),
+        )
+        LearnerProgress.objects.create(learner=self.alice, concept=self.current, mastery_score=0.4)
+        for days in (42, 41, 40):
+            InteractionLog.objects.create(
+                learner=self.alice, concept=self.mastered, user_message=f"Question {days}",
+                tutor_response="Réponse", score=0.9, created_at=self.now - timedelta(days=days),
+            )
+        self.old = InteractionLog.objects.create(
+            learner=self.alice, concept=self.current, user_message="Il y a longtemps",
+            created_at=self.now - timedelta(days=400),
+        )
+        # Les HISTORY_WINDOW (3) derniers échanges de la conversation en cours
+        self.recent = [
+            InteractionLog.objects.create(
+                learner=self.alice, concept=self.current, user_message=f"Et ça ? {days}",
+                created_at=self.now - timedelta(days=days),
+            )
+            for days in (390, 380, 0)
+        ]
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.options = {**get_retention_settings(), 'ARCHIVE_DIR': self.directory, 'CHUNK_SIZE': 2}
+
+    def test_archive_then_restore(self):
+        kept_ids = [log.id for log in self.recent]
+        archived_ids = set(InteractionLog.objects.exclude(pk__in=kept_ids).values_list('id', flat=True))
+        self.assertEqual(archive_interactions(self.options, now=self.now, dry_run=True)[0], 4)
+
+        archived, files = archive_interactions(self.options, now=self.now)
+
+        self.assertEqual(archived, 4)
+        self.assertEqual(list(InteractionLog.objects.order_by('id').values_list('id', flat=True)), kept_ids)
+        day = (self.now - timedelta(days=41)).date().isoformat()
+        self.assertIn(self.directory / f"date={day}", {path.parent for path in files})
+        with open_archive(files[0]) as stream:
+            self.assertEqual(json.loads(stream.readline())["learner"], "alice")
+
+        self.assertEqual(restore_interactions([self.directory]), (4, 0))
+        self.assertEqual(set(InteractionLog.objects.exclude(pk__in=kept_ids).values_list('id', flat=True)), archived_ids)
+        self.assertEqual(InteractionLog.objects.get(pk=self.old.pk).created_at, self.old.created_at)
+        # Restaurer deux fois ne duplique rien
+        restore_interactions([self.directory])
+        self.assertEqual(InteractionLog.objects.count(), 7)
+
+    def test_returning_learner_keeps_the_turns_the_tutor_reads(self):
+        bob = User.objects.create_user("bob").learnerprofile
+        LearnerProgress.objects.create(learner=bob, concept=self.current, mastery_score=0.2)
+        logs = [
+            InteractionLog.objects.create(
+                learner=bob, concept=self.current, user_message=f"Message {days}",
+                created_at=self.now - timedelta(days=days),
+            )
+            for days in (500, 450, 420, 400)
+        ]
+        archivable = set(archivable_logs(self.now, self.options).filter(learner=bob).values_list('id', flat=True))
+        self.assertEqual(archivable, {logs[0].id})
+
+        # Avec les résumés, un échange pas encore résumé reste aussi en base
+        with override_settings(TUTOR_SUMMARY={'ENABLED': True}):
+            self.assertFalse(archivable_logs(self.now, self.options).filter(learner=bob).exists())
+            LearnerProgress.objects.filter(learner=bob).update(summarized_log_id=logs[0].id)
+            self.assertTrue(archivable_logs(self.now, self.options).filter(pk=logs[0].id).exists())
+
+    def test_unknown_compression_is_rejected(self):
+        with self.assertRaises(ArchiveError):
+            archive_interactions({**self.options, 'COMPRESSION': 'lz4'}, now=self.now)
+        self.assertEqual(InteractionLog.objects.count(), 7)
@@ -1,6 +1,12 @@
 from django.urls import path
-from .views import TutorInteractionView
+from .views import (
+    BatchInteractionView, ProgressListView, SkillMasteryView, TutorInteractionView, tutor_interaction_stream,
+)
 
 urlpatterns = [
     path('interact/', TutorInteractionView.as_view(), name='tutor-interaction'),
-]
\ No newline at end of file
+    path('interact/stream/', tutor_interaction_stream, name='tutor-interaction-stream'),
+    path('interact/batch/', BatchInteractionView.as_view(), name='tutor-interaction-batch'),
+    path('progress/', ProgressListView.as_view(), name='learner-progress'),
+    path('progress/skills/', SkillMasteryView.as_view(), name='learner-skill-mastery'),
+]
@@ -1,11 +1,42 @@
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import AuthenticationFailed, NotFound, PermissionDenied
+from rest_framework.generics import ListAPIView
+from rest_framework.pagination import CursorPagination
 from rest_framework import status
 
-from .serializers import InteractionInputSerializer, InteractionOutputSerializer
-from .models import LearnerProfile
-from tutor.services import TutorService # On importe le cerveau !
+from .serializers import (
+    BatchInteractionInputSerializer, BatchInteractionResultSerializer,
+    InteractionInputSerializer, InteractionOutputSerializer,
+    ProgressSerializer, SkillMasterySerializer,
+)
+from .authentication import CachedTokenAuthentication, get_learner_profile
+from .models import LearnerProfile, LearnerProgress
+from expert.models import Concept, Skill
+from tutor.inflight import BUSY_MESSAGE, LearnerBusy, acquire, learner_guard, release_once
+from tutor.llm_client import LLMError, LLMRateLimited, RATE_LIMITED_MESSAGE, UNAVAILABLE_MESSAGE
+from tutor.services import MASTERY_THRESHOLD, TutorService # On importe le cerveau !
+
+logger = logging.getLogger(__name__)
+
+def _rate_limited_response(retry_after):
+    """
+    429 : le quota d'appels au LLM est atteint ; le client peut réessayer après Retry-After.
+    """
+    response = Response({"detail": RATE_LIMITED_MESSAGE}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response['Retry-After'] = str(retry_after)
+    return response
+
 
 class TutorInteractionView(APIView):
     permission_classes = [IsAuthenticated]
@@ -16,20 +47,300 @@ class TutorInteractionView(APIView):
         if not input_serializer.is_valid():
             return Response(input_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        # 2. Récupérer le profil de l'apprenant
-        try:
-            learner_profile = LearnerProfile.objects.get(user=request.user)
-        except LearnerProfile.DoesNotExist:
-            # Créer le profil s'il n'existe pas
-            learner_profile = LearnerProfile.objects.create(user=request.user)
+        # 2. Récupérer le profil de l'apprenant (déjà chargé par l'authentification)
+        learner_profile = get_learner_profile(request.user)
 
         # 3. Déléguer toute la logique au module Tutor
         user_message = input_serializer.validated_data['message']
         
         # Le service Tutor prend le contrôle
         tutor_service = TutorService(learner_profile)
-        response_data = tutor_service.handle_interaction(user_message)
+        try:
+            # Un seul message à la fois par apprenant
+            with learner_guard(learner_profile.id):
+                response_data = tutor_service.handle_interaction(user_message)
+        except LearnerBusy:
+            return Response({"detail": BUSY_MESSAGE}, status=status.HTTP_409_CONFLICT)
+        except LLMRateLimited as e:
+            return _rate_limited_response(e.retry_after)
+        except LLMError:
+            logger.warning("LLM error during interaction", exc_info=True)
+            return Response({"detail": UNAVAILABLE_MESSAGE}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
         # 4. Formater et renvoyer la réponse
         output_serializer = InteractionOutputSerializer(response_data)
-        return Response(output_serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(output_serializer.data, status=status.HTTP_200_OK)
+
+
+class BatchInteractionView(APIView):
+    """
+    Traite plusieurs messages en une requête (synchronisation hors ligne, classe).
+    Seul un membre de l'équipe (`is_staff`) peut envoyer des messages pour d'autres apprenants.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        # 1. Valider l'entrée
+        input_serializer = BatchInteractionInputSerializer(data=request.data)
+        if not input_serializer.is_valid():
+            return Response(input_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        items = input_serializer.validated_data['interactions']
+        usernames = {item.get('learner', request.user.username) for item in items}
+
+        if usernames != {request.user.username} and not request.user.is_staff:
+            return Response(
+                {"detail": "Seul un enseignant peut envoyer des messages pour d'autres apprenants."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        # 2. Récupérer tous les profils en une requête
+        others = usernames - {request.user.username}
+        profiles = {
+            profile.user.username: profile
+            for profile in LearnerProfile.objects.select_related('user').filter(user__username__in=others)
+        } if others else {}
+        if request.user.username in usernames:
+            profiles[request.user.username] = get_learner_profile(request.user)
+        unknown = sorted(usernames - profiles.keys())
+        if unknown:
+            return Response(
+                {"detail": f"Apprenants inconnus : {', '.join(unknown)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # 3. Déléguer le lot au module Tutor
+        learners = [profiles[item.get('learner', request.user.username)] for item in items]
+        try:
+            with learner_guard(*{profile.id for profile in learners}):
+                results = TutorService.handle_batch(
+                    [(profile, item['message']) for profile, item in zip(learners, items)]
+                )
+        except LearnerBusy:
+            return Response({"detail": BUSY_MESSAGE}, status=status.HTTP_409_CONFLICT)
+
+        # 4. Formater les résultats, dans l'ordre des messages reçus
+        rate_limited = [result for result in results if isinstance(result, LLMRateLimited)]
+        if len(rate_limited) == len(results):
+            # Rien n'a pu être traité : le client doit renvoyer tout le lot plus tard
+            return _rate_limited_response(max(result.retry_after for result in rate_limited))
+        output = []
+        for profile, result in zip(learners, results):
+            if isinstance(result, LLMRateLimited):
+                result = {"error": RATE_LIMITED_MESSAGE}
+            elif isinstance(result, LLMError):
+                logger.warning("LLM error for %s in batch: %s", profile.user.username, result, exc_info=result)
+                result = {"error": UNAVAILABLE_MESSAGE}
+            output.append(BatchInteractionResultSerializer({"learner": profile.user.username, **result}).data)
+        response = Response({"results": output}, status=status.HTTP_200_OK)
+        if rate_limited:
+            response['Retry-After'] = str(max(result.retry_after for result in rate_limited))
+        return response
+
+
+def _requested_learner_ids(request):
+    """
+    Apprenants demandés par `?learner=<nom>` (répétable) ; par défaut, l'utilisateur connecté.
+    Seul un membre de l'équipe (`is_staff`) peut consulter d'autres apprenants.
+    """
+    usernames = set(request.query_params.getlist('learner')) or {request.user.username}
+    if usernames == {request.user.username}:
+        return [get_learner_profile(request.user).id]
+    if not request.user.is_staff:
+        raise PermissionDenied("Seul un enseignant peut consulter la progression d'autres apprenants.")
+    learner_ids = list(
+        LearnerProfile.objects.filter(user__username__in=usernames).values_list('id', flat=True)
+    )
+    if len(learner_ids) != len(usernames):
+        raise NotFound("Apprenant inconnu.")
+    return learner_ids
+
+
+def _subtree_filter(prefix=''):
+    """
+    Condition « le Skill `prefix` est dans le sous-arbre du Skill de la requête
+    externe » : plage lft/rght de MPTT, évaluée en SQL.
+    """
+    return Q(**{
+        f'{prefix}tree_id': OuterRef('tree_id'),
+        f'{prefix}lft__gte': OuterRef('lft'),
+        f'{prefix}lft__lte': OuterRef('rght'),
+    })
+
+
+class ProgressPagination(CursorPagination):
+    """
+    Pagination par curseur (keyset) : une page profonde coûte autant que la première.
+    """
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class ProgressListView(ListAPIView):
+    """
+    Progression par concept d'un ou plusieurs apprenants (`?learner=`), limitée
+    si besoin au sous-arbre d'un Skill (`?skill=<slug>`).
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = ProgressSerializer
+    pagination_class = ProgressPagination
+
+    def get_queryset(self):
+        queryset = (
+            LearnerProgress.objects
+            .filter(learner_id__in=_requested_learner_ids(self.request))
+            .select_related('learner__user', 'concept__skill')
+            # Seulement les colonnes affichées : ni explication ni description
+            .only(
+                'id', 'mastery_score', 'last_interaction_at', 'learner__user__username',
+                'concept__slug', 'concept__name', 'concept__skill__slug', 'concept__skill__name',
+            )
+        )
+        skill_slug = self.request.query_params.get('skill')
+        if skill_slug:
+            skill = Skill.objects.filter(slug=skill_slug).values('tree_id', 'lft', 'rght').first()
+            if skill is None:
+                raise NotFound("Compétence inconnue.")
+            queryset = queryset.filter(
+                concept__skill__tree_id=skill['tree_id'],
+                concept__skill__lft__gte=skill['lft'],
+                concept__skill__lft__lte=skill['rght'],
+            )
+        return queryset
+
+
+class SkillMasteryView(APIView):
+    """
+    Maîtrise agrégée par sous-arbre de Skill, pour un ou plusieurs apprenants
+    (`?learner=`), en une seule requête SQL.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        learner_ids = _requested_learner_ids(request)
+
+        # Sous-requêtes corrélées sur la plage lft/rght de chaque Skill
+        concepts = Concept.objects.filter(_subtree_filter('skill__')).order_by().values('skill__tree_id')
+        progress = LearnerProgress.objects.filter(
+            _subtree_filter('concept__skill__'), learner_id__in=learner_ids
+        ).order_by().values('concept__skill__tree_id')
+        skills = Skill.objects.order_by('tree_id', 'lft').annotate(
+            parent_slug=F('parent__slug'),
+            concept_count=Coalesce(Subquery(concepts.annotate(n=Count('id')).values('n')), 0),
+            mastery_sum=Coalesce(Subquery(progress.annotate(total=Sum('mastery_score')).values('total')), 0.0),
+            mastered_count=Coalesce(Subquery(
+                progress.filter(mastery_score__gte=MASTERY_THRESHOLD).annotate(n=Count('id')).values('n')
+            ), 0),
+        ).values('slug', 'name', 'parent_slug', 'level', 'concept_count', 'mastery_sum', 'mastered_count')
+
+        output = [
+            SkillMasterySerializer({
+                "slug": skill['slug'],
+                "name": skill['name'],
+                "parent": skill['parent_slug'],
+                "level": skill['level'],
+                "concepts": skill['concept_count'],
+                "mastery": (
+                    skill['mastery_sum'] / (skill['concept_count'] * len(learner_ids))
+                    if skill['concept_count'] else 0.0
+                ),
+                "mastered": skill['mastered_count'],
+            }).data
+            for skill in skills
+        ]
+        return Response({"learners": len(learner_ids), "skills": output}, status=status.HTTP_200_OK)
+
+
+class GuardedStreamingHttpResponse(StreamingHttpResponse):
+    """
+    Réponse en flux qui appelle `on_close` à sa fermeture par le serveur, même
+    si le flux n'a jamais été lu (client parti avant le premier morceau).
+    """
+    def __init__(self, *args, on_close, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._on_close = on_close
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._on_close()
+
+
+def _sse_event(event, data):
+    """
+    Formate un événement Server-Sent Events.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@csrf_exempt
+@require_POST
+async def tutor_interaction_stream(request):
+    """
+    Variante asynchrone (ASGI) de `TutorInteractionView` : la réponse du tuteur
+    est envoyée en Server-Sent Events au fur et à mesure de sa génération.
+
+    Événements émis :
+    - `token` : {"text": "..."} pour chaque morceau de réponse ;
+    - `done` : le même contenu que la réponse de `/interact/`, une fois la
+      progression enregistrée ;
+    - `error` : {"detail": "..."} si le LLM n'a pas pu répondre (rien n'est enregistré),
+      avec "retry_after" (secondes) si le quota d'appels au LLM est atteint.
+    """
+    # 1. Authentifier par token (DRF ne gère pas les vues asynchrones)
+    try:
+        user_auth = await sync_to_async(CachedTokenAuthentication().authenticate)(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({"detail": str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    if user_auth is None:
+        return JsonResponse(
+            {"detail": "Informations d'authentification non fournies."},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    user = user_auth[0]
+
+    # 2. Valider l'entrée de l'utilisateur
+    try:
+        payload = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"detail": "JSON invalide."}, status=status.HTTP_400_BAD_REQUEST)
+    input_serializer = InteractionInputSerializer(data=payload)
+    if not input_serializer.is_valid():
+        return JsonResponse(input_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    user_message = input_serializer.validated_data['message']
+
+    # 3. Récupérer (ou créer) le profil de l'apprenant
+    learner_profile = await sync_to_async(get_learner_profile)(user)
+    tutor_service = TutorService(learner_profile)
+
+    # 4. Un seul message à la fois par apprenant : la garde est posée avant
+    # d'envoyer les en-têtes, pour pouvoir répondre 409. Elle est levée à la fin
+    # du flux, ou à la fermeture de la réponse si le flux n'est jamais lu
+    try:
+        await sync_to_async(acquire)([learner_profile.id])
+    except LearnerBusy:
+        return JsonResponse({"detail": BUSY_MESSAGE}, status=status.HTTP_409_CONFLICT)
+    release_guard = release_once([learner_profile.id])
+
+    async def event_stream():
+        try:
+            async for event, data in tutor_service.astream_interaction(user_message):
+                if event == "token":
+                    yield _sse_event(event, {"text": data})
+                else:
+                    yield _sse_event(event, InteractionOutputSerializer(data).data)
+        except LLMRateLimited as e:
+            yield _sse_event("error", {"detail": RATE_LIMITED_MESSAGE, "retry_after": e.retry_after})
+        except LLMError:
+            logger.warning("LLM error during streamed interaction", exc_info=True)
+            yield _sse_event("error", {"detail": UNAVAILABLE_MESSAGE})
+        finally:
+            await sync_to_async(release_guard)()
+
+    response = GuardedStreamingHttpResponse(event_stream(), content_type="text/event-stream", on_close=release_guard)
+    response["Cache-Control"] = "no-cache"
+    # Empêche nginx de mettre la réponse en tampon
+    response["X-Accel-Buffering"] = "no"
+    return response
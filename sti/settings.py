@@ -59,6 +59,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'tutor.middleware.ServerTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'sti.urls'
@@ -87,7 +88,8 @@ WSGI_APPLICATION = 'sti.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        # DB_ENGINE permet par ex. d'utiliser SQLite pour les bancs d'essai hors ligne
+        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.mysql'),
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('DB_USER'),
         'PASSWORD': os.getenv('DB_PASSWORD'),
@@ -97,6 +99,19 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Le cache sert aux curseurs de programme des apprenants. En production avec
+# plusieurs processus, utiliser un cache partagé (ex: django.core.cache.backends.redis.RedisCache)
+# pour que les modifications du programme invalident tous les processus.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -142,9 +157,140 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'learner.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',   
     ]
 }
+
+
+# Cache token → utilisateur → profil de learner.authentication.CachedTokenAuthentication
+# (mémoire du processus, LRU). TTL : délai max avant qu'un autre processus voie un token révoqué
+
+LEARNER_AUTH_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 300,
+}
+
+
+# Cache des réponses du tuteur (ouvertures de leçon partagées entre apprenants)
+# BACKEND : 'tutor.response_cache.LocMemBackend' (mémoire du processus, LRU)
+#           ou 'tutor.response_cache.DjangoCacheBackend' (cache Django CACHE_ALIAS)
+
+TUTOR_RESPONSE_CACHE = {
+    'BACKEND': 'tutor.response_cache.LocMemBackend',
+    'TTL': 60 * 60 * 24,
+    'MAX_ENTRIES': 1000,
+    'CACHE_ALIAS': 'default',
+}
+
+
+# Client LLM partagé par le processus (voir tutor/llm_client.py)
+# BACKEND : 'tutor.llm_client.GeminiClient' (Google Gemini),
+#           'tutor.llm_client.StubBackend' (réponses locales déterministes, pour les tests de charge)
+#           ou 'tutor.llm_client.HTTPBackend' (service local, voir `manage.py llm_standin`)
+
+TUTOR_LLM = {
+    'BACKEND': os.getenv('LLM_BACKEND', 'tutor.llm_client.GeminiClient'),
+    'MODEL': 'gemini-2.0-flash',
+    'TIMEOUT': 30,
+    'MAX_CONCURRENCY': 16,
+    'ACQUIRE_TIMEOUT': 5,
+    'MAX_RETRIES': 3,
+    'STUB_LATENCY': float(os.getenv('LLM_STUB_LATENCY', '0')),
+    'STUB_TOKENS_PER_SECOND': float(os.getenv('LLM_STUB_TOKENS_PER_SECOND', '0')),
+    'HTTP_URL': os.getenv('LLM_HTTP_URL', 'http://127.0.0.1:8765/'),
+}
+
+
+# Ordonnanceur des appels au LLM (voir tutor/scheduler.py) : quotas par processus
+# (0 = sans limite), priorité aux échanges sur les tâches de fond, et réponse 429
+# (Retry-After) quand un échange devrait attendre plus de MAX_WAIT secondes
+
+TUTOR_SCHEDULER = {
+    'REQUESTS_PER_MINUTE': int(os.getenv('LLM_REQUESTS_PER_MINUTE', '1000')),
+    'TOKENS_PER_MINUTE': int(os.getenv('LLM_TOKENS_PER_MINUTE', '1000000')),
+    'RESPONSE_TOKENS': 150,
+    'MAX_WAIT': 3,
+    'BACKGROUND_RESERVE': 0.2,
+    'PAUSE_ON_RATE_LIMIT': 5,
+}
+
+# Taille des prompts envoyés au LLM (voir tutor/prompts.py), en tokens estimés
+# TOKEN_BUDGET : taille max du prompt ; au-delà, les anciens échanges sont raccourcis
+#                à TURN_MAX_TOKENS, puis omis
+
+TUTOR_PROMPT = {
+    'TOKEN_BUDGET': 1200,
+    'TURN_MAX_TOKENS': 80,
+}
+
+
+# File de tâches locale (voir tutor/task_queue.py) : écritures différées après la réponse
+# EAGER : exécute les tâches tout de suite, dans la requête (activé par le lanceur de tests)
+
+TUTOR_TASKS = {
+    'EAGER': False,
+    'WORKERS': 2,
+    'BATCH_SIZE': 100,
+    'BATCH_WAIT': 0.05,
+    'MAX_RETRIES': 3,
+}
+
+# Lanceur de tests : tâches exécutées dans le thread du test (voir tutor/testing.py)
+
+TEST_RUNNER = 'tutor.testing.TestRunner'
+
+
+# Notation des réponses par le LLM, en tâche de fond (voir tutor/grading.py)
+# ENABLED : remplace l'augmentation fixe du score (+0.1 par message) par la note du LLM
+
+TUTOR_GRADING = {
+    'ENABLED': os.getenv('TUTOR_GRADING_ENABLED', '0') == '1',
+    'MAX_ANSWERS_PER_REQUEST': 20,
+    'WEIGHT': 0.3,
+}
+
+
+# Résumé glissant des échanges anciens, repris dans le prompt (voir tutor/summaries.py)
+# FOLD_EVERY : nombre d'échanges sortis de la fenêtre à partir duquel le résumé est recalculé
+
+TUTOR_SUMMARY = {
+    'ENABLED': os.getenv('TUTOR_SUMMARY_ENABLED', '0') == '1',
+    'FOLD_EVERY': 3,
+    'MAX_TOKENS': 120,
+    'MAX_CONVERSATIONS_PER_REQUEST': 10,
+}
+
+# Index sémantique des concepts (voir tutor/retrieval.py), construit par `manage.py build_concept_index`
+# MIN_SCORE : similarité (cosinus) à partir de laquelle un message qui demande un concept y fait sauter
+# MARGIN : avance minimale du concept demandé sur le concept en cours
+# APPROXIMATE_FROM : nombre de concepts à partir duquel la recherche est approchée (IVF)
+
+TUTOR_RETRIEVAL = {
+    'INDEX_DIR': Path(os.getenv('TUTOR_INDEX_DIR', BASE_DIR / 'var' / 'concept_index')),
+    'DIMENSIONS': 256,
+    'MIN_SCORE': 0.35,
+    'MARGIN': 0.1,
+    'APPROXIMATE_FROM': 5000,
+    'PROBES': 8,
+}
+
+# Archivage des anciens échanges (voir learner/archive.py), par `manage.py archive_interactions` (cron)
+# ARCHIVE_DIR : hors du dépôt en production (TUTOR_ARCHIVE_DIR) ; var/ est ignoré par git
+# MASTERED_AFTER_DAYS : archive la conversation d'un concept maîtrisé, sans échange depuis ce nombre de jours
+# MAX_AGE_DAYS : archive tout échange plus ancien (None = jamais), sauf les derniers de chaque conversation
+# COMPRESSION : 'gzip', ou 'zstd' (paquet zstandard)
+
+TUTOR_RETENTION = {
+    'ARCHIVE_DIR': Path(os.getenv('TUTOR_ARCHIVE_DIR', BASE_DIR / 'var' / 'archive')),
+    'MASTERED_AFTER_DAYS': 30,
+    'MAX_AGE_DAYS': 365,
+    'COMPRESSION': os.getenv('TUTOR_ARCHIVE_COMPRESSION', 'gzip'),
+    'CHUNK_SIZE': 5000,
+}
+
+# Adresses autorisées à lire /metrics (serveur Prometheus)
+
+TUTOR_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
@@ -1,11 +1,16 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.authtoken import views
+from tutor.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     # Route pour l'API du module learner
     path('api/learner/', include('learner.urls')),
+    # Lecture du programme (arbre des compétences et concepts)
+    path('api/expert/', include('expert.urls')),
     # Route pour obtenir un token d'authentification
-    path('api-token-auth/', views.obtain_auth_token) 
+    path('api-token-auth/', views.obtain_auth_token),
+    # Mesures de performance (format Prometheus)
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,218 @@
+"""
+Banc d'essai du point d'entrée /api/learner/interact/.
+
+Crée un programme profond et N apprenants, rejoue des conversations à travers
+`TutorInteractionView` avec un LLM simulé, et mesure pour chaque requête la
+latence, le nombre de requêtes SQL et le volume écrit en base.
+Tout est fait dans une transaction annulée à la fin : la base n'est pas modifiée.
+Le cache Django et le cache de réponses sont remplacés par des caches privés
+pendant la mesure : un cache partagé (Redis) n'est pas touché.
+"""
+import itertools
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from expert.curriculum import get_curriculum_snapshot, invalidate_curriculum_snapshot
+from expert.models import Concept, Skill
+from expert.published import invalidate_curriculum_document
+from learner.views import TutorInteractionView
+from .instrumentation import metrics
+from .llm_client import StubBackend, get_llm_settings, use_llm_client
+from .response_cache import (
+    DEFAULT_SETTINGS as RESPONSE_CACHE_SETTINGS, LocMemBackend, ResponseCache, use_response_cache,
+)
+from .retrieval import invalidate_concept_index
+from .task_queue import eager_tasks
+
+BENCH_PREFIX = "bench"
+
+# Cache propre au banc d'essai (curseurs, verrous, version du programme...)
+BENCH_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tutor-benchmark',
+    }
+}
+
+LEARNER_MESSAGES = (
+    "Bonjour, je suis prêt !",
+    "Je crois que x contient 5.",
+    "Je ne suis pas sûr, tu peux réexpliquer ?",
+    "Ah d'accord, c'est comme une étiquette sur une boîte.",
+    "Donc si j'écris nom = \"Alice\", nom contient du texte ?",
+    "Et si je réassigne la variable, l'ancienne valeur disparaît ?",
+    "J'ai compris, on passe à la suite ?",
+)
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+class _Rollback(Exception):
+    pass
+
+
+class QueryRecorder:
+    """
+    Compte les requêtes SQL exécutées, ainsi que les lignes et octets écrits.
+    S'utilise via `connection.execute_wrapper`.
+    """
+    def __init__(self):
+        self.queries = 0
+        self.rows_written = 0
+        self.bytes_written = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        self.queries += 1
+        if sql.lstrip().upper().startswith(WRITE_STATEMENTS):
+            param_sets = params if many else [params]
+            self.rows_written += _rows_written(sql, param_sets, context['cursor'].rowcount)
+            self.bytes_written += sum(
+                _param_size(value)
+                for param_set in param_sets or []
+                for value in (param_set or [])
+            )
+        return result
+
+
+def _rows_written(sql, param_sets, rowcount):
+    """
+    Nombre de lignes écrites. Pour un INSERT, il est déduit des paramètres : avec
+    RETURNING, certains pilotes ne renseignent pas `rowcount`.
+    """
+    if not sql.lstrip().upper().startswith("INSERT"):
+        return max(rowcount, 0)
+    columns = sql[sql.index("(") + 1:sql.index(")")].count(",") + 1
+    return sum(len(param_set or []) // columns for param_set in param_sets)
+
+
+def _param_size(value):
+    if value is None:
+        return 0
+    if isinstance(value, bytes):
+        return len(value)
+    return len(str(value).encode("utf-8"))
+
+
+def percentile(values, pct):
+    """
+    Percentile par rang le plus proche.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def seed_curriculum(concept_count, depth, branching=2):
+    """
+    Crée un arbre de Skill de profondeur `depth` (chaque nœud a `branching` enfants)
+    et répartit `concept_count` concepts sur ses feuilles.
+    """
+    with Skill.objects.delay_mptt_updates():
+        level = [Skill.objects.create(name=f"{BENCH_PREFIX}-skill-root")]
+        counter = itertools.count()
+        for _ in range(depth - 1):
+            level = [
+                Skill.objects.create(name=f"{BENCH_PREFIX}-skill-{next(counter)}", parent=parent)
+                for parent in level
+                for _ in range(branching)
+            ]
+    leaves = level
+    Concept.objects.bulk_create([
+        Concept(
+            skill=leaves[i % len(leaves)],
+            name=f"{BENCH_PREFIX} concept {i}",
+            slug=f"{BENCH_PREFIX}-concept-{i}",
+            explanation=f"Explication détaillée du concept de test numéro {i}. " * 4,
+        )
+        for i in range(concept_count)
+    ])
+
+
+def seed_learners(learner_count):
+    """
+    Crée les apprenants (le profil est créé par signal) et leur token.
+    """
+    tokens = []
+    for i in range(learner_count):
+        user = User.objects.create_user(f"{BENCH_PREFIX}-learner-{i}")
+        tokens.append(Token.objects.create(user=user).key)
+    return tokens
+
+
+def run_benchmark(learners=20, concepts=50, depth=5, turns=15, latency=0.0, tokens_per_second=0):
+    """
+    Rejoue `turns` messages par apprenant et retourne les mesures agrégées.
+    """
+    llm_client = StubBackend({
+        **get_llm_settings(),
+        'STUB_LATENCY': latency,
+        'STUB_TOKENS_PER_SECOND': tokens_per_second,
+    })
+    factory = APIRequestFactory()
+    view = TutorInteractionView.as_view()
+    latencies, queries, rows, written = [], [], [], []
+
+    response_cache = ResponseCache(LocMemBackend(RESPONSE_CACHE_SETTINGS), RESPONSE_CACHE_SETTINGS['TTL'])
+    try:
+        # Tâches de fond exécutées dans la requête : elles doivent voir la transaction
+        with override_settings(CACHES=BENCH_CACHES), use_response_cache(response_cache), \
+                transaction.atomic(), use_llm_client(llm_client), eager_tasks():
+            caches['default'].clear()
+            seed_curriculum(concepts, depth)
+            tokens = seed_learners(learners)
+            # Comme au démarrage d'un serveur : l'instantané du programme est déjà construit
+            get_curriculum_snapshot()
+
+            prompt_tokens_before = metrics.get("tutor_prompt_tokens_total")
+            started = time.perf_counter()
+            for turn in range(turns):
+                message = LEARNER_MESSAGES[turn % len(LEARNER_MESSAGES)]
+                for token in tokens:
+                    request = factory.post(
+                        "/api/learner/interact/", {"message": message}, format="json",
+                        HTTP_AUTHORIZATION=f"Token {token}",
+                    )
+                    recorder = QueryRecorder()
+                    request_started = time.perf_counter()
+                    with connection.execute_wrapper(recorder):
+                        response = view(request)
+                    latencies.append((time.perf_counter() - request_started) * 1000)
+                    if response.status_code != 200:
+                        raise RuntimeError(f"Unexpected status {response.status_code}: {response.data}")
+                    queries.append(recorder.queries)
+                    rows.append(recorder.rows_written)
+                    written.append(recorder.bytes_written)
+            elapsed = time.perf_counter() - started
+            prompt_tokens = metrics.get("tutor_prompt_tokens_total") - prompt_tokens_before
+            raise _Rollback
+    except _Rollback:
+        pass
+    finally:
+        # Le programme de test a été annulé : les données gardées en mémoire sont périmées
+        invalidate_curriculum_snapshot()
+        invalidate_curriculum_document()
+        invalidate_concept_index()
+
+    return {
+        "requests": len(latencies),
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+        },
+        "queries_per_request": {"mean": statistics.mean(queries), "max": max(queries)},
+        "rows_written_per_turn": statistics.mean(rows),
+        "bytes_written_per_turn": statistics.mean(written),
+        "prompt_tokens_per_turn": prompt_tokens / len(latencies),
+    }
@@ -0,0 +1,34 @@
+"""
+Curseur de programme par apprenant.
+
+Mémorise en cache le concept sur lequel un apprenant travaille, pour éviter de
+reparcourir tout le programme à chaque message. L'entrée est associée à la version
+du programme : toute modification d'un Skill ou d'un Concept la rend caduque.
+"""
+from django.core.cache import cache
+
+from expert.curriculum import get_curriculum_version
+
+CURSOR_TIMEOUT = 60 * 60 * 24 # 24h
+
+def _cursor_key(learner_id):
+    return f"tutor:cursor:{learner_id}"
+
+def get_cursor(learner_id):
+    """
+    Retourne l'id du concept courant de l'apprenant, ou None si le curseur est absent
+    ou périmé.
+    """
+    entry = cache.get(_cursor_key(learner_id))
+    if entry is None:
+        return None
+    version, concept_id = entry
+    if version != get_curriculum_version():
+        return None
+    return concept_id
+
+def set_cursor(learner_id, concept_id):
+    cache.set(_cursor_key(learner_id), (get_curriculum_version(), concept_id), CURSOR_TIMEOUT)
+
+def clear_cursor(learner_id):
+    cache.delete(_cursor_key(learner_id))
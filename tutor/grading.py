@@ -0,0 +1,160 @@
+"""
+Évaluation des réponses des apprenants par le LLM, hors du chemin de la requête.
+
+Quand TUTOR_GRADING['ENABLED'] est actif, l'écriture d'un échange dans
+l'historique déclenche une tâche de notation pour son concept (voir tutor/tasks.py).
+La tâche lit les réponses pas encore notées de ce concept, tous apprenants
+confondus, et les envoie au LLM en une seule requête (jusqu'à
+MAX_ANSWERS_PER_REQUEST réponses), en demandant une sortie JSON. Chaque réponse
+est accompagnée de la question à laquelle elle répond : la réponse du tuteur à
+l'échange précédent. Le premier échange d'un concept n'est pas noté (le tuteur
+y ouvrait la leçon, il n'avait encore rien demandé). Chaque note
+(0.0 à 1.0) est enregistrée sur l'échange, puis intégrée au score de maîtrise
+par moyenne mobile : score = (1 - WEIGHT) * score + WEIGHT * note.
+
+Les appels passent par l'ordonnanceur (voir tutor/scheduler.py), en priorité
+basse : ils respectent les quotas communs et passent après les échanges.
+"""
+import json
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+
+from learner.models import InteractionLog, LearnerProgress
+from .cursor import clear_cursor
+from .instrumentation import metrics
+from .llm_client import get_llm_client
+
+DEFAULT_SETTINGS = {
+    'ENABLED': False,
+    'MAX_ANSWERS_PER_REQUEST': 20,
+    'WEIGHT': 0.3,
+}
+
+GRADING_PROMPT = """\
+Tu es un correcteur. Pour le concept ci-dessous, note chaque réponse d'apprenant
+de 0.0 (incorrecte ou hors sujet) à 1.0 (parfaitement juste), en tenant compte
+de la question posée par le tuteur.
+
+**CONCEPT**
+- Nom : {name}
+- Explication de base : {explanation}
+
+**RÉPONSES À NOTER**
+{answers}
+
+Réponds uniquement par un tableau JSON, un objet par réponse, sans autre texte :
+[{{"id": <id de la réponse>, "score": <note>}}]"""
+
+
+class GradingError(ValueError):
+    pass
+
+
+def get_grading_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TUTOR_GRADING', {})}
+
+
+def grading_enabled():
+    return get_grading_settings()['ENABLED']
+
+
+def build_grading_prompt(concept, logs):
+    """
+    `logs` : échanges annotés de `question` (voir `gradable_logs`).
+    """
+    answers = "\n".join(
+        f'- id {log.id} | Question du tuteur : "{log.question}" | Apprenant : "{log.user_message}"'
+        for log in logs
+    )
+    return GRADING_PROMPT.format(name=concept.name, explanation=concept.explanation, answers=answers)
+
+
+def parse_grades(text, expected_ids):
+    """
+    Extrait les notes de la réponse du LLM : {id de l'échange: note}.
+    Les ids inconnus sont ignorés et les notes ramenées entre 0 et 1.
+    """
+    match = re.search(r"\[.*\]", text, re.DOTALL) # tolère ```json ... ``` autour
+    if not match:
+        raise GradingError(f"No JSON array in grading response: {text[:200]!r}")
+    try:
+        items = json.loads(match.group(0))
+        grades = {int(item["id"]): float(item["score"]) for item in items}
+    except (ValueError, TypeError, KeyError) as e:
+        raise GradingError(f"Invalid grading response: {e}") from e
+    return {
+        log_id: min(1.0, max(0.0, score))
+        for log_id, score in grades.items()
+        if log_id in expected_ids
+    }
+
+
+def gradable_logs(concept_id):
+    """
+    Échanges non notés d'un concept, annotés de `question` : la réponse du
+    tuteur à l'échange précédent du même apprenant. Les premiers échanges (sans
+    question) sont exclus.
+    """
+    previous = InteractionLog.objects.filter(
+        Q(created_at__lt=OuterRef('created_at')) | Q(created_at=OuterRef('created_at'), id__lt=OuterRef('id')),
+        learner_id=OuterRef('learner_id'),
+        concept_id=OuterRef('concept_id'),
+    ).order_by('-created_at', '-id').values('tutor_response')[:1]
+    return (
+        InteractionLog.objects.filter(concept_id=concept_id, score__isnull=True)
+        .annotate(question=Subquery(previous))
+        .filter(question__isnull=False)
+    )
+
+
+def grade_concept(concept_id, limit=None):
+    """
+    Note un lot de réponses encore non notées d'un concept et met à jour la
+    maîtrise des apprenants concernés. Retourne le nombre de réponses notées.
+    """
+    from .services import MASTERY_THRESHOLD # import local : services dépend de ce module
+
+    options = get_grading_settings()
+    logs = list(
+        gradable_logs(concept_id).select_related('concept')
+        .order_by('id')[:limit or options['MAX_ANSWERS_PER_REQUEST']]
+    )
+    if not logs:
+        return 0
+
+    prompt = build_grading_prompt(logs[0].concept, logs)
+    grades = parse_grades(get_llm_client().generate_response(prompt), {log.id for log in logs})
+    graded = [log for log in logs if log.id in grades]
+    for log in graded:
+        log.score = grades[log.id]
+
+    with transaction.atomic():
+        # Chaque note n'est enregistrée que si l'échange est encore non noté : un
+        # autre processus qui aurait noté les mêmes réponses ne compte pas double
+        claimed = [
+            log for log in graded
+            if InteractionLog.objects.filter(pk=log.id, score__isnull=True).update(score=log.score)
+        ]
+        # Les notes d'un apprenant, dans l'ordre, reviennent à score * a + b : la
+        # mise à jour est calculée par la base (F), sans verrouiller la ligne
+        weight = options['WEIGHT']
+        coefficients = {}
+        for log in claimed:
+            a, b = coefficients.get(log.learner_id, (1.0, 0.0))
+            coefficients[log.learner_id] = (a * (1 - weight), b * (1 - weight) + weight * log.score)
+        for learner_id, (a, b) in coefficients.items():
+            LearnerProgress.objects.filter(concept_id=concept_id, learner_id=learner_id).update(
+                mastery_score=F('mastery_score') * a + b
+            )
+
+    mastered = LearnerProgress.objects.filter(
+        concept_id=concept_id, learner_id__in=coefficients.keys(), mastery_score__gte=MASTERY_THRESHOLD
+    ).values_list('learner_id', flat=True)
+    for learner_id in mastered:
+        # Concept maîtrisé : le prochain sera recalculé au message suivant
+        clear_cursor(learner_id)
+    metrics.inc("tutor_graded_answers_total", len(claimed))
+    return len(claimed)
@@ -0,0 +1,74 @@
+"""
+Garde « un message à la fois » par apprenant.
+
+Deux messages envoyés coup sur coup par un même apprenant choisiraient le même
+concept et le même historique ; le second attendrait de toute façon la réponse
+au premier. Plutôt que de verrouiller des lignes en base pendant l'appel au LLM,
+on pose un marqueur dans le cache (`cache.add` est atomique) : le second message
+est refusé (409) tant que le premier n'est pas terminé.
+
+Le marqueur expire de lui-même après INFLIGHT_TIMEOUT, au cas où le processus
+s'arrêterait pendant le traitement. Avec un cache partagé (Redis, Memcached), la
+garde vaut pour tous les processus.
+"""
+import contextlib
+import threading
+
+from django.core.cache import cache
+
+INFLIGHT_TIMEOUT = 120 # secondes, plus long qu'un appel au LLM avec ses nouveaux essais
+
+BUSY_MESSAGE = "Votre message précédent est encore en cours de traitement. Réessayez dans un instant."
+
+
+class LearnerBusy(Exception):
+    """
+    Un message de cet apprenant est déjà en cours de traitement.
+    """
+
+
+def _inflight_key(learner_id):
+    return f"tutor:inflight:{learner_id}"
+
+
+def acquire(learner_ids):
+    """
+    Réserve tous les apprenants, ou aucun. Lève LearnerBusy si l'un d'eux est occupé.
+    """
+    acquired = []
+    for learner_id in learner_ids:
+        if not cache.add(_inflight_key(learner_id), True, INFLIGHT_TIMEOUT):
+            release(acquired)
+            raise LearnerBusy(learner_id)
+        acquired.append(learner_id)
+
+
+def release(learner_ids):
+    cache.delete_many([_inflight_key(learner_id) for learner_id in learner_ids])
+
+
+def release_once(learner_ids):
+    """
+    Retourne une fonction qui libère les apprenants à son premier appel, puis ne
+    fait plus rien : un second appel ne retire pas la garde d'un message suivant.
+    """
+    lock = threading.Lock()
+    released = False
+
+    def release_guard():
+        nonlocal released
+        with lock:
+            if released:
+                return
+            released = True
+        release(learner_ids)
+    return release_guard
+
+
+@contextlib.contextmanager
+def learner_guard(*learner_ids):
+    acquire(learner_ids)
+    try:
+        yield
+    finally:
+        release(learner_ids)
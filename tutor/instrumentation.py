@@ -0,0 +1,197 @@
+"""
+Mesures de performance du tuteur.
+
+- `span(name)` chronomètre une phase et compte ses requêtes SQL ;
+- les phases d'une requête HTTP sont renvoyées dans l'en-tête Server-Timing
+  (voir `tutor.middleware.ServerTimingMiddleware`) ;
+- toutes les mesures alimentent `metrics`, exposé au format texte Prometheus
+  par la vue `/metrics`. Les compteurs sont propres à chaque processus.
+"""
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+
+from django.db import connection
+
+# Bornes (en secondes) des histogrammes de durée
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metrics:
+    """
+    Registre de compteurs et d'histogrammes, partagé par les threads du processus.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    "buckets": [0] * len(DURATION_BUCKETS), "sum": 0.0, "count": 0
+                }
+            index = bisect.bisect_left(DURATION_BUCKETS, value)
+            if index < len(DURATION_BUCKETS):
+                histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def get(self, name, **labels):
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """
+        Exporte les mesures au format texte de Prometheus.
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS, histogram["buckets"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
+metrics.describe("tutor_phase_seconds", "Durée des phases de TutorService.")
+metrics.describe("tutor_phase_queries_total", "Requêtes SQL exécutées par phase de TutorService.")
+metrics.describe("tutor_llm_requests_total", "Appels au LLM, par moteur et par issue.")
+metrics.describe("tutor_llm_tokens_total", "Tokens consommés par le LLM (prompt / réponse).")
+metrics.describe("tutor_response_cache_requests_total", "Consultations du cache de réponses (hit / miss).")
+metrics.describe("tutor_prompt_tokens_total", "Tokens (estimés) des prompts envoyés au LLM.")
+metrics.describe("tutor_tasks_total", "Tâches de fond traitées, par tâche et par issue.")
+metrics.describe("tutor_graded_answers_total", "Réponses d'apprenants notées par le LLM.")
+metrics.describe("tutor_prompt_omitted_turns_total", "Échanges anciens retirés des prompts faute de budget.")
+metrics.describe("tutor_summaries_total", "Résumés de conversation mis à jour par le LLM.")
+metrics.describe("tutor_prefetch_total", "Ouvertures de leçon préparées à l'avance (generated / skipped / failed).")
+metrics.describe("tutor_llm_coalesced_total", "Appels au LLM évités : même prompt déjà en cours.")
+metrics.describe("tutor_llm_scheduler_total", "Passages par les quotas d'appels au LLM, par priorité et par issue.")
+metrics.describe("tutor_retrieval_routed_total", "Messages réorientés vers le concept dont ils parlent.")
+metrics.describe("tutor_retrieval_embedded_concepts_total", "Concepts (re)vectorisés pour l'index sémantique.")
+
+
+class RequestTrace:
+    """
+    Phases mesurées pendant une requête HTTP.
+    """
+    def __init__(self):
+        self.spans = []
+
+    def server_timing(self):
+        """
+        Valeur de l'en-tête Server-Timing.
+        Une phase répétée (ex: plusieurs appels LLM) est additionnée.
+        """
+        totals = {}
+        for name, duration, queries in self.spans:
+            total_duration, total_queries = totals.get(name, (0.0, 0))
+            totals[name] = (total_duration + duration, total_queries + queries)
+        return ", ".join(
+            f'{name};dur={duration * 1000:.2f};desc="{queries} SQL"'
+            for name, (duration, queries) in totals.items()
+        )
+
+
+_current_trace = contextvars.ContextVar("tutor_request_trace", default=None)
+
+
+@contextlib.contextmanager
+def trace_request():
+    trace = RequestTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextlib.contextmanager
+def span(name):
+    """
+    Chronomètre une phase et compte ses requêtes SQL (sur la connexion du thread courant).
+    """
+    counter = _QueryCounter()
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(counter):
+            yield
+    finally:
+        duration = time.perf_counter() - started
+        metrics.observe("tutor_phase_seconds", duration, phase=name)
+        metrics.inc("tutor_phase_queries_total", counter.count, phase=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append((name, duration, counter.count))
+
+
+def record_llm_usage(backend, prompt_tokens, completion_tokens):
+    metrics.inc("tutor_llm_tokens_total", prompt_tokens or 0, backend=backend, kind="prompt")
+    metrics.inc("tutor_llm_tokens_total", completion_tokens or 0, backend=backend, kind="completion")
+
+
+def estimate_tokens(text):
+    """
+    Estimation grossière (≈ 4 caractères par token) pour les moteurs qui ne
+    renvoient pas leur consommation.
+    """
+    return max(1, len(text) // 4) if text else 0
@@ -1,43 +1,391 @@
-import google.generativeai as genai
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import weakref
 
 import os
+from django.conf import settings
+from django.utils.module_loading import import_string
 from dotenv import load_dotenv # Import nécessaire
 
+from .instrumentation import estimate_tokens, metrics, record_llm_usage
+from .scheduler import INTERACTIVE, RateLimitExceeded, current_priority, get_scheduler
+
 load_dotenv() # Charge les variables du fichier .env
 
-api_key = os.getenv("GEMINI_API_KEY")
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'BACKEND': 'tutor.llm_client.GeminiClient',
+    'MODEL': 'gemini-2.0-flash',
+    'TEMPERATURE': 0.7,
+    'TIMEOUT': 30, # secondes, par appel à l'API
+    'MAX_CONCURRENCY': 16, # appels simultanés par processus
+    'ACQUIRE_TIMEOUT': 5, # attente max d'une place libre avant d'abandonner
+    'MAX_RETRIES': 3,
+    'BACKOFF_BASE': 0.5,
+    'BACKOFF_MAX': 8,
+    # StubBackend
+    'STUB_LATENCY': 0.0, # délai avant le premier token (secondes)
+    'STUB_TOKENS_PER_SECOND': 0, # 0 = pas de limite
+    'STUB_RESPONSE_TOKENS': 40,
+    # HTTPBackend
+    'HTTP_URL': 'http://127.0.0.1:8765/',
+}
+
+UNAVAILABLE_MESSAGE = "Je suis désolé, je rencontre un problème technique pour vous répondre."
+RATE_LIMITED_MESSAGE = "Le tuteur est très sollicité en ce moment. Réessayez dans quelques secondes."
+
+
+class LLMError(Exception):
+    """
+    Le LLM n'a pas pu produire de réponse (après les nouveaux essais éventuels).
+    """
+
+
+class LLMRateLimited(LLMError):
+    """
+    Quota d'appels atteint (chez nous ou chez le fournisseur) : réessayer après `retry_after` secondes.
+    """
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamRateLimited(ConnectionError):
+    """
+    Le service a répondu 429 : erreur passagère, qui suspend aussi les autres appels.
+    """
+
+
+def get_llm_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TUTOR_LLM', {})}
+
+
+class LLMBackend:
+    """
+    Interface commune des moteurs de langage.
+
+    Gère pour tous les moteurs la limite d'appels simultanés, les quotas et le
+    regroupement des prompts identiques (voir tutor/scheduler.py) et les nouveaux
+    essais ; une sous-classe n'implémente que `_generate` et `_astream`, et liste
+    ses erreurs passagères dans `retryable_errors` (dont ses erreurs de quota
+    dans `rate_limit_errors`).
+    """
+    name = "llm"
+    # Erreurs passagères pour lesquelles un nouvel essai a du sens
+    retryable_errors = (ConnectionError, TimeoutError)
+    # Parmi elles, les dépassements de quota du fournisseur
+    rate_limit_errors = (UpstreamRateLimited,)
+
+    def __init__(self, options=None):
+        self.options = options or get_llm_settings()
+        # Limite le nombre d'appels simultanés pour qu'un amont lent n'immobilise
+        # pas tous les threads du serveur
+        self._semaphore = threading.BoundedSemaphore(self.options['MAX_CONCURRENCY'])
+        self._async_semaphores = weakref.WeakKeyDictionary() # un par boucle asyncio
+
+    def _generate(self, prompt):
+        raise NotImplementedError
+
+    async def _astream(self, prompt):
+        raise NotImplementedError
+        yield
+
+    def _backoff_delay(self, attempt):
+        """
+        Attente exponentielle avec gigue complète ("full jitter").
+        """
+        ceiling = min(self.options['BACKOFF_MAX'], self.options['BACKOFF_BASE'] * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+    def _get_async_semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.options['MAX_CONCURRENCY'])
+            self._async_semaphores[loop] = semaphore
+        return semaphore
+
+    def _failed(self, error, attempts):
+        """
+        Erreur à lever après `attempts` essais infructueux.
+        """
+        metrics.inc("tutor_llm_requests_total", backend=self.name, outcome="error")
+        if isinstance(error, self.rate_limit_errors):
+            return LLMRateLimited(
+                f"{self.name} rate limited after {attempts} attempts: {error}", get_scheduler().retry_after()
+            )
+        return LLMError(f"{self.name} unavailable after {attempts} attempts: {error}")
+
+    def _on_retryable_error(self, error):
+        """
+        Retourne True si un nouvel essai a du sens pour cette erreur passagère.
+        """
+        if isinstance(error, self.rate_limit_errors):
+            # Inutile que les autres appels se heurtent au même quota
+            get_scheduler().pause()
+            # Un apprenant ne patiente pas pendant la pause : 429 tout de suite
+            return current_priority() != INTERACTIVE
+        return True
+
+    def generate_response(self, prompt):
+        """
+        Génère la réponse à `prompt`. Des appels simultanés avec le même prompt
+        n'interrogent le LLM qu'une fois.
+        """
+        try:
+            return get_scheduler().coalesce(prompt, lambda: self._scheduled_generate(prompt))
+        except RateLimitExceeded as e:
+            # Quota refusé, à cet appel ou à celui qu'il attendait
+            raise LLMRateLimited(str(e), e.retry_after) from e
+
+    def _scheduled_generate(self, prompt):
+        get_scheduler().acquire(prompt)
+        if not self._semaphore.acquire(timeout=self.options['ACQUIRE_TIMEOUT']):
+            get_scheduler().refund(prompt) # l'appel ne part pas : son quota reste disponible
+            raise LLMError(f"Too many concurrent {self.name} calls.")
+        try:
+            for attempt in range(self.options['MAX_RETRIES'] + 1):
+                try:
+                    text = self._generate(prompt)
+                    metrics.inc("tutor_llm_requests_total", backend=self.name, outcome="success")
+                    return text
+                except self.retryable_errors as e:
+                    if not self._on_retryable_error(e) or attempt == self.options['MAX_RETRIES']:
+                        raise self._failed(e, attempt + 1) from e
+                    metrics.inc("tutor_llm_requests_total", backend=self.name, outcome="retry")
+                    logger.warning("Retrying %s call after error: %s", self.name, e)
+                    time.sleep(self._backoff_delay(attempt))
+                except Exception as e:
+                    metrics.inc("tutor_llm_requests_total", backend=self.name, outcome="error")
+                    raise LLMError(f"Error calling {self.name}: {e}") from e
+        finally:
+            self._semaphore.release()
+
+    async def astream_response(self, prompt):
+        """
+        Version asynchrone et en flux de `generate_response` : produit les morceaux
+        de texte au fur et à mesure de leur génération, sans bloquer de thread.
+        Un nouvel essai n'est tenté que si aucun morceau n'a encore été envoyé.
+        Les quotas s'appliquent, mais pas le regroupement (chaque flux a son lecteur).
+        """
+        try:
+            await get_scheduler().aacquire(prompt)
+        except RateLimitExceeded as e:
+            raise LLMRateLimited(str(e), e.retry_after) from e
+        semaphore = self._get_async_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.options['ACQUIRE_TIMEOUT'])
+        except asyncio.TimeoutError:
+            get_scheduler().refund(prompt)
+            raise LLMError(f"Too many concurrent {self.name} calls.")
+        try:
+            for attempt in range(self.options['MAX_RETRIES'] + 1):
+                started = False
+                try:
+                    async for text in self._astream(prompt):
+                        started = True
+                        yield text
+                    metrics.inc("tutor_llm_requests_total", backend=self.name, outcome="success")
+                    return
+                except self.retryable_errors as e:
+                    if not self._on_retryable_error(e) or started or attempt == self.options['MAX_RETRIES']:
+                        raise self._failed(e, attempt + 1) from e
+                    metrics.inc("tutor_llm_requests_total", backend=self.name, outcome="retry")
+                    logger.warning("Retrying %s call after error: %s", self.name, e)
+                    await asyncio.sleep(self._backoff_delay(attempt))
+                except Exception as e:
+                    metrics.inc("tutor_llm_requests_total", backend=self.name, outcome="error")
+                    raise LLMError(f"Error calling {self.name}: {e}") from e
+        finally:
+            semaphore.release()
+
+
+class GeminiClient(LLMBackend):
+    name = "Gemini API"
+
+    def __init__(self, options=None):
+        super().__init__(options)
+        # Import local : les autres moteurs ne dépendent pas du SDK Google
+        import google.generativeai as genai
+        from google.api_core import exceptions as google_exceptions
 
-class GeminiClient:
-    def __init__(self):
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise ValueError("GEMINI_API_KEY not found in environment variables.")
         genai.configure(api_key=api_key)
-        
-        # CORRECTION ICI : Utilisation du nom de modèle standard
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
 
-    def generate_response(self, prompt):
+        self.model = genai.GenerativeModel(self.options['MODEL'])
+        self.retryable_errors = LLMBackend.retryable_errors + (
+            google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.InternalServerError,
+        )
+        self.rate_limit_errors = (google_exceptions.ResourceExhausted,)
+
+        # Construits une seule fois : identiques pour tous les appels
+        self.generation_config = genai.types.GenerationConfig(
+            candidate_count=1,
+            temperature=self.options['TEMPERATURE'],
+        )
+        # Note : Ces réglages désactivent tous les filtres de sécurité.
+        self.safety_settings = [
+            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+        ]
+
+    def _request_options(self):
+        return {
+            "generation_config": self.generation_config,
+            "safety_settings": self.safety_settings,
+            "request_options": {"timeout": self.options['TIMEOUT']},
+        }
+
+    def _record_usage(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            record_llm_usage(self.name, usage.prompt_token_count, usage.candidates_token_count)
+
+    def _generate(self, prompt):
+        response = self.model.generate_content(prompt, **self._request_options())
+        self._record_usage(response)
+        return response.text
+
+    async def _astream(self, prompt):
+        response = await self.model.generate_content_async(
+            prompt, stream=True, **self._request_options()
+        )
+        last_chunk = None
+        async for chunk in response:
+            last_chunk = chunk
+            try:
+                text = chunk.text
+            except ValueError:
+                # Morceau sans contenu textuel (ex: dernier morceau de fin)
+                continue
+            if text:
+                yield text
+        # La consommation totale est renseignée sur le dernier morceau
+        self._record_usage(last_chunk)
+
+
+STUB_VOCABULARY = (
+    "une", "variable", "est", "comme", "boîte", "qui", "contient", "valeur", "on",
+    "utilise", "le", "signe", "égal", "pour", "ranger", "nombre", "texte", "dans",
+    "Python", "exemple", "très", "bien", "essaie", "encore", "regarde", "ce", "code",
+)
+
+def stub_tokens(prompt, count):
+    """
+    Réponse factice déterministe : les mêmes prompts donnent toujours les mêmes mots.
+    """
+    seed = int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    words = [rng.choice(STUB_VOCABULARY) for _ in range(max(count - 1, 0))]
+    tokens = [word + " " for word in words]
+    tokens.append("d'accord ?")
+    return tokens
+
+
+class StubBackend(LLMBackend):
+    """
+    Moteur local déterministe pour les tests de charge : ni clé d'API, ni réseau.
+    La latence (STUB_LATENCY) et le débit (STUB_TOKENS_PER_SECOND) sont réglables
+    pour simuler un vrai LLM.
+    """
+    name = "stub LLM"
+
+    def _token_delay(self):
+        rate = self.options['STUB_TOKENS_PER_SECOND']
+        return 1 / rate if rate else 0
+
+    def _generate(self, prompt):
+        tokens = stub_tokens(prompt, self.options['STUB_RESPONSE_TOKENS'])
+        time.sleep(self.options['STUB_LATENCY'] + self._token_delay() * len(tokens))
+        record_llm_usage(self.name, estimate_tokens(prompt), len(tokens))
+        return "".join(tokens)
+
+    async def _astream(self, prompt):
+        await asyncio.sleep(self.options['STUB_LATENCY'])
+        tokens = stub_tokens(prompt, self.options['STUB_RESPONSE_TOKENS'])
+        for token in tokens:
+            yield token
+            await asyncio.sleep(self._token_delay())
+        record_llm_usage(self.name, estimate_tokens(prompt), len(tokens))
+
+
+class HTTPBackend(LLMBackend):
+    """
+    Moteur qui délègue à un service HTTP local (`python manage.py llm_standin`),
+    pour tester la charge avec de vrais allers-retours réseau.
+    Le service reçoit {"prompt": "..."} et répond {"text": "..."}.
+    """
+    name = "HTTP LLM"
+
+    def _generate(self, prompt):
+        request = urllib.request.Request(
+            self.options['HTTP_URL'],
+            data=json.dumps({"prompt": prompt}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
         try:
-            generation_config = genai.types.GenerationConfig(
-                candidate_count=1,
-                temperature=0.7,
-            )
-            
-            # Note : Ces réglages désactivent tous les filtres de sécurité.
-            safety_settings = [
-                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-            ]
-
-            response = self.model.generate_content(
-                prompt,
-                generation_config=generation_config,
-                safety_settings=safety_settings
-            )
-            return response.text
-        except Exception as e:
-            print(f"Error calling Gemini API: {e}")
-            return "Je suis désolé, je rencontre un problème technique pour vous répondre."
\ No newline at end of file
+            with urllib.request.urlopen(request, timeout=self.options['TIMEOUT']) as response:
+                text = json.loads(response.read())["text"]
+            record_llm_usage(self.name, estimate_tokens(prompt), estimate_tokens(text))
+            return text
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                raise UpstreamRateLimited(f"HTTP {e.code}") from e
+            if e.code >= 500:
+                raise ConnectionError(f"HTTP {e.code}") from e
+            raise
+        except urllib.error.URLError as e:
+            raise ConnectionError(str(e.reason)) from e
+
+    async def _astream(self, prompt):
+        # Le service de test ne diffuse pas en flux : la réponse arrive en un bloc
+        yield await asyncio.to_thread(self._generate, prompt)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_llm_client():
+    """
+    Retourne le moteur LLM partagé par tout le processus (créé au premier appel),
+    choisi par TUTOR_LLM['BACKEND']. Le modèle, sa configuration et ses connexions
+    sont ainsi réutilisés d'une requête à l'autre.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                options = get_llm_settings()
+                _client = import_string(options['BACKEND'])(options)
+    return _client
+
+
+@contextlib.contextmanager
+def use_llm_client(client):
+    """
+    Remplace temporairement le moteur partagé (bancs d'essai, tests).
+    """
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+    try:
+        yield client
+    finally:
+        with _client_lock:
+            _client = previous
@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tutor.benchmark import run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le chemin /api/learner/interact/ avec un LLM simulé : latence p50/p95/p99, "
+        "requêtes SQL, lignes et octets écrits par échange. La base n'est pas modifiée."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--learners', type=int, default=20)
+        parser.add_argument('--concepts', type=int, default=50)
+        parser.add_argument('--depth', type=int, default=5, help="Profondeur de l'arbre de Skill.")
+        parser.add_argument('--turns', type=int, default=15, help="Messages envoyés par apprenant.")
+        parser.add_argument('--latency', type=float, default=0.0, help="Latence simulée du LLM (s).")
+        parser.add_argument('--tokens-per-second', type=float, default=0)
+        parser.add_argument('--json', action='store_true', help="Affiche le rapport en JSON.")
+        parser.add_argument(
+            '--max-queries', type=float,
+            help="Échoue si le nombre moyen de requêtes SQL par échange dépasse ce seuil."
+        )
+
+    def handle(self, *args, **options):
+        report = run_benchmark(
+            learners=options['learners'],
+            concepts=options['concepts'],
+            depth=options['depth'],
+            turns=options['turns'],
+            latency=options['latency'],
+            tokens_per_second=options['tokens_per_second'],
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            latency = report['latency_ms']
+            queries = report['queries_per_request']
+            self.stdout.write(f"Requêtes HTTP        : {report['requests']} ({report['throughput_rps']:.1f}/s)")
+            self.stdout.write(
+                f"Latence (ms)         : p50={latency['p50']:.2f} p95={latency['p95']:.2f} p99={latency['p99']:.2f}"
+            )
+            self.stdout.write(f"Requêtes SQL/échange : moy={queries['mean']:.2f} max={queries['max']}")
+            self.stdout.write(f"Lignes écrites/échange : {report['rows_written_per_turn']:.2f}")
+            self.stdout.write(f"Octets écrits/échange  : {report['bytes_written_per_turn']:.0f}")
+            self.stdout.write(f"Tokens de prompt/échange : {report['prompt_tokens_per_turn']:.0f}")
+
+        if options['max_queries'] is not None and report['queries_per_request']['mean'] > options['max_queries']:
+            raise CommandError(
+                f"Mean queries per request {report['queries_per_request']['mean']:.2f} "
+                f"exceeds budget {options['max_queries']}"
+            )
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from expert.curriculum import get_curriculum_version
+from tutor import retrieval
+
+
+class Command(BaseCommand):
+    help = (
+        "Construit l'index sémantique des concepts (voir tutor/retrieval.py). "
+        "Par défaut, seuls les concepts ajoutés ou modifiés depuis la dernière construction sont recalculés."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recalcule tous les vecteurs et les grappes.")
+        parser.add_argument('--dir', help="Dossier de l'index (par défaut TUTOR_RETRIEVAL['INDEX_DIR']).")
+
+    def handle(self, *args, **options):
+        if retrieval.np is None:
+            raise CommandError("NumPy is required to build the concept index.")
+        settings = retrieval.get_retrieval_settings()
+        directory = options['dir'] or settings['INDEX_DIR']
+
+        started = time.perf_counter()
+        previous = None if options['full'] else retrieval.ConceptIndex.load(directory)
+        index = retrieval.ConceptIndex.build(
+            retrieval._concept_rows(), settings, get_curriculum_version(), previous=previous
+        )
+        try:
+            index.save(directory)
+        except OSError as e:
+            raise CommandError(str(e))
+        retrieval.invalidate_concept_index()
+
+        mode = f"approché, {len(index.centroids)} grappes" if index.approximate else "exhaustif"
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(index)} concepts indexés ({index.embedded} recalculés, mode {mode}) "
+            f"dans {directory} en {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from learner.models import InteractionLog
+from tutor.grading import GradingError, get_grading_settings, grade_concept
+from tutor.llm_client import LLMError
+from tutor.scheduler import background_priority
+
+
+class Command(BaseCommand):
+    help = (
+        "Note par le LLM les réponses pas encore notées (ex: celles d'avant l'activation "
+        "de TUTOR_GRADING) et met à jour la maîtrise des apprenants. "
+        "Les appels passent après ceux des apprenants et respectent les quotas de TUTOR_SCHEDULER."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concept', type=int, action='append', help="Limite à ce concept (répétable).")
+        parser.add_argument('--max-requests', type=int, help="Nombre maximal d'appels au LLM.")
+
+    def handle(self, *args, **options):
+        concept_ids = options['concept'] or list(
+            InteractionLog.objects.filter(score__isnull=True)
+            .order_by('concept_id').values_list('concept_id', flat=True).distinct()
+        )
+        batch_size = get_grading_settings()['MAX_ANSWERS_PER_REQUEST']
+        requests = graded = 0
+        try:
+            with background_priority():
+                for concept_id in concept_ids:
+                    while options['max_requests'] is None or requests < options['max_requests']:
+                        count = grade_concept(concept_id)
+                        if count:
+                            requests += 1
+                            graded += count
+                        if count < batch_size:
+                            break
+        except (LLMError, GradingError) as e:
+            raise CommandError(f"Grading stopped after {graded} answers: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"{graded} réponses notées en {requests} appels au LLM."))
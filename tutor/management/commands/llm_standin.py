@@ -0,0 +1,53 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from tutor.llm_client import StubBackend, get_llm_settings
+
+
+class Command(BaseCommand):
+    help = "Lance un faux service LLM HTTP (réponses déterministes) pour les tests de charge."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.5, help="Délai avant réponse, en secondes.")
+        parser.add_argument('--tokens-per-second', type=float, default=50)
+        parser.add_argument('--response-tokens', type=int, default=40)
+
+    def handle(self, *args, **options):
+        backend = StubBackend({
+            **get_llm_settings(),
+            'STUB_LATENCY': options['latency'],
+            'STUB_TOKENS_PER_SECOND': options['tokens_per_second'],
+            'STUB_RESPONSE_TOKENS': options['response_tokens'],
+            'MAX_CONCURRENCY': 10_000, # le service simulé ne limite pas
+        })
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    prompt = json.loads(self.rfile.read(length))["prompt"]
+                except (ValueError, KeyError):
+                    self.send_error(400, "Expected JSON body {\"prompt\": ...}")
+                    return
+                body = json.dumps({"text": backend.generate_response(prompt)}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # trop verbeux sous charge
+
+        server = ThreadingHTTPServer((options['host'], options['port']), Handler)
+        self.stdout.write(f"LLM stand-in listening on http://{options['host']}:{options['port']}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,36 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .instrumentation import trace_request
+
+
+class ServerTimingMiddleware:
+    """
+    Ajoute l'en-tête Server-Timing (durée et nombre de requêtes SQL de chaque
+    phase de TutorService) aux réponses qui en ont mesuré.
+    Pour une réponse en flux, seules les phases terminées avant l'envoi des
+    en-têtes y figurent.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with trace_request() as trace:
+            response = self.get_response(request)
+        return self._add_header(response, trace)
+
+    async def __acall__(self, request):
+        with trace_request() as trace:
+            response = await self.get_response(request)
+        return self._add_header(response, trace)
+
+    def _add_header(self, response, trace):
+        if trace.spans:
+            response["Server-Timing"] = trace.server_timing()
+        return response
@@ -0,0 +1,164 @@
+"""
+Construction des prompts envoyés au LLM.
+
+Le prompt est découpé en parties compilées une seule fois :
+- les consignes du tuteur, identiques pour tous (constante du module) ;
+- le préfixe d'un concept (consignes + nom + explication), mis en cache par concept ;
+- la partie propre à l'échange (apprenant, historique, message), seule recalculée.
+
+Les parties communes sont placées en tête : le début du prompt est le même pour
+tous les apprenants d'un concept, ce que les fournisseurs savent mettre en cache.
+
+L'historique est sérialisé sous forme de dialogue ("Apprenant : ..." / "Prof : ...")
+et limité par un budget de tokens (TUTOR_PROMPT['TOKEN_BUDGET']) : les anciens
+échanges sont d'abord raccourcis, puis omis, du plus ancien au plus récent.
+Le résumé des échanges plus anciens (voir tutor/summaries.py), s'il existe, le précède.
+"""
+import functools
+from collections import namedtuple
+
+from django.conf import settings
+
+from .instrumentation import estimate_tokens as count_tokens, metrics
+
+DEFAULT_SETTINGS = {
+    'TOKEN_BUDGET': 1200, # tokens (estimés) pour tout le prompt
+    'TURN_MAX_TOKENS': 80, # longueur max d'un message ancien, une fois raccourci
+}
+
+SYSTEM_INSTRUCTIONS = """\
+Tu es un tuteur intelligent, patient et encourageant. Ton nom est "Prof".
+Ton objectif est d'aider un apprenant à maîtriser un concept spécifique.
+
+**Règles strictes :**
+1. Ne parle que du concept actuel. Ne dérive pas sur d'autres sujets.
+2. Utilise un langage simple et des analogies.
+3. Termine TOUJOURS ta réponse par une question simple pour vérifier la compréhension de l'apprenant.
+4. Garde tes réponses courtes et directes (2-3 phrases maximum).
+"""
+
+CONCEPT_TEMPLATE = """\
+
+**CONCEPT ACTUEL À ENSEIGNER**
+- Nom du concept : {name}
+- Explication de base : {explanation}
+"""
+
+LEARNER_TEMPLATE = """\
+
+**CONTEXTE DE L'APPRENANT**
+- Nom de l'apprenant : {learner_name}
+- Score de maîtrise actuel sur ce concept : {mastery_score:.2f}
+
+**HISTORIQUE DE LA CONVERSATION (sur ce concept)**
+{history}
+
+**DERNIER MESSAGE DE L'APPRENANT :**
+"{user_message}"
+
+Ta réponse (en tant que Prof, courte, simple, et se terminant par une question) :"""
+
+NO_HISTORY = "C'est notre première interaction sur ce sujet."
+SUMMARY_TEMPLATE = "Résumé des échanges précédents : {summary}"
+OMITTED_TEMPLATE = "({count} échange(s) plus ancien(s) omis)"
+ANONYMOUS_LEARNER = "(non communiqué)"
+
+Prompt = namedtuple('Prompt', ['text', 'tokens', 'history_turns', 'omitted_turns'])
+
+
+def get_prompt_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TUTOR_PROMPT', {})}
+
+
+@functools.lru_cache(maxsize=1024)
+def _concept_prefix(concept_id, name, explanation):
+    # L'id ne sert qu'à distinguer deux concepts homonymes dans le cache
+    text = SYSTEM_INSTRUCTIONS + CONCEPT_TEMPLATE.format(name=name, explanation=explanation)
+    return text, count_tokens(text)
+
+
+def concept_prefix(concept):
+    """
+    Partie du prompt commune à tous les apprenants d'un concept, et son nombre de tokens.
+    Un nom ou une explication modifiés donnent une autre entrée de cache.
+    """
+    return _concept_prefix(concept.id, concept.name, concept.explanation)
+
+
+def truncate(text, max_tokens):
+    """
+    Raccourcit `text` à environ `max_tokens` tokens, sans couper de mot.
+    """
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + "…"
+
+
+def format_turn(turn, max_tokens=None):
+    user, tutor = turn.get("user", ""), turn.get("tutor", "")
+    if max_tokens:
+        user, tutor = truncate(user, max_tokens), truncate(tutor, max_tokens)
+    return f"Apprenant : {user}\nProf : {tutor}"
+
+
+def format_history(history, token_budget, turn_max_tokens):
+    """
+    Sérialise l'historique dans `token_budget` tokens.
+    Le dernier échange est gardé en entier si possible ; les précédents sont
+    raccourcis, puis les plus anciens sont omis.
+    Retourne (texte, échanges gardés, échanges omis).
+    """
+    if not history:
+        return NO_HISTORY, 0, 0
+
+    lines = [format_turn(turn, turn_max_tokens) for turn in history[:-1]]
+    lines.append(format_turn(history[-1]))
+    if count_tokens(lines[-1]) > token_budget:
+        lines[-1] = format_turn(history[-1], turn_max_tokens)
+
+    if sum(count_tokens(line) + 1 for line in lines) > token_budget:
+        # Des échanges seront omis : garder la place de la mention qui le signale
+        token_budget -= count_tokens(OMITTED_TEMPLATE.format(count=len(history))) + 1
+
+    kept = []
+    used = 0
+    for line in reversed(lines):
+        line_tokens = count_tokens(line) + 1 # + le saut de ligne
+        if used + line_tokens > token_budget:
+            break
+        kept.append(line)
+        used += line_tokens
+    kept.reverse()
+
+    omitted = len(history) - len(kept)
+    if omitted:
+        kept.insert(0, OMITTED_TEMPLATE.format(count=omitted))
+    return "\n".join(kept), len(history) - omitted, omitted
+
+
+def build_prompt(concept, learner_name, mastery_score, history, user_message, options=None, summary=''):
+    """
+    Assemble le prompt d'un échange dans le budget de tokens configuré.
+    """
+    options = options or get_prompt_settings()
+    prefix, prefix_tokens = concept_prefix(concept)
+
+    fields = {"learner_name": learner_name, "mastery_score": mastery_score, "user_message": user_message}
+    summary_text = SUMMARY_TEMPLATE.format(summary=summary) + "\n" if summary else ""
+    fixed_tokens = (
+        prefix_tokens + count_tokens(LEARNER_TEMPLATE.format(history="", **fields)) + count_tokens(summary_text)
+    )
+    history_text, history_turns, omitted_turns = format_history(
+        history, options['TOKEN_BUDGET'] - fixed_tokens, options['TURN_MAX_TOKENS']
+    )
+    if summary and not history_turns and not omitted_turns:
+        history_text = "" # le résumé tient lieu d'historique
+    history_text = summary_text + history_text
+
+    text = prefix + LEARNER_TEMPLATE.format(history=history_text, **fields)
+    tokens = count_tokens(text)
+    metrics.inc("tutor_prompt_tokens_total", tokens)
+    if omitted_turns:
+        metrics.inc("tutor_prompt_omitted_turns_total", omitted_turns)
+    return Prompt(text, tokens, history_turns, omitted_turns)
@@ -0,0 +1,174 @@
+"""
+Cache des réponses du LLM.
+
+Les clés ne dépendent que de ce qui est commun à tous les apprenants : le concept
+(id + empreinte de la partie du prompt qui le décrit : nom, explication,
+consignes), l'historique normalisé et le message. Le nom
+de l'apprenant et son score n'en font pas partie, c'est donc à l'appelant de ne
+mettre en cache que des prompts qui ne les utilisent pas.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from .instrumentation import metrics
+from .prompts import concept_prefix
+
+DEFAULT_SETTINGS = {
+    'BACKEND': 'tutor.response_cache.LocMemBackend',
+    'TTL': 60 * 60 * 24, # 24h
+    'MAX_ENTRIES': 1000,
+    'CACHE_ALIAS': 'default',
+}
+
+def _normalize_text(text):
+    return " ".join(text.split()).lower()
+
+def make_key(concept, history, message):
+    """
+    Construit la clé de cache d'un échange, indépendante de l'apprenant.
+    """
+    # Tout ce que le prompt dit du concept : renommer un concept change aussi la clé
+    concept_hash = hashlib.sha256(concept_prefix(concept)[0].encode("utf-8")).hexdigest()
+    normalized_history = [
+        [_normalize_text(turn.get("user", "")), _normalize_text(turn.get("tutor", ""))]
+        for turn in history
+    ]
+    payload = json.dumps(
+        [concept.id, concept_hash, normalized_history, _normalize_text(message)],
+        ensure_ascii=False
+    )
+    return "tutor:response:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LocMemBackend:
+    """
+    Stockage en mémoire du processus, avec expiration (TTL) et éviction LRU.
+    """
+    def __init__(self, options):
+        self.max_entries = options['MAX_ENTRIES']
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoCacheBackend:
+    """
+    Stockage dans un cache Django (partagé entre processus si le cache l'est).
+    L'éviction est laissée au cache sous-jacent. Les entrées sont écrites sous
+    une génération (version du cache Django) : `clear` passe à la suivante sans
+    toucher aux autres données du cache.
+    """
+    GENERATION_KEY = 'tutor:response:generation'
+
+    def __init__(self, options):
+        self.cache = caches[options['CACHE_ALIAS']]
+
+    def _generation(self):
+        generation = self.cache.get(self.GENERATION_KEY)
+        if generation is None:
+            # Comme pour la version du programme : jamais réutilisée après une éviction
+            self.cache.add(self.GENERATION_KEY, time.time_ns() // 1000, timeout=None)
+            generation = self.cache.get(self.GENERATION_KEY)
+        return generation
+
+    def get(self, key):
+        return self.cache.get(key, version=self._generation())
+
+    def set(self, key, value, ttl):
+        self.cache.set(key, value, ttl or None, version=self._generation())
+
+    def delete(self, key):
+        self.cache.delete(key, version=self._generation())
+
+    def clear(self):
+        try:
+            self.cache.incr(self.GENERATION_KEY)
+        except ValueError:
+            self._generation()
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.backend.get(key)
+        metrics.inc("tutor_response_cache_requests_total", result="miss" if value is None else "hit")
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.ttl)
+
+    def contains(self, key):
+        # Sans compter de hit / miss : sert aux tâches de fond, pas aux apprenants
+        return self.backend.get(key) is not None
+
+    def clear(self):
+        self.backend.clear()
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """
+    Retourne le cache de réponses du processus, configuré par TUTOR_RESPONSE_CACHE.
+    """
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                options = {**DEFAULT_SETTINGS, **getattr(settings, 'TUTOR_RESPONSE_CACHE', {})}
+                backend = import_string(options['BACKEND'])(options)
+                _response_cache = ResponseCache(backend, options['TTL'])
+    return _response_cache
+
+@contextmanager
+def use_response_cache(response_cache):
+    """
+    Remplace temporairement le cache de réponses du processus (bancs d'essai).
+    """
+    global _response_cache
+    with _response_cache_lock:
+        previous, _response_cache = _response_cache, response_cache
+    try:
+        yield response_cache
+    finally:
+        with _response_cache_lock:
+            _response_cache = previous
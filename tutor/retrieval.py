@@ -0,0 +1,453 @@
+"""
+Index sémantique des concepts, pour orienter un message vers le concept dont il parle.
+
+Chaque concept (nom + explication) est représenté par un vecteur calculé
+localement, sans modèle ni service externe : les mots et leurs trigrammes de
+caractères sont hachés dans DIMENSIONS composantes, puis le vecteur est
+normalisé. Un message est comparé aux concepts par produit scalaire (cosinus).
+
+Deux modes de recherche :
+- exhaustif : un produit matrice-vecteur sur tous les concepts ;
+- approché (IVF), dès APPROXIMATE_FROM concepts : les vecteurs sont regroupés
+  en grappes (k-means) et rangés grappe par grappe. Une recherche compare le
+  message aux centres, puis seulement aux concepts des PROBES grappes les plus
+  proches, soit quelques milliers de vecteurs même pour un très gros programme.
+
+L'index est construit hors ligne (`manage.py build_concept_index`) dans
+INDEX_DIR ; les vecteurs y sont lus en mémoire partagée (np.load en mmap).
+Quand le programme change, chaque processus met son index à jour en tâche de
+fond (seuls les concepts ajoutés ou modifiés sont recalculés) et continue de
+servir l'index précédent en attendant : aucune requête n'attend ce calcul.
+
+Un message n'est réorienté que s'il demande explicitement un concept
+(« je veux apprendre… », « c'est quoi… », voir INTENT_RE) : une simple réponse
+à la question du tuteur (« c'est un nombre entier ») ne fait pas changer de
+concept. Le concept demandé doit aussi dépasser MIN_SCORE et battre le concept
+en cours d'au moins MARGIN.
+
+NumPy est facultatif : sans lui, ou sans index construit, aucun message n'est réorienté.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+import uuid
+import zlib
+from pathlib import Path
+
+from django.conf import settings
+
+from expert.curriculum import get_curriculum_version
+from .instrumentation import metrics
+
+try:
+    import numpy as np
+except ImportError: # dépendance facultative
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'INDEX_DIR': Path(settings.BASE_DIR) / 'var' / 'concept_index',
+    'DIMENSIONS': 256,
+    'MIN_SCORE': 0.35,
+    'MARGIN': 0.1,
+    'APPROXIMATE_FROM': 5000,
+    'PROBES': 8,
+}
+
+META_FILE = 'index.npz'
+
+# Âge (secondes) à partir duquel un ancien fichier de vecteurs est supprimé : un
+# processus qui vient de lire les anciennes métadonnées a largement eu le temps de l'ouvrir
+STALE_VECTORS_AFTER = 3600
+
+# Délai (secondes) après lequel une mise à jour demandée mais pas encore commencée
+# est redemandée (tâche perdue, processus redémarré...)
+REFRESH_TIMEOUT = 60
+
+# Mots trop fréquents pour distinguer deux concepts
+STOP_WORDS = frozenset("""
+a au aux avec ce ces cette c comment d dans de des du elle en est et il ils je
+l la le les leur mais me mon ne on ou par pas pour qu que quel quelle qui sa se
+ses son sont sur ta te tes ton tu un une vous nous y est-ce
+the a an and is of to in what how
+""".split())
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Demandes explicites de changer de sujet (texte en minuscules, sans accents)
+INTENT_RE = re.compile(
+    r"\b(apprendre|apprends|expliqu\w*|parle\w*|passe\w* a|revoir|c est quoi|qu est ce|"
+    r"learn|explain|teach|what is)\b"
+)
+
+
+def get_retrieval_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TUTOR_RETRIEVAL', {})}
+
+
+def _normalize(text):
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def asks_for_concept(text):
+    """
+    True si le message demande explicitement à apprendre ou à revoir quelque chose.
+    """
+    return INTENT_RE.search(' '.join(TOKEN_RE.findall(_normalize(text)))) is not None
+
+
+def _features(text):
+    """
+    Mots (sans accents ni mots vides) et trigrammes de caractères, avec leur poids.
+    Les trigrammes rapprochent les variantes d'un même mot (« variable », « variables »).
+    """
+    for word in TOKEN_RE.findall(_normalize(text)):
+        if word in STOP_WORDS:
+            continue
+        yield word, 1.0
+        padded = f"<{word}>"
+        for start in range(len(padded) - 2):
+            yield padded[start:start + 3], 0.5
+
+
+def embed(text, dimensions):
+    """
+    Vecteur normalisé (float32) du texte. Les valeurs de hachage (crc32) sont
+    stables d'un processus à l'autre, contrairement à hash().
+    """
+    features = list(_features(text))
+    codes = np.fromiter((zlib.crc32(feature.encode('utf-8')) for feature, _ in features), np.uint32, len(features))
+    weights = np.fromiter((weight for _, weight in features), np.float32, len(features))
+    # Le signe, tiré d'un autre bit, compense en moyenne les collisions
+    weights[codes < 0x80000000] *= -1
+    vector = np.bincount(codes % dimensions, weights=weights, minlength=dimensions).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+
+def concept_text(name, explanation):
+    # Le nom compte double : c'est ce que l'apprenant cite le plus souvent
+    return f"{name} {name} {explanation}"
+
+
+def fingerprint(name, explanation):
+    return zlib.crc32(concept_text(name, explanation).encode('utf-8'))
+
+
+def _kmeans(vectors, clusters, iterations=10, seed=0):
+    """
+    k-means sphérique (vecteurs normalisés, similarité cosinus). Retourne les centres.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _assign(vectors, centroids)
+        for cluster in range(clusters):
+            members = vectors[assignments == cluster]
+            if len(members):
+                centroid = members.sum(axis=0)
+                norm = np.linalg.norm(centroid)
+                centroids[cluster] = centroid / norm if norm else centroid
+    return centroids
+
+
+def _assign(vectors, centroids, chunk_size=4096):
+    """
+    Grappe la plus proche de chaque vecteur, par blocs pour borner la mémoire.
+    """
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk_size):
+        assignments[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+    return assignments
+
+
+class ConceptIndex:
+    """
+    Vecteurs des concepts, rangés grappe par grappe si l'index est approché.
+
+    ids[i] est l'id du concept du vecteur vectors[i] ; les vecteurs de la grappe
+    c occupent les lignes offsets[c] à offsets[c + 1]. Sans grappes (mode
+    exhaustif), centroids est vide.
+    """
+    def __init__(self, ids, fingerprints, vectors, centroids, offsets, version=None, source=None):
+        self.ids = ids
+        self.fingerprints = fingerprints
+        self.vectors = vectors
+        self.centroids = centroids
+        self.offsets = offsets
+        self.version = version
+        self.source = source # date du fichier dont l'index a été lu
+        self.embedded = 0 # vecteurs calculés par build()
+        self.dimensions = vectors.shape[1]
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def approximate(self):
+        return len(self.centroids) > 0
+
+    @classmethod
+    def build(cls, rows, options=None, version=None, previous=None):
+        """
+        Construit l'index à partir de (id, nom, explication).
+        Les vecteurs de `previous` sont repris pour les concepts inchangés ; ses
+        centres aussi, sauf si le nombre de concepts justifie un autre découpage.
+        """
+        options = options or get_retrieval_settings()
+        dimensions = options['DIMENSIONS']
+        reusable = {}
+        if previous is not None and previous.dimensions == dimensions:
+            reusable = {
+                concept_id: (concept_fingerprint, row)
+                for row, (concept_id, concept_fingerprint)
+                in enumerate(zip(previous.ids.tolist(), previous.fingerprints.tolist()))
+            }
+
+        ids, fingerprints, vectors = [], [], []
+        embedded = 0
+        for concept_id, name, explanation in rows:
+            concept_fingerprint = fingerprint(name, explanation)
+            ids.append(concept_id)
+            fingerprints.append(concept_fingerprint)
+            known = reusable.get(concept_id)
+            if known is not None and known[0] == concept_fingerprint:
+                vectors.append(previous.vectors[known[1]])
+            else:
+                vectors.append(embed(concept_text(name, explanation), dimensions))
+                embedded += 1
+        metrics.inc("tutor_retrieval_embedded_concepts_total", embedded)
+        if previous is not None and not embedded and len(ids) == len(previous):
+            # Rien n'a changé : on garde les tableaux (et le mmap) de l'index précédent
+            return cls(
+                previous.ids, previous.fingerprints, previous.vectors, previous.centroids,
+                previous.offsets, version, previous.source,
+            )
+        index = cls._arrange(ids, fingerprints, vectors, options, version, previous)
+        # Même origine que l'index repris : une mise à jour suivante repartira de celui-ci
+        index.source = previous.source if previous is not None else None
+        index.embedded = embedded
+        return index
+
+    @classmethod
+    def _arrange(cls, ids, fingerprints, vectors, options, version, previous):
+        """
+        Range les vecteurs grappe par grappe si le programme est assez grand.
+        """
+        dimensions = options['DIMENSIONS']
+
+        ids = np.array(ids, dtype=np.int64)
+        fingerprints = np.array(fingerprints, dtype=np.uint32)
+        vectors = np.array(vectors, dtype=np.float32).reshape(len(ids), dimensions)
+
+        if len(ids) < options['APPROXIMATE_FROM']:
+            centroids = np.empty((0, dimensions), dtype=np.float32)
+            return cls(ids, fingerprints, vectors, centroids, np.array([0, len(ids)]), version)
+
+        clusters = int(np.sqrt(len(ids)))
+        if previous is not None and previous.approximate and abs(len(previous.centroids) - clusters) <= clusters // 4:
+            centroids = np.array(previous.centroids)
+        else:
+            centroids = _kmeans(vectors, clusters)
+        assignments = _assign(vectors, centroids)
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+        return cls(ids[order], fingerprints[order], vectors[order], centroids, offsets, version)
+
+    def search(self, text, limit=1, probes=None):
+        """
+        Concepts les plus proches du texte : liste de (id du concept, score), du meilleur au moins bon.
+        """
+        return self._search(embed(text, self.dimensions), limit, probes)
+
+    def _search(self, query, limit=1, probes=None):
+        if not len(self.ids):
+            return []
+        if self.approximate:
+            probes = min(probes or get_retrieval_settings()['PROBES'], len(self.centroids))
+            nearest = np.argpartition(self.centroids @ query, -probes)[-probes:]
+            rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in nearest])
+        else:
+            rows = None
+        if rows is not None and len(rows):
+            scores = self.vectors[rows] @ query
+        else:
+            # Mode exhaustif, ou grappes sondées toutes vides : on parcourt tout
+            rows = None
+            scores = self.vectors @ query
+        limit = min(limit, len(scores))
+        best = np.argpartition(scores, -limit)[-limit:]
+        best = best[np.argsort(scores[best])[::-1]]
+        positions = rows[best] if rows is not None else best
+        return [(int(self.ids[position]), float(scores[index])) for position, index in zip(positions, best)]
+
+    def similarity(self, query, concept_id):
+        """
+        Score du concept pour le vecteur `query` (0 s'il n'est pas dans l'index).
+        """
+        positions = np.flatnonzero(self.ids == concept_id)
+        return float(self.vectors[positions[0]] @ query) if len(positions) else 0.0
+
+    def save(self, directory):
+        """
+        Écrit l'index dans `directory`. Les vecteurs vont dans un nouveau fichier
+        et les métadonnées sont remplacées en dernier, d'un coup : un processus
+        qui lit l'index au même moment voit l'ancien ou le nouveau, jamais un mélange.
+        Les anciens fichiers de vecteurs ne sont supprimés qu'après STALE_VECTORS_AFTER.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        vectors_file = f"vectors-{uuid.uuid4().hex}.npy"
+        np.save(directory / vectors_file, self.vectors)
+        temporary = directory / f"{META_FILE}.{uuid.uuid4().hex}.tmp.npz"
+        np.savez(
+            temporary, ids=self.ids, fingerprints=self.fingerprints, centroids=self.centroids,
+            offsets=self.offsets, vectors_file=np.array(vectors_file),
+            version=np.array(-1 if self.version is None else self.version),
+        )
+        os.replace(temporary, directory / META_FILE)
+        stale_before = time.time() - STALE_VECTORS_AFTER
+        for old in directory.glob("vectors-*.npy"):
+            try:
+                if old.name != vectors_file and old.stat().st_mtime < stale_before:
+                    old.unlink()
+            except FileNotFoundError:
+                pass # supprimé par un autre processus
+
+    @classmethod
+    def load(cls, directory, attempts=3):
+        """
+        Lit l'index de `directory` (None s'il n'existe pas). Les vecteurs ne
+        sont pas copiés : ils restent dans le fichier, partagés entre processus.
+        """
+        directory = Path(directory)
+        for attempt in range(attempts):
+            try:
+                source = (directory / META_FILE).stat().st_mtime_ns
+                with np.load(directory / META_FILE) as meta:
+                    fields = {name: meta[name] for name in meta.files}
+                vectors = np.load(directory / str(fields.pop('vectors_file')), mmap_mode='r')
+                break
+            except FileNotFoundError:
+                # Pas d'index, ou vecteurs remplacés entre-temps : on relit les métadonnées
+                if attempt == attempts - 1:
+                    return None
+        version = int(fields['version']) if 'version' in fields else -1
+        return cls(
+            fields['ids'], fields['fingerprints'], vectors, fields['centroids'], fields['offsets'],
+            version=None if version < 0 else version, source=source,
+        )
+
+
+def _concept_rows():
+    from expert.models import Concept
+
+    return Concept.objects.order_by('id').values_list('id', 'name', 'explanation').iterator(chunk_size=2000)
+
+
+_index = None
+_index_lock = threading.Lock()
+_refresh_requested_at = None
+
+def _index_source(options):
+    try:
+        return (Path(options['INDEX_DIR']) / META_FILE).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _empty_index(options, version):
+    logger.info("No concept index in %s: run `manage.py build_concept_index`.", options['INDEX_DIR'])
+    return ConceptIndex.build([], options, version)
+
+def get_concept_index():
+    """
+    Retourne l'index des concepts, ou None si NumPy manque.
+    Au premier accès, l'index est lu sur disque, sans calcul. Quand la version
+    du programme change, la mise à jour part en tâche de fond (voir
+    `refresh_concept_index`) et l'index actuel reste servi jusque-là.
+    """
+    global _index
+    if np is None:
+        return None
+    version = get_curriculum_version()
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                options = get_retrieval_settings()
+                _index = ConceptIndex.load(options['INDEX_DIR']) or _empty_index(options, version)
+    if _index.version != version:
+        _schedule_refresh()
+    return _index
+
+def _schedule_refresh():
+    global _refresh_requested_at
+    now = time.monotonic()
+    with _index_lock:
+        if _refresh_requested_at is not None and now - _refresh_requested_at < REFRESH_TIMEOUT:
+            return
+        _refresh_requested_at = now
+    from .tasks import schedule_index_refresh # import local : les tâches dépendent de ce module
+
+    schedule_index_refresh()
+
+def refresh_concept_index():
+    """
+    Met l'index à jour pour la version actuelle du programme (tâche de fond) :
+    relu sur disque s'il y a été reconstruit, puis complété des concepts modifiés.
+    """
+    global _index, _refresh_requested_at
+    with _index_lock:
+        _refresh_requested_at = None # une modification pendant le calcul demandera un autre passage
+    version = get_curriculum_version()
+    current = _index
+    if current is not None and current.version == version:
+        return current
+    options = get_retrieval_settings()
+    source = _index_source(options)
+    if source is None:
+        index = _empty_index(options, version)
+    else:
+        # On repart de l'index en mémoire, sauf s'il a été reconstruit sur disque
+        previous = current if current is not None and current.source == source else None
+        previous = previous or ConceptIndex.load(options['INDEX_DIR'])
+        index = ConceptIndex.build(_concept_rows(), options, version, previous=previous)
+    with _index_lock:
+        _index = index
+    return index
+
+def invalidate_concept_index():
+    global _index, _refresh_requested_at
+    with _index_lock:
+        _index = None
+        _refresh_requested_at = None
+
+def route_message(text, current_concept_id=None):
+    """
+    Id du concept que le message demande explicitement, ou None si le message ne
+    demande rien, si aucun concept n'est assez proche (MIN_SCORE), ou si le
+    concept en cours lui correspond presque aussi bien (MARGIN).
+    """
+    # Test du message d'abord : la plupart des échanges ne demandent rien, et
+    # n'ont pas besoin de l'index
+    if not text.strip() or not asks_for_concept(text):
+        return None
+    index = get_concept_index()
+    if index is None:
+        return None
+    options = get_retrieval_settings()
+    query = embed(text, index.dimensions)
+    results = index._search(query)
+    if not results or results[0][1] < options['MIN_SCORE']:
+        return None
+    concept_id, score = results[0]
+    if current_concept_id is not None and concept_id != current_concept_id:
+        if score - index.similarity(query, current_concept_id) < options['MARGIN']:
+            return None
+    return concept_id
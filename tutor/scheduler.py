@@ -0,0 +1,300 @@
+"""
+Ordonnanceur des appels au LLM : regroupement, quotas et priorités.
+
+- Regroupement (« single-flight ») : des appels simultanés avec le même prompt
+  et la même priorité (ex: toute une classe qui ouvre la même leçon) ne partent
+  qu'une fois ; les suivants attendent et reçoivent la même réponse (ou la même
+  erreur). Un échange n'attend pas plus de MAX_WAIT que l'appel parte.
+- Quotas : deux seaux à jetons, en requêtes et en tokens (estimés) par minute,
+  gardent le processus sous les limites du fournisseur (REQUESTS_PER_MINUTE,
+  TOKENS_PER_MINUTE ; 0 = sans limite).
+- Priorités : les tâches de fond (voir tutor/task_queue.py) passent après les
+  échanges des apprenants et laissent toujours BACKGROUND_RESERVE du quota aux
+  échanges.
+- Contre-pression : un échange qui devrait attendre plus de MAX_WAIT secondes
+  échoue tout de suite avec `RateLimitExceeded`, qui indique quand réessayer
+  (réponse 429 avec Retry-After, voir learner/views.py). Une erreur de quota
+  renvoyée par le fournisseur suspend aussi les appels pendant PAUSE_ON_RATE_LIMIT.
+
+Les quotas sont comptés par processus.
+"""
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from .instrumentation import estimate_tokens, metrics
+
+DEFAULT_SETTINGS = {
+    'REQUESTS_PER_MINUTE': 1000,
+    'TOKENS_PER_MINUTE': 1_000_000,
+    'RESPONSE_TOKENS': 150, # tokens de réponse comptés d'avance pour chaque appel
+    'MAX_WAIT': 3, # secondes d'attente max pour un échange, avant de répondre 429
+    'BACKGROUND_RESERVE': 0.2, # part du quota réservée aux échanges
+    'PAUSE_ON_RATE_LIMIT': 5, # secondes, après une erreur de quota du fournisseur
+}
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+# Appel regroupé en cours dans ce contexte (voir LLMScheduler.coalesce)
+_flight = contextvars.ContextVar("llm_flight", default=None)
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"LLM rate limit reached, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def get_scheduler_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TUTOR_SCHEDULER', {})}
+
+
+def current_priority():
+    return _priority.get()
+
+
+@contextlib.contextmanager
+def background_priority():
+    """
+    Les appels au LLM faits dans ce bloc passent après ceux des apprenants.
+    """
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """
+    `per_minute` unités par minute, avec des rafales possibles jusqu'à la même valeur.
+    Le verrou est celui de l'ordonnanceur.
+    """
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated_at = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, amount, reserve=0.0):
+        """
+        Secondes à attendre avant de pouvoir prendre `amount` en laissant `reserve` (part du seau).
+        """
+        if not self.capacity:
+            return 0.0
+        # Jamais plus que la capacité : sinon un appel trop gros attendrait sans fin
+        needed = min(self.capacity, min(amount, self.capacity) + reserve * self.capacity)
+        return max(0.0, (needed - self.level) / self.rate)
+
+    def take(self, amount):
+        if self.capacity:
+            self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + min(amount, self.capacity))
+
+
+class _Flight:
+    def __init__(self):
+        self.admitted = threading.Event() # l'appel a eu sa place dans les quotas
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class LLMScheduler:
+    def __init__(self, options=None):
+        self.options = options or get_scheduler_settings()
+        self.requests = TokenBucket(self.options['REQUESTS_PER_MINUTE'])
+        self.tokens = TokenBucket(self.options['TOKENS_PER_MINUTE'])
+        self.paused_until = 0.0
+        self._interactive_waiting = 0
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def _cost(self, prompt):
+        return estimate_tokens(prompt) + self.options['RESPONSE_TOKENS']
+
+    def _try_acquire(self, cost, priority):
+        """
+        Prend une requête et `cost` tokens si possible ; sinon retourne le délai
+        à attendre (0 si c'est fait).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            delay = self.paused_until - now
+            reserve = 0.0
+            if priority == BACKGROUND:
+                reserve = self.options['BACKGROUND_RESERVE']
+                if self._interactive_waiting:
+                    # Un échange attend : on lui laisse la place
+                    delay = max(delay, 0.05)
+            delay = max(delay, self.requests.delay(1, reserve), self.tokens.delay(cost, reserve))
+            if delay <= 0:
+                self.requests.take(1)
+                self.tokens.take(cost)
+            return delay
+
+    def _waiting(self, priority, change):
+        if priority == INTERACTIVE:
+            with self._lock:
+                self._interactive_waiting += change
+
+    def _admitted(self):
+        flight = _flight.get()
+        if flight is not None:
+            flight.admitted.set()
+
+    def _check_deadline(self, delay, deadline, priority):
+        now = time.monotonic()
+        if priority == INTERACTIVE and now + delay > deadline:
+            metrics.inc("tutor_llm_scheduler_total", priority=priority, outcome="rejected")
+            raise RateLimitExceeded(max(1, math.ceil(delay)))
+        return delay if priority == BACKGROUND else min(delay, deadline - now)
+
+    def acquire(self, prompt):
+        """
+        Attend une place dans les quotas pour envoyer `prompt`.
+        Lève `RateLimitExceeded` si un échange devrait attendre plus de MAX_WAIT.
+        """
+        priority = _priority.get()
+        cost = self._cost(prompt)
+        deadline = time.monotonic() + self.options['MAX_WAIT']
+        delay = self._try_acquire(cost, priority)
+        if delay <= 0:
+            metrics.inc("tutor_llm_scheduler_total", priority=priority, outcome="immediate")
+            self._admitted()
+            return
+        self._waiting(priority, 1)
+        try:
+            while delay > 0:
+                time.sleep(self._check_deadline(delay, deadline, priority))
+                delay = self._try_acquire(cost, priority)
+        finally:
+            self._waiting(priority, -1)
+        metrics.inc("tutor_llm_scheduler_total", priority=priority, outcome="delayed")
+        self._admitted()
+
+    async def aacquire(self, prompt):
+        """
+        Équivalent de `acquire` pour la boucle asyncio, sans bloquer de thread.
+        """
+        priority = _priority.get()
+        cost = self._cost(prompt)
+        deadline = time.monotonic() + self.options['MAX_WAIT']
+        delay = self._try_acquire(cost, priority)
+        if delay <= 0:
+            metrics.inc("tutor_llm_scheduler_total", priority=priority, outcome="immediate")
+            return
+        self._waiting(priority, 1)
+        try:
+            while delay > 0:
+                await asyncio.sleep(self._check_deadline(delay, deadline, priority))
+                delay = self._try_acquire(cost, priority)
+        finally:
+            self._waiting(priority, -1)
+        metrics.inc("tutor_llm_scheduler_total", priority=priority, outcome="delayed")
+
+    def refund(self, prompt):
+        """
+        Rend le quota pris par `acquire` pour un appel qui n'a finalement pas été envoyé.
+        """
+        cost = self._cost(prompt)
+        with self._lock:
+            self.requests.give_back(1)
+            self.tokens.give_back(cost)
+
+    def pause(self, seconds=None):
+        """
+        Suspend les appels (le fournisseur a signalé un dépassement de quota).
+        """
+        seconds = self.options['PAUSE_ON_RATE_LIMIT'] if seconds is None else seconds
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def retry_after(self):
+        """
+        Secondes avant la reprise des appels (au moins 1), pour l'en-tête Retry-After.
+        """
+        with self._lock:
+            return max(1, math.ceil(self.paused_until - time.monotonic()))
+
+    def coalesce(self, prompt, call):
+        """
+        Exécute `call()` une seule fois pour tous les appels simultanés avec ce
+        prompt et cette priorité. Un échange qui suit un appel encore en attente
+        de quota lève `RateLimitExceeded` après MAX_WAIT, comme s'il attendait lui-même.
+        """
+        priority = _priority.get()
+        key = (priority, hashlib.sha256(prompt.encode("utf-8")).digest())
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            metrics.inc("tutor_llm_coalesced_total")
+            if priority == INTERACTIVE:
+                self._waiting(priority, 1)
+                try:
+                    admitted = flight.admitted.wait(self.options['MAX_WAIT'])
+                finally:
+                    self._waiting(priority, -1)
+                if not admitted:
+                    metrics.inc("tutor_llm_scheduler_total", priority=priority, outcome="rejected")
+                    raise RateLimitExceeded(max(1, math.ceil(self.options['MAX_WAIT'])))
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        token = _flight.set(flight)
+        try:
+            flight.result = call()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            _flight.reset(token)
+            with self._lock:
+                del self._flights[key]
+            flight.admitted.set()
+            flight.done.set()
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """
+    Retourne l'ordonnanceur du processus, configuré par TUTOR_SCHEDULER.
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler()
+    return _scheduler
+
+def reset_scheduler():
+    """
+    Oublie l'ordonnanceur (réglages modifiés, tests).
+    """
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = None
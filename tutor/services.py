@@ -1,12 +1,113 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from expert.curriculum import get_curriculum_snapshot
 from expert.models import Concept, Skill
-from learner.models import LearnerProgress
-from .llm_client import GeminiClient
+from learner.models import InteractionLog, LearnerProgress
+from .cursor import clear_cursor, get_cursor, set_cursor
+from .grading import grading_enabled
+from .instrumentation import metrics, span
+from .llm_client import LLMError, get_llm_client, get_llm_settings
+from .prompts import ANONYMOUS_LEARNER, build_prompt
+from .retrieval import route_message
+from .response_cache import get_response_cache, make_key
+from .tasks import append_interaction_log, merge_pending, schedule_grading, schedule_prefetch, schedule_summaries
+
+# Score à partir duquel un concept est considéré comme maîtrisé
+MASTERY_THRESHOLD = 0.9
+
+# Augmentation du score à chaque échange, sans notation par le LLM
+MASTERY_STEP = 0.1
+
+# Score à partir duquel l'ouverture du concept suivant est préparée à l'avance
+PREFETCH_FROM = 0.7
+
+# Durée max d'une préparation : au-delà, un autre processus peut la reprendre
+PREFETCH_LOCK_TIMEOUT = 60
+
+# Nombre d'échanges précédents repris dans le prompt
+HISTORY_WINDOW = 3
+
+# Message synthétique envoyé au LLM pour ouvrir une leçon
+LESSON_OPENER_MESSAGE = "Commençons cette leçon."
+
+COMPLETED_RESPONSE = {
+    "tutor_response": "Félicitations ! Vous avez terminé tous les modules disponibles pour le moment.",
+    "current_concept_name": "Terminé",
+    "mastery_score": 1.0
+}
+
+def _progress_changes(progress):
+    """
+    Valeurs à écrire sur la progression après un échange. Le score est incrémenté
+    par la base (F) : une autre mise à jour de la ligne entre-temps n'est pas perdue.
+    Avec la notation par le LLM, seul tutor.grading modifie le score.
+    """
+    changes = {'last_interaction_at': progress.last_interaction_at}
+    if not grading_enabled():
+        changes['mastery_score'] = Least(F('mastery_score') + MASTERY_STEP, Value(1.0))
+    return changes
+
+def _nearing_mastery(progress):
+    return PREFETCH_FROM <= progress.mastery_score < MASTERY_THRESHOLD
+
+def predict_next_concept_id(learner_id, current_concept_id):
+    """
+    Concept que `_compute_next_concept` choisira une fois le concept en cours
+    maîtrisé, s'il s'agit d'un nouveau concept (ouvert par LESSON_OPENER_MESSAGE).
+    Retourne None si l'apprenant reprendra plutôt un concept déjà commencé.
+    """
+    progresses = LearnerProgress.objects.filter(learner_id=learner_id)
+    if progresses.filter(mastery_score__lt=MASTERY_THRESHOLD).exclude(concept_id=current_concept_id).exists():
+        return None
+    learned_concept_ids = set(progresses.values_list('concept_id', flat=True))
+    return get_curriculum_snapshot().first_unseen_concept_id(learned_concept_ids | {current_concept_id})
+
+def opener_prompt(concept):
+    """
+    Prompt d'ouverture de leçon : identique pour tous les apprenants (voir `_prepare_interaction`).
+    """
+    return build_prompt(concept, ANONYMOUS_LEARNER, 0.0, [], LESSON_OPENER_MESSAGE).text
+
+def prefetch_next_openers(pairs):
+    """
+    Pour des apprenants proches de la maîtrise (apprenant, concept en cours),
+    génère et met en cache l'ouverture de leur prochain concept : le premier
+    message sur ce concept n'attendra pas le LLM.
+    Une ouverture déjà en cache, ou en cours de préparation ailleurs, n'est pas regénérée.
+    """
+    next_concept_ids = {predict_next_concept_id(learner_id, concept_id) for learner_id, concept_id in pairs}
+    next_concept_ids.discard(None)
+    response_cache = get_response_cache()
+    for concept in Concept.objects.filter(id__in=next_concept_ids):
+        cache_key = make_key(concept, [], LESSON_OPENER_MESSAGE)
+        lock_key = f"tutor:prefetch:{cache_key}"
+        if response_cache.contains(cache_key) or not cache.add(lock_key, 1, PREFETCH_LOCK_TIMEOUT):
+            metrics.inc("tutor_prefetch_total", result="skipped")
+            continue
+        try:
+            response_cache.set(cache_key, get_llm_client().generate_response(opener_prompt(concept)))
+            metrics.inc("tutor_prefetch_total", result="generated")
+        except LLMError:
+            # Sans conséquence : l'ouverture sera générée à la demande
+            metrics.inc("tutor_prefetch_total", result="failed")
+        finally:
+            cache.delete(lock_key)
 
 class TutorService:
     def __init__(self, learner_profile):
         self.learner = learner_profile
-        self.llm_client = GeminiClient()
+        self.llm_client = get_llm_client()
+        self.response_cache = get_response_cache()
 
+    @span("progress")
     def _get_or_create_progress(self, concept):
         progress, created = LearnerProgress.objects.get_or_create(
             learner=self.learner,
@@ -14,109 +115,188 @@ class TutorService:
         )
         return progress
 
-    def _determine_next_concept(self):
+    @span("select")
+    def _determine_next_concept(self, user_message=None):
         """
         Logique simple pour choisir le prochain concept.
-        Priorité 1: Concepts commencés mais non maîtrisés (score < 0.9).
-        Priorité 2: Nouveaux concepts dans l'ordre de l'arbre.
+        Priorité 1: Le concept que le message demande explicitement (voir
+                    tutor/retrieval.py), s'il n'est pas déjà maîtrisé : l'apprenant y saute.
+        Priorité 2: Concepts commencés mais non maîtrisés (score < 0.9).
+        Priorité 3: Nouveaux concepts dans l'ordre de l'arbre.
+
+        Le résultat est mémorisé dans le curseur de l'apprenant : tant que le concept
+        n'est pas maîtrisé et que le programme ne change pas, une simple lecture par
+        clé primaire suffit.
+        """
+        cursor_concept_id = get_cursor(self.learner.id)
+
+        routed_concept_id = route_message(user_message, cursor_concept_id) if user_message else None
+        if routed_concept_id is not None and routed_concept_id != cursor_concept_id:
+            concept = Concept.objects.filter(id=routed_concept_id).exclude(
+                learnerprogress__learner=self.learner,
+                learnerprogress__mastery_score__gte=MASTERY_THRESHOLD,
+            ).first()
+            if concept:
+                set_cursor(self.learner.id, concept.id)
+                metrics.inc("tutor_retrieval_routed_total")
+                return concept
+
+        if cursor_concept_id is not None:
+            concept = Concept.objects.filter(id=cursor_concept_id).first()
+            if concept:
+                return concept
+
+        next_concept = self._compute_next_concept()
+        if next_concept:
+            set_cursor(self.learner.id, next_concept.id)
+        return next_concept
+
+    def _compute_next_concept(self):
+        """
+        Parcours complet du programme, utilisé quand le curseur est absent ou périmé.
         """
         # Chercher un concept en cours avec un faible score
         in_progress_concepts = LearnerProgress.objects.filter(
             learner=self.learner,
-            mastery_score__lt=0.9
+            mastery_score__lt=MASTERY_THRESHOLD
         ).order_by('last_interaction_at').first()
 
         if in_progress_concepts:
             return in_progress_concepts.concept
 
         # Sinon, trouver le premier concept jamais vu
-        learned_concept_ids = LearnerProgress.objects.filter(learner=self.learner).values_list('concept_id', flat=True)
-        
-        # On prend le premier concept de l'arbre qui n'a pas été appris
-        # Note: une vraie logique suivrait les dépendances de l'arbre MPTT
-        next_concept = Concept.objects.exclude(id__in=learned_concept_ids).order_by('skill__tree_id', 'skill__lft', 'id').first()
+        learned_concept_ids = set(
+            LearnerProgress.objects.filter(learner=self.learner).values_list('concept_id', flat=True)
+        )
 
-        return next_concept
+        # On prend le premier concept de l'arbre qui n'a pas été appris, en
+        # parcourant l'instantané du programme plutôt que la table Concept
+        next_concept_id = get_curriculum_snapshot().first_unseen_concept_id(learned_concept_ids)
+        if next_concept_id is None:
+            return None
+        return Concept.objects.filter(id=next_concept_id).first()
 
-    def _build_prompt(self, concept, user_message, progress):
+    def _get_recent_history(self, concept):
         """
-        Construit le prompt pour le LLM. C'est la partie la plus créative !
+        Lit uniquement les HISTORY_WINDOW derniers échanges, dans l'ordre chronologique.
         """
-        # Récupérer un peu d'historique
-        history = progress.interaction_history[-3:] # Les 3 dernières interactions
-
-        prompt = f"""
-        Tu es un tuteur intelligent, patient et encourageant. Ton nom est "Prof".
-        Ton objectif est d'aider un apprenant à maîtriser un concept spécifique.
-
-        **Règles strictes :**
-        1.  Ne parle que du concept actuel. Ne dérive pas sur d'autres sujets.
-        2.  Utilise un langage simple et des analogies.
-        3.  Termine TOUJOURS ta réponse par une question simple pour vérifier la compréhension de l'apprenant.
-        4.  Garde tes réponses courtes et directes (2-3 phrases maximum).
-
-        ---
-        **CONTEXTE DE L'APPRENANT**
-        - Nom de l'apprenant : {self.learner.user.username}
-        - Score de maîtrise actuel sur ce concept : {progress.mastery_score:.2f}
-
-        **CONCEPT ACTUEL À ENSEIGNER**
-        - Nom du concept : {concept.name}
-        - Explication de base : {concept.explanation}
+        recent_logs = InteractionLog.objects.filter(
+            learner=self.learner,
+            concept=concept
+        ).order_by('-created_at', '-id')[:HISTORY_WINDOW]
+        # Plus les échanges pas encore écrits par la file de tâches
+        recent_logs = merge_pending(list(reversed(recent_logs)), self.learner.id, concept.id)
+        return [log.as_turn() for log in recent_logs[-HISTORY_WINDOW:]]
 
-        **HISTORIQUE DE LA CONVERSATION (sur ce concept)**
-        {history if history else "C'est notre première interaction sur ce sujet."}
+    def _build_prompt(self, concept, user_message, progress, history, anonymous=False):
+        """
+        Construit le prompt pour le LLM (voir tutor/prompts.py) : le résumé des
+        échanges anciens (voir tutor/summaries.py) puis les derniers échanges.
+        En mode `anonymous`, le prompt ne contient rien de propre à l'apprenant
+        et la réponse peut être partagée via le cache.
+        """
+        learner_name = ANONYMOUS_LEARNER if anonymous else self.learner.user.username
+        mastery_score = 0.0 if anonymous else progress.mastery_score
+        summary = '' if anonymous else progress.summary
+        prompt = build_prompt(concept, learner_name, mastery_score, history, user_message, summary=summary)
+        return prompt.text
 
-        ---
-        **DERNIER MESSAGE DE L'APPRENANT :**
-        "{user_message}"
-        ---
-        
-        Ta réponse (en tant que Prof, courte, simple, et se terminant par une question) :
+    def _apply_interaction(self, progress, user_message, tutor_response):
         """
-        return prompt.strip()
+        Met à jour le modèle de l'apprenant après l'interaction, en mémoire.
+        Sans notation par le LLM (TUTOR_GRADING), on augmente simplement le score
+        un peu à chaque interaction ; sinon le score est mis à jour plus tard, par
+        tutor.grading, d'après la réponse de l'apprenant.
+        Retourne l'entrée de journal à insérer.
+        """
+        if not grading_enabled():
+            progress.mastery_score = min(1.0, progress.mastery_score + MASTERY_STEP) # Augmentation simpliste
+        progress.last_interaction_at = timezone.now()
+        if progress.mastery_score >= MASTERY_THRESHOLD:
+            # Concept maîtrisé : le prochain sera recalculé au message suivant
+            clear_cursor(self.learner.id)
 
+        return InteractionLog(
+            learner=self.learner,
+            concept=progress.concept,
+            user_message=user_message,
+            tutor_response=tutor_response
+        )
+
+    @span("save")
     def _update_progress(self, progress, user_message, tutor_response):
         """
-        Met à jour le modèle de l'apprenant après l'interaction.
-        Pour l'instant, on augmente simplement le score un peu à chaque interaction.
-        Une vraie version analyserait la réponse de l'utilisateur.
-        """
-        progress.mastery_score = min(1.0, progress.mastery_score + 0.1) # Augmentation simpliste
-        
-        # Ajout à l'historique
-        progress.interaction_history.append({
-            "user": user_message,
-            "tutor": tutor_response
-        })
-        
-        progress.save()
+        Applique l'interaction et l'enregistre.
+        Seule la progression est écrite pendant la requête ; l'ajout à l'historique
+        part dans la file de tâches, qui regroupe les écritures.
+        """
+        log = self._apply_interaction(progress, user_message, tutor_response)
+        LearnerProgress.objects.filter(pk=progress.pk).update(**_progress_changes(progress))
+        append_interaction_log(log)
+        if _nearing_mastery(progress):
+            schedule_prefetch([(self.learner.id, progress.concept_id)])
         return progress
 
-    def handle_interaction(self, user_message):
+    def _prepare_interaction(self, user_message):
         """
-        Point d'entrée principal du service. Orchestre le flux.
+        Partie commune aux modes synchrone et en flux : choisit le concept,
+        récupère la progression et construit le prompt.
+        Retourne None si tous les concepts sont terminés.
         """
         # 1. Décider sur quel concept travailler
-        concept_to_teach = self._determine_next_concept()
-        print(f"====== Concept to teach : {concept_to_teach} ==========")
+        concept_to_teach = self._determine_next_concept(user_message)
         if not concept_to_teach:
-            return {
-                "tutor_response": "Félicitations ! Vous avez terminé tous les modules disponibles pour le moment.",
-                "current_concept_name": "Terminé",
-                "mastery_score": 1.0
-            }
+            return None
 
         # 2. Récupérer l'état de progression de l'apprenant sur ce concept
         progress = self._get_or_create_progress(concept_to_teach)
 
-        effective_user_message = user_message
-        if progress.mastery_score == 0.0:
-            effective_user_message = "Commençons cette leçon."
-        # --------------------
+        with span("prompt"):
+            # Récupérer un peu d'historique
+            history = self._get_recent_history(concept_to_teach)
+
+            effective_user_message = user_message
+            cache_key = None
+            if not history:
+                # Premier échange sur ce concept (et non un score nul : avec la
+                # notation, le score reste à 0 tant qu'aucune note n'est arrivée).
+                # Ouverture de leçon : identique pour tous les apprenants, donc partageable
+                effective_user_message = LESSON_OPENER_MESSAGE
+                cache_key = make_key(concept_to_teach, history, effective_user_message)
+
+            prompt = self._build_prompt(
+                concept_to_teach, effective_user_message, progress, history,
+                anonymous=cache_key is not None
+            )
+        return concept_to_teach, progress, prompt, cache_key
+
+    def _generate_response(self, prompt, cache_key):
+        """
+        Appelle le LLM, en passant par le cache de réponses quand l'échange s'y prête.
+        """
+        if cache_key is None:
+            return self.llm_client.generate_response(prompt)
+
+        cached_response = self.response_cache.get(cache_key)
+        if cached_response is not None:
+            return cached_response
 
-        prompt = self._build_prompt(concept_to_teach, effective_user_message, progress)
         tutor_response_text = self.llm_client.generate_response(prompt)
+        self.response_cache.set(cache_key, tutor_response_text)
+        return tutor_response_text
+
+    def handle_interaction(self, user_message):
+        """
+        Point d'entrée principal du service. Orchestre le flux.
+        Lève `LLMError` si le LLM ne répond pas : la progression n'est alors pas modifiée.
+        """
+        prepared = self._prepare_interaction(user_message)
+        if prepared is None:
+            return dict(COMPLETED_RESPONSE)
+        concept_to_teach, progress, prompt, cache_key = prepared
+
+        with span("llm"):
+            tutor_response_text = self._generate_response(prompt, cache_key)
 
         updated_progress = self._update_progress(progress, user_message, tutor_response_text)
 
@@ -124,4 +304,119 @@ class TutorService:
             "tutor_response": tutor_response_text,
             "current_concept_name": concept_to_teach.name,
             "mastery_score": updated_progress.mastery_score
-        }
\ No newline at end of file
+        }
+
+    async def astream_interaction(self, user_message):
+        """
+        Équivalent asynchrone de `handle_interaction` pour le mode ASGI.
+        Produit des événements ("token", texte) au fil de la génération, puis un
+        événement final ("done", réponse) une fois la progression enregistrée.
+        """
+        prepared = await sync_to_async(self._prepare_interaction)(user_message)
+        if prepared is None:
+            yield "done", dict(COMPLETED_RESPONSE)
+            return
+        concept_to_teach, progress, prompt, cache_key = prepared
+
+        with span("llm"):
+            cached_response = self.response_cache.get(cache_key) if cache_key else None
+            if cached_response is not None:
+                chunks = [cached_response]
+                yield "token", cached_response
+            else:
+                chunks = []
+                async for chunk in self.llm_client.astream_response(prompt):
+                    chunks.append(chunk)
+                    yield "token", chunk
+                if cache_key:
+                    self.response_cache.set(cache_key, "".join(chunks))
+
+        # La progression n'est enregistrée qu'une fois le flux terminé
+        updated_progress = await sync_to_async(self._update_progress)(
+            progress, user_message, "".join(chunks)
+        )
+        yield "done", {
+            "tutor_response": "".join(chunks),
+            "current_concept_name": concept_to_teach.name,
+            "mastery_score": updated_progress.mastery_score
+        }
+
+    @classmethod
+    def handle_batch(cls, interactions):
+        """
+        Traite une liste de (profil, message), éventuellement pour plusieurs apprenants.
+
+        Les messages d'un même apprenant sont traités dans l'ordre, un par tour : à
+        chaque tour, les prompts de tous les apprenants sont préparés, les appels au
+        LLM partent en parallèle, puis toutes les progressions sont enregistrées en
+        une transaction (bulk_update / bulk_create).
+        Retourne un résultat par message, dans l'ordre d'entrée ; un message dont
+        l'appel au LLM a échoué a pour résultat une `LLMError`.
+        """
+        services = {}
+        queues = {}
+        for index, (learner_profile, message) in enumerate(interactions):
+            services.setdefault(learner_profile.id, cls(learner_profile))
+            queues.setdefault(learner_profile.id, []).append((index, message))
+
+        results = [None] * len(interactions)
+        rounds = max((len(queue) for queue in queues.values()), default=0)
+        with ThreadPoolExecutor(max_workers=get_llm_settings()['MAX_CONCURRENCY']) as executor:
+            for round_index in range(rounds):
+                # 1. Préparation (base de données, thread courant)
+                prepared = []
+                for learner_id, queue in queues.items():
+                    if round_index >= len(queue):
+                        continue
+                    index, message = queue[round_index]
+                    service = services[learner_id]
+                    interaction = service._prepare_interaction(message)
+                    if interaction is None:
+                        results[index] = dict(COMPLETED_RESPONSE)
+                    else:
+                        prepared.append((index, service, message, interaction))
+
+                # 2. Appels au LLM en parallèle (sans accès à la base)
+                futures = []
+                for index, service, message, interaction in prepared:
+                    concept_to_teach, progress, prompt, cache_key = interaction
+                    # Chaque thread reçoit une copie du contexte (mesures Server-Timing)
+                    futures.append(executor.submit(
+                        contextvars.copy_context().run, cls._timed_generate, service, prompt, cache_key
+                    ))
+
+                # 3. Enregistrement groupé
+                progresses, logs = [], []
+                for (index, service, message, interaction), future in zip(prepared, futures):
+                    concept_to_teach, progress, prompt, cache_key = interaction
+                    try:
+                        tutor_response_text = future.result()
+                    except LLMError as e:
+                        results[index] = e
+                        continue
+                    logs.append(service._apply_interaction(progress, message, tutor_response_text))
+                    progresses.append(progress)
+                    results[index] = {
+                        "tutor_response": tutor_response_text,
+                        "current_concept_name": concept_to_teach.name,
+                        "mastery_score": progress.mastery_score
+                    }
+                with span("save"), transaction.atomic():
+                    changes = [_progress_changes(progress) for progress in progresses]
+                    if changes:
+                        LearnerProgress.objects.bulk_update(
+                            [LearnerProgress(pk=progress.pk, **change) for progress, change in zip(progresses, changes)],
+                            list(changes[0])
+                        )
+                    InteractionLog.objects.bulk_create(logs)
+                schedule_grading(logs)
+                schedule_summaries(logs)
+                schedule_prefetch([
+                    (progress.learner_id, progress.concept_id) for progress in progresses if _nearing_mastery(progress)
+                ])
+        return results
+
+    @staticmethod
+    def _timed_generate(service, prompt, cache_key):
+        with span("llm"):
+            return service._generate_response(prompt, cache_key)
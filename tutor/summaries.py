@@ -0,0 +1,160 @@
+"""
+Résumé glissant des conversations, pour garder des prompts de taille constante.
+
+Le prompt ne reprend que les derniers échanges bruts (HISTORY_WINDOW, voir
+tutor/services.py). Quand TUTOR_SUMMARY['ENABLED'] est actif, les échanges plus
+anciens sont intégrés, en tâche de fond, à un résumé court enregistré sur la
+progression (`LearnerProgress.summary`) ; le prompt porte ce résumé en plus des
+derniers échanges.
+
+Un résumé n'est recalculé que lorsque FOLD_EVERY échanges au moins sont sortis
+de la fenêtre : le LLM reçoit l'ancien résumé et ces échanges, et rend le
+nouveau résumé. Les conversations de plusieurs apprenants sont résumées en une
+seule requête (jusqu'à MAX_CONVERSATIONS_PER_REQUEST), avec une sortie JSON.
+Entre deux passages, jusqu'à FOLD_EVERY - 1 échanges ne sont ni dans le
+résumé ni dans la fenêtre.
+"""
+import json
+import re
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+
+from learner.models import InteractionLog, LearnerProgress
+from .instrumentation import metrics
+from .llm_client import get_llm_client
+from .prompts import format_turn, get_prompt_settings, truncate
+
+DEFAULT_SETTINGS = {
+    'ENABLED': False,
+    'FOLD_EVERY': 3,
+    'MAX_TOKENS': 120, # longueur max d'un résumé
+    'MAX_CONVERSATIONS_PER_REQUEST': 10,
+}
+
+SUMMARY_PROMPT = """\
+Tu résumes des conversations entre un tuteur ("Prof") et des apprenants.
+Pour chaque conversation ci-dessous, écris un nouveau résumé qui intègre
+l'ancien résumé et les nouveaux échanges : ce que l'apprenant a compris, ses
+erreurs et ses questions en suspens. {max_words} mots maximum par résumé.
+
+{conversations}
+
+Réponds uniquement par un tableau JSON, un objet par conversation, sans autre texte :
+[{{"id": <id de la conversation>, "summary": "<nouveau résumé>"}}]"""
+
+CONVERSATION_TEMPLATE = """\
+**CONVERSATION {id}** (concept : {concept})
+Ancien résumé : {summary}
+Nouveaux échanges :
+{turns}
+"""
+
+NO_SUMMARY = "(aucun)"
+
+
+class SummaryError(ValueError):
+    pass
+
+
+def get_summary_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TUTOR_SUMMARY', {})}
+
+
+def summaries_enabled():
+    return get_summary_settings()['ENABLED']
+
+
+def build_summary_prompt(conversations, options):
+    """
+    `conversations` : liste de (progression, échanges à intégrer).
+    """
+    turn_max_tokens = get_prompt_settings()['TURN_MAX_TOKENS']
+    blocks = "\n".join(
+        CONVERSATION_TEMPLATE.format(
+            id=progress.id,
+            concept=progress.concept.name,
+            summary=progress.summary or NO_SUMMARY,
+            turns="\n".join(format_turn(log.as_turn(), turn_max_tokens) for log in logs),
+        )
+        for progress, logs in conversations
+    )
+    # Environ 3 mots pour 4 tokens
+    return SUMMARY_PROMPT.format(max_words=options['MAX_TOKENS'] * 3 // 4, conversations=blocks)
+
+
+def parse_summaries(text, expected_ids):
+    """
+    Extrait les résumés de la réponse du LLM : {id de la progression: résumé}.
+    """
+    match = re.search(r"\[.*\]", text, re.DOTALL) # tolère ```json ... ``` autour
+    if not match:
+        raise SummaryError(f"No JSON array in summary response: {text[:200]!r}")
+    try:
+        items = json.loads(match.group(0))
+        summaries = {int(item["id"]): str(item["summary"]).strip() for item in items}
+    except (ValueError, TypeError, KeyError) as e:
+        raise SummaryError(f"Invalid summary response: {e}") from e
+    return {progress_id: summary for progress_id, summary in summaries.items() if progress_id in expected_ids}
+
+
+def _pending_conversations(pairs, window, fold_every):
+    """
+    Pour chaque (apprenant, concept), les échanges sortis de la fenêtre et pas
+    encore résumés, s'ils sont au moins `fold_every`. Deux requêtes en tout.
+    """
+    progresses = list(
+        LearnerProgress.objects.select_related('concept')
+        .filter(reduce(or_, (Q(learner_id=learner_id, concept_id=concept_id) for learner_id, concept_id in pairs)))
+        .only('id', 'learner_id', 'concept_id', 'concept__name', 'summary', 'summarized_log_id')
+    )
+    if not progresses:
+        return []
+    logs = {}
+    for log in (
+        InteractionLog.objects
+        .filter(reduce(or_, (
+            Q(learner_id=progress.learner_id, concept_id=progress.concept_id, id__gt=progress.summarized_log_id)
+            for progress in progresses
+        )))
+        .order_by('id')
+        .only('id', 'learner_id', 'concept_id', 'user_message', 'tutor_response')
+    ):
+        logs.setdefault((log.learner_id, log.concept_id), []).append(log)
+
+    conversations = []
+    for progress in progresses:
+        # Les `window` derniers échanges restent bruts dans le prompt
+        pending = logs.get((progress.learner_id, progress.concept_id), [])[:-window or None]
+        if len(pending) >= fold_every:
+            conversations.append((progress, pending))
+    return conversations
+
+
+def summarize_conversations(pairs, window):
+    """
+    Met à jour le résumé des conversations (apprenant, concept) qui ont assez
+    d'échanges anciens non résumés. Retourne le nombre de résumés enregistrés.
+    """
+    options = get_summary_settings()
+    conversations = _pending_conversations(list(dict.fromkeys(pairs)), window, options['FOLD_EVERY'])
+    saved = 0
+    size = options['MAX_CONVERSATIONS_PER_REQUEST']
+    for start in range(0, len(conversations), size):
+        chunk = conversations[start:start + size]
+        response = get_llm_client().generate_response(build_summary_prompt(chunk, options))
+        summaries = parse_summaries(response, {progress.id for progress, _ in chunk})
+        for progress, logs in chunk:
+            if progress.id not in summaries:
+                continue
+            # Enregistré seulement si personne n'a résumé cette conversation entre-temps
+            saved += LearnerProgress.objects.filter(
+                pk=progress.id, summarized_log_id=progress.summarized_log_id
+            ).update(
+                summary=truncate(summaries[progress.id], options['MAX_TOKENS']),
+                summarized_log_id=logs[-1].id,
+            )
+    metrics.inc("tutor_summaries_total", saved)
+    return saved
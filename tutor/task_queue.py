@@ -0,0 +1,173 @@
+"""
+File de tâches locale, pour sortir du chemin de la requête le travail qui peut attendre.
+
+Aucun service externe : les tâches sont gardées en mémoire et exécutées par un
+petit groupe de threads du processus (TUTOR_TASKS['WORKERS']).
+
+- Toutes les tâches d'une même clé (ex: un apprenant) vont au même thread :
+  elles s'exécutent dans l'ordre d'envoi.
+- Chaque thread regroupe ce qui est en attente (jusqu'à BATCH_SIZE tâches, ou
+  pendant BATCH_WAIT secondes) et passe le lot au gestionnaire de la tâche, qui
+  peut fusionner les tâches d'une même clé (une seule écriture groupée).
+- Un lot en échec est réessayé (MAX_RETRIES), puis abandonné.
+
+Les tâches en attente sont perdues si le processus est tué ; à l'arrêt normal,
+la file est vidée. En mode EAGER (tests, bancs d'essai), les tâches sont
+exécutées tout de suite, dans le thread appelant.
+"""
+import atexit
+import contextlib
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .instrumentation import metrics
+from .scheduler import background_priority
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'EAGER': False,
+    'WORKERS': 2,
+    'BATCH_SIZE': 100,
+    'BATCH_WAIT': 0.05, # secondes
+    'MAX_RETRIES': 3,
+    'BACKOFF_BASE': 0.2,
+}
+
+_handlers = {}
+
+
+def get_task_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TUTOR_TASKS', {})}
+
+
+def task(name):
+    """
+    Enregistre un gestionnaire de tâche. Il reçoit un lot de (clé, données),
+    dans l'ordre d'envoi.
+    """
+    def decorator(handler):
+        _handlers[name] = handler
+        return handler
+    return decorator
+
+
+class TaskQueue:
+    def __init__(self, options=None):
+        self.options = options or get_task_settings()
+        self.eager = self.options['EAGER']
+        self._queues = [queue.Queue() for _ in range(self.options['WORKERS'])]
+        self._started = False
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._unfinished = 0
+
+    def enqueue(self, name, key, payload):
+        if name not in _handlers:
+            raise KeyError(f"Unknown task {name!r}")
+        if self.eager:
+            with background_priority():
+                _handlers[name]([(key, payload)])
+            metrics.inc("tutor_tasks_total", task=name, outcome="success")
+            return
+        with self._lock:
+            if not self._started:
+                self._start()
+            self._unfinished += 1
+        self._queues[hash(key) % len(self._queues)].put((name, key, payload))
+
+    def flush(self, timeout=None):
+        """
+        Attend que toutes les tâches envoyées soient traitées.
+        Retourne False si le délai est dépassé.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def _start(self):
+        for index, tasks in enumerate(self._queues):
+            threading.Thread(
+                target=self._work, args=(tasks,), name=f"tutor-tasks-{index}", daemon=True
+            ).start()
+        self._started = True
+
+    def _next_batch(self, tasks):
+        batch = [tasks.get()]
+        deadline = time.monotonic() + self.options['BATCH_WAIT']
+        while len(batch) < self.options['BATCH_SIZE']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(tasks.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self, tasks):
+        while True:
+            batch = self._next_batch(tasks)
+            by_name = {}
+            for name, key, payload in batch:
+                by_name.setdefault(name, []).append((key, payload))
+            for name, items in by_name.items():
+                self._run(name, items)
+            close_old_connections()
+            with self._idle:
+                self._unfinished -= len(batch)
+                if self._unfinished == 0:
+                    self._idle.notify_all()
+
+    def _run(self, name, items):
+        for attempt in range(self.options['MAX_RETRIES'] + 1):
+            try:
+                # Les appels au LLM des tâches passent après ceux des apprenants
+                with background_priority():
+                    _handlers[name](items)
+                metrics.inc("tutor_tasks_total", len(items), task=name, outcome="success")
+                return
+            except Exception as e:
+                # La connexion peut être dans un état inutilisable : on repart d'une neuve
+                connection.close()
+                if attempt == self.options['MAX_RETRIES']:
+                    metrics.inc("tutor_tasks_total", len(items), task=name, outcome="error")
+                    logger.error("Dropping %d %s task(s) after %d attempts: %s", len(items), name, attempt + 1, e)
+                    return
+                metrics.inc("tutor_tasks_total", len(items), task=name, outcome="retry")
+                logger.warning("Retrying %s tasks after error: %s", name, e)
+                time.sleep(self.options['BACKOFF_BASE'] * 2 ** attempt)
+
+
+_task_queue = None
+_task_queue_lock = threading.Lock()
+
+def get_task_queue():
+    """
+    Retourne la file de tâches du processus, configurée par TUTOR_TASKS.
+    """
+    global _task_queue
+    if _task_queue is None:
+        with _task_queue_lock:
+            if _task_queue is None:
+                _task_queue = TaskQueue()
+                atexit.register(_task_queue.flush, 10)
+    return _task_queue
+
+
+@contextlib.contextmanager
+def eager_tasks():
+    """
+    Exécute les tâches immédiatement dans le thread appelant (bancs d'essai,
+    transactions annulées : un autre thread ne verrait pas leurs données).
+    """
+    task_queue = get_task_queue()
+    previous, task_queue.eager = task_queue.eager, True
+    try:
+        yield task_queue
+    finally:
+        task_queue.eager = previous
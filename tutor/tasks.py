@@ -0,0 +1,148 @@
+"""
+Tâches exécutées après la réponse au client (voir tutor/task_queue.py).
+"""
+import threading
+
+from learner.models import InteractionLog
+from .grading import grade_concept, grading_enabled
+from .retrieval import refresh_concept_index
+from .summaries import summaries_enabled, summarize_conversations
+from .task_queue import get_task_queue, task
+
+APPEND_LOGS_TASK = "tutor.append_interaction_logs"
+GRADE_TASK = "tutor.grade_answers"
+SUMMARY_TASK = "tutor.summarize_conversations"
+PREFETCH_TASK = "tutor.prefetch_openers"
+INDEX_TASK = "tutor.refresh_concept_index"
+
+
+class PendingLogs:
+    """
+    Échanges envoyés à la file mais pas encore écrits, par (apprenant, concept).
+    Le tuteur les ajoute à l'historique lu en base : l'échange suivant d'un
+    apprenant voit bien le précédent, même s'il n'est pas encore enregistré.
+    (Valable dans un même processus.)
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._logs = {}
+
+    def add(self, log):
+        with self._lock:
+            self._logs.setdefault((log.learner_id, log.concept_id), []).append(log)
+
+    def remove(self, logs):
+        with self._lock:
+            for log in logs:
+                key = (log.learner_id, log.concept_id)
+                pending = self._logs.get(key, [])
+                if log in pending:
+                    pending.remove(log)
+                if not pending:
+                    self._logs.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._logs.clear()
+
+    def get(self, learner_id, concept_id):
+        with self._lock:
+            return list(self._logs.get((learner_id, concept_id), []))
+
+
+pending_logs = PendingLogs()
+
+
+def merge_pending(logs, learner_id, concept_id):
+    """
+    Complète des entrées lues en base (ordre chronologique) par celles encore en file.
+    Une entrée écrite entre-temps peut figurer dans les deux : elle n'est gardée
+    qu'une fois (même uid), sans confondre deux messages identiques envoyés au même instant.
+    """
+    seen = {log.uid for log in logs}
+    merged = list(logs) + [log for log in pending_logs.get(learner_id, concept_id) if log.uid not in seen]
+    merged.sort(key=lambda log: log.created_at)
+    return merged
+
+
+def append_interaction_log(log):
+    """
+    Ajoute un échange à l'historique, hors du chemin de la requête.
+    """
+    pending_logs.add(log)
+    get_task_queue().enqueue(APPEND_LOGS_TASK, log.learner_id, log)
+
+
+@task(APPEND_LOGS_TASK)
+def append_interaction_logs(items):
+    # Les échanges de tous les apprenants du lot : un seul INSERT groupé. Si le
+    # lot est rejoué après une erreur, les échanges déjà écrits (même uid) sont ignorés
+    logs = [log for _, log in items]
+    InteractionLog.objects.bulk_create(logs, ignore_conflicts=True)
+    pending_logs.remove(logs)
+    schedule_grading(logs)
+    schedule_summaries(logs)
+
+
+def schedule_grading(logs):
+    """
+    Demande la notation des réponses qui viennent d'être enregistrées, si elle est active.
+    """
+    if not grading_enabled():
+        return
+    # Une tâche par concept : ses réponses seront notées ensemble
+    for concept_id in dict.fromkeys(log.concept_id for log in logs):
+        get_task_queue().enqueue(GRADE_TASK, concept_id, concept_id)
+
+
+@task(GRADE_TASK)
+def grade_answers(items):
+    # Plusieurs déclenchements pour un même concept : un seul passage suffit
+    for concept_id in dict.fromkeys(concept_id for concept_id, _ in items):
+        grade_concept(concept_id)
+
+
+def schedule_summaries(logs):
+    """
+    Demande la mise à jour du résumé des conversations qui viennent de s'allonger, s'il est actif.
+    """
+    if not summaries_enabled():
+        return
+    for learner_id, concept_id in dict.fromkeys((log.learner_id, log.concept_id) for log in logs):
+        get_task_queue().enqueue(SUMMARY_TASK, learner_id, (learner_id, concept_id))
+
+
+@task(SUMMARY_TASK)
+def summarize_conversation_batch(items):
+    from .services import HISTORY_WINDOW # import local : services dépend de ce module
+
+    # Les conversations de plusieurs apprenants, résumées ensemble
+    summarize_conversations([pair for _, pair in items], HISTORY_WINDOW)
+
+
+def schedule_prefetch(pairs):
+    """
+    Demande la préparation de l'ouverture du concept suivant pour ces (apprenant, concept en cours).
+    """
+    for learner_id, concept_id in dict.fromkeys(pairs):
+        get_task_queue().enqueue(PREFETCH_TASK, learner_id, (learner_id, concept_id))
+
+
+@task(PREFETCH_TASK)
+def prefetch_openers(items):
+    from .services import prefetch_next_openers # import local : services dépend de ce module
+
+    prefetch_next_openers([pair for _, pair in items])
+
+
+def schedule_index_refresh():
+    """
+    Demande la mise à jour de l'index des concepts après un changement du programme.
+    """
+    get_task_queue().enqueue(INDEX_TASK, INDEX_TASK, None)
+
+
+@task(INDEX_TASK)
+def refresh_index(items):
+    # Plusieurs demandes en attente : une seule mise à jour suffit
+    refresh_concept_index()
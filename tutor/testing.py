@@ -0,0 +1,56 @@
+"""
+Outils communs aux tests des applications (client LLM factice, lanceur de tests).
+"""
+import contextlib
+from unittest import mock
+
+from django.test.runner import DiscoverRunner
+
+from .task_queue import eager_tasks
+
+
+class FakeLLMClient:
+    """
+    Client LLM factice : renvoie toujours la même réponse (en un bloc ou mot par
+    mot) et garde les prompts reçus.
+    """
+    response = "Très bien ! Que vaut x après x = 5 ?"
+    prompts = []
+
+    def generate_response(self, prompt):
+        self.prompts.append(prompt)
+        return self.response
+
+    async def astream_response(self, prompt):
+        self.prompts.append(prompt)
+        for word in self.response.split(" "):
+            yield word + " "
+
+
+def use_fake_llm_client(client_class=FakeLLMClient, *modules):
+    """
+    Décorateur de classe ou de test : remplace `get_llm_client` par `client_class`
+    dans les modules donnés (par défaut tutor.services, celui du tuteur).
+    """
+    modules = modules or ("tutor.services",)
+
+    def decorate(target):
+        for module in modules:
+            target = mock.patch(f"{module}.get_llm_client", client_class)(target)
+        return target
+    return decorate
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Lanceur de `manage.py test` (TEST_RUNNER) : les tâches de fond s'exécutent
+    dans le thread du test, qui voit ainsi leurs écritures dès le retour de l'appel.
+    """
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._eager = contextlib.ExitStack()
+        self._eager.enter_context(eager_tasks())
+
+    def teardown_test_environment(self, **kwargs):
+        self._eager.close()
+        super().teardown_test_environment(**kwargs)
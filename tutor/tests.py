@@ -1,3 +1,767 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from google.api_core import exceptions as google_exceptions
+
+from expert.curriculum import get_curriculum_version
+from expert.models import Concept
+from learner.models import InteractionLog, LearnerProfile, LearnerProgress
+from .benchmark import BENCH_PREFIX, run_benchmark
+from .cursor import clear_cursor, get_cursor
+from .grading import grade_concept, parse_grades
+from .instrumentation import metrics
+from .llm_client import DEFAULT_SETTINGS, GeminiClient, LLMError, LLMRateLimited, StubBackend
+from .prompts import _concept_prefix, build_prompt
+from .response_cache import DjangoCacheBackend, LocMemBackend, get_response_cache, make_key
+from .retrieval import (
+    ConceptIndex, embed, get_concept_index, invalidate_concept_index, np, refresh_concept_index, route_message,
+)
+from .scheduler import LLMScheduler, RateLimitExceeded, background_priority, get_scheduler, reset_scheduler
+from .services import TutorService
+from .summaries import summarize_conversations
+from .task_queue import TaskQueue, get_task_settings, task
+from .tasks import append_interaction_logs, merge_pending, pending_logs
+from .testing import FakeLLMClient, use_fake_llm_client
+
+
+@use_fake_llm_client()
+class CurriculumCursorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user("alice")
+        self.learner = LearnerProfile.objects.get(user=user)
+
+    def test_cursor_avoids_curriculum_scan(self):
+        service = TutorService(self.learner)
+        first = service._determine_next_concept()
+
+        # Curseur en place : une seule lecture par clé primaire
+        with self.assertNumQueries(1):
+            self.assertEqual(service._determine_next_concept(), first)
+
+    def test_cursor_moves_on_when_concept_is_mastered(self):
+        service = TutorService(self.learner)
+        first = service._determine_next_concept()
+        progress = LearnerProgress.objects.create(learner=self.learner, concept=first, mastery_score=0.85)
+
+        service._update_progress(progress, "x vaut 5", "Bravo !")
+
+        self.assertNotEqual(service._determine_next_concept(), first)
+
+    def test_curriculum_edit_invalidates_cursor(self):
+        service = TutorService(self.learner)
+        first = service._determine_next_concept()
+        self.assertEqual(get_cursor(self.learner.id), first.id)
+
+        # Une modification faite depuis l'admin passe par save()
+        other = Concept.objects.exclude(pk=first.pk).first()
+        other.explanation += " (révisé)"
+        other.save()
+
+        self.assertIsNone(get_cursor(self.learner.id))
+
+
+@use_fake_llm_client()
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        FakeLLMClient.prompts = []
+
+    def test_lesson_opener_is_generated_once_for_all_learners(self):
+        for username in ("alice", "bob", "carol"):
+            learner = LearnerProfile.objects.get(user=User.objects.create_user(username))
+            response = TutorService(learner).handle_interaction("Bonjour")
+            self.assertEqual(response["tutor_response"], "Très bien ! Que vaut x après x = 5 ?")
+
+        self.assertEqual(len(FakeLLMClient.prompts), 1)
+        self.assertNotIn("alice", FakeLLMClient.prompts[0])
+
+    def test_follow_up_turns_are_not_shared(self):
+        learner = LearnerProfile.objects.get(user=User.objects.create_user("alice"))
+        service = TutorService(learner)
+        service.handle_interaction("Bonjour")
+        service.handle_interaction("x vaut 5")
+
+        self.assertEqual(len(FakeLLMClient.prompts), 2)
+        self.assertIn("alice", FakeLLMClient.prompts[1])
+
+    def test_next_opener_is_prefetched_before_mastery(self):
+        learner = LearnerProfile.objects.get(user=User.objects.create_user("alice"))
+        service = TutorService(learner)
+        first = service._determine_next_concept()
+        progress = LearnerProgress.objects.create(learner=learner, concept=first, mastery_score=0.6)
+
+        service.handle_interaction("x vaut 5") # score 0.7 : l'ouverture suivante est préparée
+        self.assertEqual(len(FakeLLMClient.prompts), 2)
+        self.assertIn('"Commençons cette leçon."', FakeLLMClient.prompts[1])
+
+        progress.mastery_score = 0.9
+        progress.save()
+        clear_cursor(learner.id)
+        hits = metrics.get("tutor_response_cache_requests_total", result="hit")
+        response = service.handle_interaction("Et maintenant ?")
+
+        # Premier message sur le nouveau concept : servi depuis le cache, sans appel au LLM
+        self.assertNotEqual(response["current_concept_name"], first.name)
+        self.assertEqual(len(FakeLLMClient.prompts), 2)
+        self.assertEqual(metrics.get("tutor_response_cache_requests_total", result="hit"), hits + 1)
+
+    def test_renamed_concept_gets_a_new_key(self):
+        concept = Concept.objects.first()
+        key = make_key(concept, [], "Commençons cette leçon.")
+        concept.name += " (révisé)"
+        self.assertNotEqual(make_key(concept, [], "Commençons cette leçon."), key)
+
+    def test_django_backend_clear_keeps_other_cache_entries(self):
+        backend = DjangoCacheBackend({'CACHE_ALIAS': 'default'})
+        cache.set("autre:clé", "valeur")
+        backend.set("réponse", "texte", ttl=60)
+        backend.clear()
+
+        self.assertIsNone(backend.get("réponse"))
+        self.assertEqual(cache.get("autre:clé"), "valeur")
+
+    def test_locmem_backend_evicts_least_recently_used(self):
+        backend = LocMemBackend({'MAX_ENTRIES': 2})
+        backend.set("a", 1, ttl=60)
+        backend.set("b", 2, ttl=60)
+        backend.get("a")
+        backend.set("c", 3, ttl=60)
+
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.get("a"), 1)
+
+
+class FlakyModel:
+    """
+    Modèle Gemini factice qui échoue `failures` fois avant de répondre.
+    """
+    def __init__(self, failures, error=google_exceptions.ServiceUnavailable("indisponible")):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return mock.Mock(text="Réponse", usage_metadata=None)
+
+
+@mock.patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"})
+class GeminiClientRetryTests(SimpleTestCase):
+    def make_client(self, model, **options):
+        client = GeminiClient({**DEFAULT_SETTINGS, 'BACKOFF_BASE': 0, **options})
+        client.model = model
+        return client
+
+    def test_transient_errors_are_retried(self):
+        model = FlakyModel(failures=2)
+        self.assertEqual(self.make_client(model).generate_response("prompt"), "Réponse")
+        self.assertEqual(model.calls, 3)
+
+    def test_error_is_raised_once_retries_are_exhausted(self):
+        model = FlakyModel(failures=10)
+        with self.assertRaises(LLMError):
+            self.make_client(model, MAX_RETRIES=2).generate_response("prompt")
+        self.assertEqual(model.calls, 3)
+
+    def test_non_transient_errors_are_not_retried(self):
+        model = FlakyModel(failures=1, error=google_exceptions.InvalidArgument("prompt invalide"))
+        with self.assertRaises(LLMError):
+            self.make_client(model).generate_response("prompt")
+        self.assertEqual(model.calls, 1)
+
+    def test_quota_errors_pause_calls_and_ask_to_retry_later(self):
+        reset_scheduler()
+        self.addCleanup(reset_scheduler)
+        model = FlakyModel(failures=10, error=google_exceptions.ResourceExhausted("quota"))
+        with self.assertRaises(LLMRateLimited) as raised:
+            self.make_client(model).generate_response("prompt")
+        self.assertEqual(model.calls, 1) # un apprenant n'attend pas les nouveaux essais
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        self.assertGreater(get_scheduler().paused_until, 0)
+
+    def test_background_calls_retry_quota_errors(self):
+        reset_scheduler()
+        self.addCleanup(reset_scheduler)
+        model = FlakyModel(failures=1, error=google_exceptions.ResourceExhausted("quota"))
+        with background_priority():
+            self.assertEqual(self.make_client(model).generate_response("prompt"), "Réponse")
+        self.assertEqual(model.calls, 2)
+
+
+class SchedulerTests(SimpleTestCase):
+    def setUp(self):
+        reset_scheduler()
+        self.addCleanup(reset_scheduler)
+
+    def make_scheduler(self, **options):
+        return LLMScheduler({
+            'REQUESTS_PER_MINUTE': 2, 'TOKENS_PER_MINUTE': 0, 'RESPONSE_TOKENS': 0,
+            'MAX_WAIT': 0.05, 'BACKGROUND_RESERVE': 0.5, 'PAUSE_ON_RATE_LIMIT': 5, **options,
+        })
+
+    def test_identical_prompts_are_sent_once(self):
+        backend = StubBackend({**DEFAULT_SETTINGS, 'STUB_LATENCY': 0.2})
+        before = metrics.get("tutor_llm_requests_total", backend=backend.name, outcome="success")
+        responses = []
+        threads = [
+            threading.Thread(target=lambda: responses.append(backend.generate_response("Commençons cette leçon.")))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(responses)), 1)
+        self.assertEqual(len(responses), 10)
+        self.assertEqual(metrics.get("tutor_llm_requests_total", backend=backend.name, outcome="success"), before + 1)
+
+    def test_interactive_call_over_quota_is_rejected_with_retry_delay(self):
+        scheduler = self.make_scheduler()
+        scheduler.acquire("a")
+        scheduler.acquire("b")
+        with self.assertRaises(RateLimitExceeded) as raised:
+            scheduler.acquire("c")
+        self.assertEqual(raised.exception.retry_after, 30) # 2 requêtes par minute
+
+    def test_background_work_leaves_a_reserve_for_learners(self):
+        scheduler = self.make_scheduler()
+        with background_priority():
+            scheduler.acquire("tâche") # seau plein : la tâche passe
+            self.assertGreater(scheduler._try_acquire(0, "background"), 0) # reste la réserve
+        scheduler.acquire("échange") # un apprenant peut encore l'utiliser
+
+    def test_call_without_free_slot_gives_its_quota_back(self):
+        backend = StubBackend({**DEFAULT_SETTINGS, 'MAX_CONCURRENCY': 1, 'ACQUIRE_TIMEOUT': 0.01})
+        with override_settings(TUTOR_SCHEDULER={'REQUESTS_PER_MINUTE': 2, 'TOKENS_PER_MINUTE': 0}):
+            reset_scheduler()
+            backend._semaphore.acquire() # un autre appel occupe la seule place
+            with self.assertRaises(LLMError):
+                backend.generate_response("prompt")
+            backend._semaphore.release()
+            backend.generate_response("a")
+            backend.generate_response("b") # les 2 requêtes de la minute sont encore là
+
+    def test_oversized_background_call_is_eventually_admitted(self):
+        scheduler = self.make_scheduler(REQUESTS_PER_MINUTE=0, TOKENS_PER_MINUTE=100)
+        self.assertEqual(scheduler._try_acquire(500, "background"), 0) # seau plein
+        self.assertLessEqual(scheduler._try_acquire(500, "background"), 60) # attente bornée
+
+    def test_learner_does_not_wait_behind_queued_background_call(self):
+        scheduler = self.make_scheduler()
+        queued = threading.Event()
+        release = threading.Event()
+
+        def background_call():
+            def call():
+                queued.set()
+                release.wait() # encore en attente de quota
+                return "tâche"
+            with background_priority():
+                scheduler.coalesce("Commençons.", call)
+
+        thread = threading.Thread(target=background_call)
+        thread.start()
+        queued.wait()
+        try:
+            # Même prompt, mais pas la même priorité : l'échange part de son côté
+            self.assertEqual(scheduler.coalesce("Commençons.", lambda: "réponse"), "réponse")
+        finally:
+            release.set()
+            thread.join()
+
+    def test_follower_of_queued_call_is_rejected_after_max_wait(self):
+        scheduler = self.make_scheduler(REQUESTS_PER_MINUTE=1, MAX_WAIT=0.1)
+        leader_waiting = threading.Event()
+        release = threading.Event()
+
+        def leader():
+            def call():
+                leader_waiting.set()
+                release.wait() # encore en attente de quota
+                return "réponse"
+            scheduler.coalesce("Commençons.", call)
+
+        thread = threading.Thread(target=leader)
+        thread.start()
+        leader_waiting.wait()
+        try:
+            with self.assertRaises(RateLimitExceeded):
+                scheduler.coalesce("Commençons.", lambda: "autre")
+        finally:
+            release.set()
+            thread.join()
+
+
+    def test_backend_follower_timeout_is_reported_as_rate_limited(self):
+        backend = StubBackend(DEFAULT_SETTINGS)
+        leader_waiting = threading.Event()
+        release = threading.Event()
+
+        def scheduled_generate(prompt):
+            leader_waiting.set()
+            release.wait() # encore en attente de quota
+            return "réponse"
+
+        with override_settings(TUTOR_SCHEDULER={'MAX_WAIT': 0.1}), \
+                mock.patch.object(backend, "_scheduled_generate", scheduled_generate):
+            reset_scheduler()
+            thread = threading.Thread(target=backend.generate_response, args=("Commençons.",))
+            thread.start()
+            leader_waiting.wait()
+            try:
+                # LLMError : les vues en font une 429, pas une 500
+                with self.assertRaises(LLMRateLimited) as raised:
+                    backend.generate_response("Commençons.")
+                self.assertEqual(raised.exception.retry_after, 1)
+            finally:
+                release.set()
+                thread.join()
+
+class StubBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = StubBackend({**DEFAULT_SETTINGS, 'STUB_RESPONSE_TOKENS': 12})
+
+    def test_responses_are_deterministic(self):
+        first = self.backend.generate_response("Explique les variables")
+        self.assertEqual(first, self.backend.generate_response("Explique les variables"))
+        self.assertNotEqual(first, self.backend.generate_response("Explique les entiers"))
+        self.assertTrue(first.endswith("?"))
+
+    def test_stream_matches_blocking_response(self):
+        async def collect():
+            return "".join([chunk async for chunk in self.backend.astream_response("prompt")])
+
+        self.assertEqual(async_to_sync(collect)(), self.backend.generate_response("prompt"))
+
+
+class BenchmarkTests(TestCase):
+    def test_benchmark_reports_hot_path_costs(self):
+        cache.set("autre:clé", "valeur")
+        version = get_curriculum_version()
+        report = run_benchmark(learners=3, concepts=6, depth=3, turns=4)
+
+        self.assertEqual(report["requests"], 12)
+        self.assertLessEqual(report["latency_ms"]["p50"], report["latency_ms"]["p99"])
+        # Garde-fou contre les régressions du chemin critique
+        self.assertLessEqual(report["queries_per_request"]["max"], 12)
+        # 1 UPDATE de progression + 1 INSERT dans le journal (+ la création au 1er échange)
+        self.assertLess(report["rows_written_per_turn"], 2.5)
+        # Le banc d'essai ne laisse rien derrière lui
+        self.assertFalse(Concept.objects.filter(name__startswith=BENCH_PREFIX).exists())
+        # ... ni dans le cache partagé
+        self.assertEqual(cache.get("autre:clé"), "valeur")
+        self.assertEqual(get_curriculum_version(), version)
+
+
+@use_fake_llm_client()
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        self.user = User.objects.create_user("alice")
+        self.token = Token.objects.create(user=self.user)
+
+    def test_interaction_reports_server_timing_per_phase(self):
+        response = self.client.post(
+            "/api/learner/interact/", {"message": "Bonjour"},
+            content_type="application/json", HTTP_AUTHORIZATION=f"Token {self.token.key}",
+        )
+        self.assertEqual(response.status_code, 200)
+        phases = [entry.split(";")[0] for entry in response["Server-Timing"].split(", ")]
+        self.assertEqual(phases, ["select", "progress", "prompt", "llm", "save"])
+
+    def test_metrics_endpoint_exposes_prometheus_text(self):
+        metrics.inc("tutor_response_cache_requests_total", result="hit")
+
+        response = self.client.get("/metrics", REMOTE_ADDR="127.0.0.1")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("# TYPE tutor_response_cache_requests_total counter", response.content.decode())
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.8").status_code, 403)
+
+
+class PromptTests(SimpleTestCase):
+    def setUp(self):
+        self.concept = Concept(id=1, name="Assignation", explanation="Une variable est une boîte.")
+
+    def test_history_is_serialized_as_dialogue(self):
+        history = [{"user": "Bonjour", "tutor": "Salut ! Prêt ?"}]
+        prompt = build_prompt(self.concept, "alice", 0.1, history, "Oui")
+
+        self.assertIn("Apprenant : Bonjour\nProf : Salut ! Prêt ?", prompt.text)
+        self.assertNotIn("{'user'", prompt.text)
+        self.assertEqual((prompt.history_turns, prompt.omitted_turns), (1, 0))
+
+    def test_static_prefix_is_shared_between_learners(self):
+        _concept_prefix.cache_clear()
+        alice = build_prompt(self.concept, "alice", 0.1, [], "Bonjour")
+        bob = build_prompt(self.concept, "bob", 0.5, [], "Salut")
+
+        self.assertEqual(_concept_prefix.cache_info().hits, 1)
+        prefix = _concept_prefix(1, self.concept.name, self.concept.explanation)[0]
+        self.assertTrue(alice.text.startswith(prefix) and bob.text.startswith(prefix))
+
+    def test_history_fits_token_budget(self):
+        history = [{"user": f"question {i} " + "mot " * 200, "tutor": "réponse " * 200} for i in range(10)]
+        options = {'TOKEN_BUDGET': 600, 'TURN_MAX_TOKENS': 40}
+
+        prompt = build_prompt(self.concept, "alice", 0.1, history, "Dernier message", options)
+
+        self.assertLessEqual(prompt.tokens, 600)
+        self.assertGreater(prompt.omitted_turns, 0)
+        self.assertIn("question 9", prompt.text)
+        self.assertNotIn("question 0", prompt.text)
+        self.assertIn("Dernier message", prompt.text)
+
+
+processed_batches = []
+
+@task("tests.record")
+def record_batch(items):
+    processed_batches.append(items)
+
+@task("tests.flaky")
+def flaky_batch(items):
+    processed_batches.append(items)
+    if len(processed_batches) == 1:
+        raise ConnectionError("base indisponible")
+
+
+class TaskQueueTests(SimpleTestCase):
+    def setUp(self):
+        processed_batches.clear()
+
+    def make_queue(self, **options):
+        return TaskQueue({
+            **get_task_settings(), 'EAGER': False, 'WORKERS': 1, 'BATCH_WAIT': 0.2, 'BACKOFF_BASE': 0, **options
+        })
+
+    def test_tasks_are_batched_in_order(self):
+        task_queue = self.make_queue()
+        for i in range(5):
+            task_queue.enqueue("tests.record", "alice", i)
+
+        self.assertTrue(task_queue.flush(timeout=5))
+        self.assertEqual(processed_batches, [[("alice", i) for i in range(5)]])
+
+    def test_failed_batch_is_retried(self):
+        task_queue = self.make_queue()
+        with self.assertLogs("tutor.task_queue", "WARNING"):
+            task_queue.enqueue("tests.flaky", "alice", 1)
+            self.assertTrue(task_queue.flush(timeout=5))
+
+        self.assertEqual(len(processed_batches), 2)
+        self.assertEqual(metrics.get("tutor_tasks_total", task="tests.flaky", outcome="success"), 1)
+
+
+@use_fake_llm_client()
+class DeferredHistoryTests(TestCase):
+    def test_pending_log_is_part_of_next_prompt(self):
+        cache.clear()
+        get_response_cache().clear()
+        profile = LearnerProfile.objects.get(user=User.objects.create_user("alice"))
+        FakeLLMClient.prompts = []
+        self.addCleanup(pending_logs.clear)
+
+        # La file ne traite rien : l'échange reste en attente
+        with mock.patch("tutor.tasks.get_task_queue"):
+            TutorService(profile).handle_interaction("Bonjour")
+            TutorService(profile).handle_interaction("Je crois que x vaut 5")
+
+        self.assertFalse(profile.interaction_logs.exists())
+        self.assertIn("Apprenant : Bonjour", FakeLLMClient.prompts[-1])
+
+    def test_replayed_batch_writes_each_turn_once(self):
+        profile = LearnerProfile.objects.get(user=User.objects.create_user("alice"))
+        concept = Concept.objects.first()
+        now = timezone.now()
+        # Le même message, envoyé deux fois au même instant : deux échanges distincts
+        logs = [
+            InteractionLog(learner=profile, concept=concept, user_message="5", tutor_response="?", created_at=now)
+            for _ in range(2)
+        ]
+        self.addCleanup(pending_logs.clear)
+        for log in logs:
+            pending_logs.add(log)
+        self.assertEqual(len(merge_pending([], profile.id, concept.id)), 2)
+
+        append_interaction_logs([(profile.id, log) for log in logs])
+        append_interaction_logs([(profile.id, log) for log in logs]) # lot rejoué après une erreur
+        self.assertEqual(profile.interaction_logs.count(), 2)
+
+
+class FakeGradingClient(FakeLLMClient):
+    """
+    Répond comme FakeLLMClient au tuteur, et donne la note 1.0 à toutes les réponses à noter.
+    """
+    grading_prompts = []
+
+    def generate_response(self, prompt):
+        if prompt.startswith("Tu es un correcteur"):
+            self.grading_prompts.append(prompt)
+            ids = re.findall(r"^- id (\d+) ", prompt, re.MULTILINE)
+            return "```json\n" + json.dumps([{"id": int(i), "score": 1.0} for i in ids]) + "\n```"
+        return super().generate_response(prompt)
+
+
+@override_settings(TUTOR_GRADING={'ENABLED': True, 'WEIGHT': 0.3})
+@use_fake_llm_client(FakeGradingClient, "tutor.services", "tutor.grading")
+class GradingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        FakeGradingClient.grading_prompts = []
+        self.learners = [
+            LearnerProfile.objects.get(user=User.objects.create_user(name)) for name in ("alice", "bob", "carol")
+        ]
+
+    def test_mastery_comes_from_the_grade(self):
+        service = TutorService(self.learners[0])
+        service.handle_interaction("Bonjour")
+        response = service.handle_interaction("x vaut 5")
+
+        # Pas d'augmentation fixe : le score vient de la note, donnée après coup
+        self.assertEqual(response["mastery_score"], 0.0)
+        opener, answer = InteractionLog.objects.filter(learner=self.learners[0]).order_by('id')
+        self.assertIsNone(opener.score) # ouverture de leçon : rien à noter
+        self.assertEqual(answer.score, 1.0)
+        self.assertAlmostEqual(LearnerProgress.objects.get(learner=self.learners[0]).mastery_score, 0.3)
+
+    def test_learner_message_reaches_tutor_while_score_is_zero(self):
+        service = TutorService(self.learners[0])
+        service.handle_interaction("Bonjour")
+        LearnerProgress.objects.filter(learner=self.learners[0]).update(mastery_score=0.0) # réponse notée 0
+
+        service.handle_interaction("x vaut 5")
+        self.assertIn("x vaut 5", FakeGradingClient.prompts[-1])
+
+    def test_answers_of_a_concept_are_graded_in_one_request(self):
+        concept = Concept.objects.first()
+        InteractionLog.objects.bulk_create([
+            InteractionLog(learner=learner, concept=concept, user_message=message, tutor_response=response)
+            for learner in self.learners
+            for message, response in [("Bonjour", "Que vaut x ?"), ("5", "Bravo ! Et y ?")]
+        ])
+        for learner in self.learners:
+            LearnerProgress.objects.create(learner=learner, concept=concept)
+
+        self.assertEqual(grade_concept(concept.id), 3)
+        self.assertEqual(len(FakeGradingClient.grading_prompts), 1)
+        self.assertEqual(InteractionLog.objects.filter(score__isnull=True).count(), 3) # les ouvertures
+
+    def test_answer_is_paired_with_the_question_it_answers(self):
+        concept = Concept.objects.first()
+        learner = self.learners[0]
+        InteractionLog.objects.bulk_create([
+            InteractionLog(learner=learner, concept=concept, user_message="Bonjour", tutor_response="Que vaut x ?"),
+            InteractionLog(learner=learner, concept=concept, user_message="x vaut 5", tutor_response="Bravo !"),
+        ])
+        LearnerProgress.objects.create(learner=learner, concept=concept)
+
+        grade_concept(concept.id)
+        answers = re.findall(r"^- id \d+ .*$", FakeGradingClient.grading_prompts[0], re.MULTILINE)
+        self.assertEqual(answers, [
+            f'- id {InteractionLog.objects.get(user_message="x vaut 5").id} '
+            '| Question du tuteur : "Que vaut x ?" | Apprenant : "x vaut 5"'
+        ])
+
+    def test_grades_are_validated(self):
+        grades = parse_grades('Voici : [{"id": 1, "score": 1.4}, {"id": 9, "score": 0.5}]', {1, 2})
+        self.assertEqual(grades, {1: 1.0})
+
+
+class FakeSummaryClient(FakeLLMClient):
+    """
+    Répond comme FakeLLMClient au tuteur, et résume chaque conversation par « Résumé <id> ».
+    """
+    summary_prompts = []
+
+    def generate_response(self, prompt):
+        if prompt.startswith("Tu résumes"):
+            self.summary_prompts.append(prompt)
+            ids = re.findall(r"^\*\*CONVERSATION (\d+)\*\*", prompt, re.MULTILINE)
+            return json.dumps([{"id": int(i), "summary": f"Résumé {i}"} for i in ids])
+        return super().generate_response(prompt)
+
+
+@override_settings(TUTOR_SUMMARY={'ENABLED': True, 'FOLD_EVERY': 3})
+@use_fake_llm_client(FakeSummaryClient, "tutor.services", "tutor.summaries")
+class ConversationSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_response_cache().clear()
+        FakeSummaryClient.prompts = []
+        FakeSummaryClient.summary_prompts = []
+        self.learners = [LearnerProfile.objects.get(user=User.objects.create_user(name)) for name in ("alice", "bob")]
+
+    def test_old_turns_are_folded_into_the_prompt_summary(self):
+        service = TutorService(self.learners[0])
+        for turn in range(6):
+            service.handle_interaction(f"message {turn}")
+
+        # 6 échanges : les 3 plus anciens sortent de la fenêtre et sont résumés
+        progress = LearnerProgress.objects.get(learner=self.learners[0])
+        logs = list(InteractionLog.objects.filter(learner=self.learners[0]).order_by('id'))
+        self.assertEqual(progress.summary, f"Résumé {progress.id}")
+        self.assertEqual(progress.summarized_log_id, logs[2].id)
+        self.assertEqual(len(FakeSummaryClient.summary_prompts), 1)
+        self.assertIn("Apprenant : message 2", FakeSummaryClient.summary_prompts[0])
+        self.assertNotIn("Apprenant : message 3", FakeSummaryClient.summary_prompts[0])
+
+        service.handle_interaction("message 6")
+        prompt = next(prompt for prompt in FakeSummaryClient.prompts if '"message 6"' in prompt)
+        self.assertIn(f"Résumé des échanges précédents : Résumé {progress.id}", prompt)
+        self.assertIn("Apprenant : message 5", prompt)
+        self.assertNotIn("Apprenant : message 2", prompt)
+
+    def test_conversations_of_several_learners_are_summarized_together(self):
+        concept = Concept.objects.first()
+        for learner in self.learners:
+            LearnerProgress.objects.create(learner=learner, concept=concept)
+            InteractionLog.objects.bulk_create([
+                InteractionLog(learner=learner, concept=concept, user_message=f"m{i}", tutor_response="?")
+                for i in range(7)
+            ])
+
+        pairs = [(learner.id, concept.id) for learner in self.learners]
+        self.assertEqual(summarize_conversations(pairs, window=3), 2)
+        self.assertEqual(len(FakeSummaryClient.summary_prompts), 1)
+        # Rien de nouveau à résumer : pas d'appel au LLM
+        self.assertEqual(summarize_conversations(pairs, window=3), 0)
+        self.assertEqual(len(FakeSummaryClient.summary_prompts), 1)
+
+    def test_summary_counts_toward_the_token_budget(self):
+        concept = Concept.objects.first()
+        history = [{"user": "mot " * 200, "tutor": "réponse " * 200}] * 3
+        options = {'TOKEN_BUDGET': 600, 'TURN_MAX_TOKENS': 80}
+        prompt = build_prompt(concept, "alice", 0.5, history, "Et ensuite ?", options, summary="résumé " * 60)
+        self.assertIn("Résumé des échanges précédents : résumé", prompt.text)
+        self.assertLessEqual(prompt.tokens, 600)
+
+
+@unittest.skipIf(np is None, "NumPy n'est pas installé.")
+@use_fake_llm_client()
+class RetrievalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.options = {'INDEX_DIR': directory.name, 'DIMENSIONS': 256, 'MIN_SCORE': 0.35, 'MARGIN': 0.1, 'APPROXIMATE_FROM': 5000, 'PROBES': 8}
+        settings_override = override_settings(TUTOR_RETRIEVAL=self.options)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        invalidate_concept_index()
+        self.addCleanup(invalidate_concept_index)
+        ConceptIndex.build(Concept.objects.values_list('id', 'name', 'explanation'), self.options).save(directory.name)
+        self.subtraction = Concept.objects.get(name__contains="soustraction")
+
+    def test_message_is_routed_to_its_concept(self):
+        self.assertEqual(route_message("Je veux apprendre la soustraction"), self.subtraction.id)
+        self.assertIsNone(route_message("x vaut 5"))
+        # Une réponse qui cite un autre concept n'est pas une demande
+        self.assertIsNone(route_message("je pense que c'est un nombre entier"))
+
+    def test_answer_on_topic_does_not_move_the_cursor(self):
+        learner = LearnerProfile.objects.get(user=User.objects.create_user("alice"))
+        service = TutorService(learner)
+        first = service._determine_next_concept()
+
+        response = service.handle_interaction("une chaîne de caractères")
+        self.assertEqual(response["current_concept_name"], first.name)
+        self.assertEqual(get_cursor(learner.id), first.id)
+
+    def test_mastered_concept_is_not_reopened(self):
+        learner = LearnerProfile.objects.get(user=User.objects.create_user("alice"))
+        LearnerProgress.objects.create(learner=learner, concept=self.subtraction, mastery_score=1.0)
+        response = TutorService(learner).handle_interaction("Je veux apprendre la soustraction")
+        self.assertNotEqual(response["current_concept_name"], self.subtraction.name)
+
+    def test_learner_jumps_to_the_concept_they_ask_about(self):
+        learner = LearnerProfile.objects.get(user=User.objects.create_user("alice"))
+        response = TutorService(learner).handle_interaction("Je veux apprendre la soustraction")
+
+        self.assertEqual(response["current_concept_name"], self.subtraction.name)
+        self.assertEqual(get_cursor(learner.id), self.subtraction.id)
+
+    def test_index_is_refreshed_incrementally(self):
+        self.assertEqual(get_concept_index().embedded, 0) # lu sur disque, rien à recalculer
+        self.assertIsInstance(get_concept_index().vectors, np.memmap)
+
+        self.subtraction.explanation = "Retirer une quantité à une autre avec le signe moins."
+        self.subtraction.save()
+        index = get_concept_index()
+        self.assertEqual(index.embedded, 1)
+        self.assertEqual(index.search("retirer une quantité")[0][0], self.subtraction.id)
+
+    def test_message_without_request_does_not_load_the_index(self):
+        with mock.patch("tutor.retrieval.get_concept_index") as get_index:
+            self.assertIsNone(route_message("x vaut 5"))
+        get_index.assert_not_called()
+
+    def test_successive_refreshes_start_from_the_index_in_memory(self):
+        get_concept_index() # lu sur disque
+        for explanation in ("Retirer une quantité à une autre.", "Retirer une quantité avec le signe moins."):
+            self.subtraction.explanation = explanation
+            self.subtraction.save()
+            with mock.patch.object(ConceptIndex, "load", wraps=ConceptIndex.load) as load:
+                self.assertEqual(refresh_concept_index().embedded, 1)
+            load.assert_not_called()
+
+    def test_stale_index_is_served_while_refresh_runs_in_background(self):
+        index = get_concept_index()
+        with mock.patch("tutor.tasks.schedule_index_refresh") as schedule:
+            self.subtraction.explanation = "Retirer une quantité à une autre avec le signe moins."
+            self.subtraction.save()
+            # Rien n'est recalculé pendant la requête : l'ancien index reste servi
+            self.assertIs(get_concept_index(), index)
+            self.assertIs(get_concept_index(), index)
+        schedule.assert_called_once()
+
+        self.assertEqual(refresh_concept_index().embedded, 1)
+        self.assertIsNot(get_concept_index(), index)
+
+    def test_saving_keeps_vectors_that_readers_may_still_open(self):
+        directory = self.options['INDEX_DIR']
+        first = ConceptIndex.load(directory)
+        ConceptIndex.build(Concept.objects.values_list('id', 'name', 'explanation'), self.options).save(directory)
+
+        # Un lecteur qui a lu les anciennes métadonnées trouve encore ses vecteurs
+        self.assertEqual(len(list(Path(directory).glob("vectors-*.npy"))), 2)
+        self.assertTrue(Path(first.vectors.filename).exists())
+
+    def test_approximate_search_matches_exhaustive_search(self):
+        rows = [(i, f"Notion {i}", f"mot{i % 37} mot{i % 53} thème{i % 11}") for i in range(400)]
+        exhaustive = ConceptIndex.build(rows, self.options)
+        approximate = ConceptIndex.build(rows, {**self.options, 'APPROXIMATE_FROM': 100})
+        self.assertTrue(approximate.approximate)
+
+        for text in ("Notion 12 mot12", "mot7 mot40 thème3", "Notion 399"):
+            self.assertEqual(approximate.search(text, probes=20)[0][0], exhaustive.search(text)[0][0])
+
+    def test_empty_probed_clusters_fall_back_to_exhaustive_search(self):
+        rows = [(i, f"Notion {i}", f"mot{i % 37} mot{i % 53} thème{i % 11}") for i in range(400)]
+        index = ConceptIndex.build(rows, {**self.options, 'APPROXIMATE_FROM': 100})
+        # Toutes les grappes vides sauf la dernière, la plus éloignée de la requête
+        query = embed("Notion 12 mot12", index.dimensions)
+        farthest = int(np.argmin(index.centroids @ query))
+        index.centroids = np.array(index.centroids)
+        index.centroids[[farthest, -1]] = index.centroids[[-1, farthest]]
+        index.offsets = np.array([0] * len(index.centroids) + [len(index)])
+
+        self.assertEqual(index._search(query, probes=1)[0][0], 12)
@@ -1,3 +1,16 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from .instrumentation import metrics
+
+@require_GET
+def metrics_view(request):
+    """
+    Mesures du processus au format texte Prometheus.
+    Réservé aux adresses listées dans TUTOR_METRICS_ALLOWED_IPS.
+    """
+    allowed_ips = getattr(settings, 'TUTOR_METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if request.META.get('REMOTE_ADDR') not in allowed_ips:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")